@@ -0,0 +1,44 @@
+"""add document revisions
+
+Revision ID: 2c7e5a9f8b14
+Revises: e4a8c3d1b659
+Create Date: 2026-10-19 16:12:09.384517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c7e5a9f8b14'
+down_revision: Union[str, Sequence[str], None] = 'e4a8c3d1b659'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing documents get a snapshot on their next write
+    op.create_table('document_revisions',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('base_revision', sa.Integer(), nullable=True),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('document_id', 'revision', name='unique_document_revision')
+    )
+    op.create_index(op.f('ix_document_revisions_id'), 'document_revisions', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_document_revisions_id'), table_name='document_revisions')
+    op.drop_table('document_revisions')
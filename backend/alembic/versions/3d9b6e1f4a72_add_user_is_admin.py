@@ -0,0 +1,28 @@
+"""add user is_admin
+
+Revision ID: 3d9b6e1f4a72
+Revises: 8f3b7d2a6c15
+Create Date: 2026-10-19 21:05:12.408316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9b6e1f4a72'
+down_revision: Union[str, Sequence[str], None] = '8f3b7d2a6c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('is_admin', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'is_admin')
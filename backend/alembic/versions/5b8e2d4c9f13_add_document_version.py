@@ -0,0 +1,28 @@
+"""add document version
+
+Revision ID: 5b8e2d4c9f13
+Revises: a3c91f5e7d20
+Create Date: 2026-10-19 10:03:17.842290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2d4c9f13'
+down_revision: Union[str, Sequence[str], None] = 'a3c91f5e7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'version')
@@ -0,0 +1,51 @@
+"""add change seq and tombstones
+
+Revision ID: 6a1d4c8e2b93
+Revises: 2c7e5a9f8b14
+Create Date: 2026-10-19 18:03:27.519204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a1d4c8e2b93'
+down_revision: Union[str, Sequence[str], None] = '2c7e5a9f8b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows start at 0, so they are only returned to clients without a cursor
+    op.add_column('documents', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_documents_change_seq'), 'documents', ['change_seq'], unique=False)
+    op.add_column('document_collaborators', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index('ix_document_collaborators_user_change_seq', 'document_collaborators', ['user_id', 'change_seq'], unique=False)
+    op.create_table('document_tombstones',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=10), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'document_id', name='unique_tombstone_user_document')
+    )
+    op.create_index(op.f('ix_document_tombstones_id'), 'document_tombstones', ['id'], unique=False)
+    op.create_index('ix_document_tombstones_user_change_seq', 'document_tombstones', ['user_id', 'change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_document_tombstones_user_change_seq', table_name='document_tombstones')
+    op.drop_index(op.f('ix_document_tombstones_id'), table_name='document_tombstones')
+    op.drop_table('document_tombstones')
+    op.drop_index('ix_document_collaborators_user_change_seq', table_name='document_collaborators')
+    op.drop_column('document_collaborators', 'change_seq')
+    op.drop_index(op.f('ix_documents_change_seq'), table_name='documents')
+    op.drop_column('documents', 'change_seq')
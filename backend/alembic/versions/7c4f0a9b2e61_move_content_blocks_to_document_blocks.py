@@ -0,0 +1,114 @@
+"""move content_blocks to document_blocks
+
+Revision ID: 7c4f0a9b2e61
+Revises: 5b8e2d4c9f13
+Create Date: 2026-10-19 11:26:05.117384
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4f0a9b2e61'
+down_revision: Union[str, Sequence[str], None] = '5b8e2d4c9f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the key scheme in app/services/block_store.py
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+documents = sa.table(
+    'documents',
+    sa.column('id', sa.Integer),
+    sa.column('content_blocks', sa.JSON),
+)
+document_blocks = sa.table(
+    'document_blocks',
+    sa.column('document_id', sa.Integer),
+    sa.column('block_id', sa.String),
+    sa.column('position', sa.String),
+    sa.column('data', sa.JSON),
+)
+
+
+def evenly_spaced_keys(count):
+    base = len(DIGITS)
+    width = 1
+    while base ** width <= count + 1:
+        width += 1
+    keys = []
+    for index in range(1, count + 1):
+        value = index * base ** width // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, remainder = divmod(value, base)
+            digits.append(DIGITS[remainder])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_blocks',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('block_id', sa.String(length=64), nullable=False),
+    sa.Column('position', sa.String(length=64).with_variant(sa.String(length=64, collation='C'), 'postgresql'), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('document_id', 'block_id', name='unique_document_block')
+    )
+    op.create_index(op.f('ix_document_blocks_id'), 'document_blocks', ['id'], unique=False)
+    op.create_index('ix_document_blocks_document_position', 'document_blocks', ['document_id', 'position'], unique=False)
+
+    # Move every existing block into its own row, keeping client ids when usable
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(documents.c.id, documents.c.content_blocks).where(documents.c.content_blocks.isnot(None))
+    )
+    for document_id, content_blocks in rows:
+        if not isinstance(content_blocks, list) or not content_blocks:
+            continue
+
+        seen = set()
+        values = []
+        for block, position in zip(content_blocks, evenly_spaced_keys(len(content_blocks))):
+            data = dict(block) if isinstance(block, dict) else {"text": str(block)}
+            block_id = data.pop("id", None)
+            block_id = str(block_id) if block_id not in (None, "") else None
+            if block_id is None or block_id in seen or len(block_id) > 64:
+                block_id = uuid.uuid4().hex
+            seen.add(block_id)
+            values.append({"document_id": document_id, "block_id": block_id, "position": position, "data": data})
+        connection.execute(document_blocks.insert(), values)
+
+    op.drop_column('documents', 'content_blocks')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('documents', sa.Column('content_blocks', sa.JSON(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(document_blocks.c.document_id, document_blocks.c.block_id, document_blocks.c.data)
+        .order_by(document_blocks.c.document_id, document_blocks.c.position)
+    )
+    collected = {}
+    for document_id, block_id, data in rows:
+        collected.setdefault(document_id, []).append({"id": block_id, **data})
+    for document_id, content_blocks in collected.items():
+        connection.execute(
+            documents.update().where(documents.c.id == document_id).values(content_blocks=content_blocks)
+        )
+
+    op.drop_index('ix_document_blocks_document_position', table_name='document_blocks')
+    op.drop_index(op.f('ix_document_blocks_id'), table_name='document_blocks')
+    op.drop_table('document_blocks')
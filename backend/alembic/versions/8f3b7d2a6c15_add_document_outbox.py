@@ -0,0 +1,46 @@
+"""add document outbox
+
+Revision ID: 8f3b7d2a6c15
+Revises: 6a1d4c8e2b93
+Create Date: 2026-10-19 19:26:44.731085
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b7d2a6c15'
+down_revision: Union[str, Sequence[str], None] = '6a1d4c8e2b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_outbox',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('txid', sa.BigInteger(), nullable=False),
+    sa.Column('event_type', sa.String(length=20), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_document_outbox_txid_id', 'document_outbox', ['txid', 'id'], unique=False)
+    op.create_table('outbox_checkpoints',
+    sa.Column('consumer', sa.String(length=64), nullable=False),
+    sa.Column('txid', sa.BigInteger(), nullable=False),
+    sa.Column('event_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('consumer')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('outbox_checkpoints')
+    op.drop_index('ix_document_outbox_txid_id', table_name='document_outbox')
+    op.drop_table('document_outbox')
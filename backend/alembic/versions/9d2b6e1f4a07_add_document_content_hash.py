@@ -0,0 +1,29 @@
+"""add document content hash
+
+Revision ID: 9d2b6e1f4a07
+Revises: 7c4f0a9b2e61
+Create Date: 2026-10-19 14:21:48.116305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2b6e1f4a07'
+down_revision: Union[str, Sequence[str], None] = '7c4f0a9b2e61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows start without a fingerprint; their next write fills it in
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=96), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'content_hash')
@@ -0,0 +1,42 @@
+"""add title trigram index
+
+Revision ID: a3c91f5e7d20
+Revises: d9e6994e8974
+Create Date: 2026-10-19 09:12:41.503126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c91f5e7d20'
+down_revision: Union[str, Sequence[str], None] = 'd9e6994e8974'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_document_collaborators_user_document', 'document_collaborators', ['user_id', 'document_id'], unique=False)
+
+    # Trigram index backing typeahead prefix (ILIKE) and fuzzy (%) title matching
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'ix_documents_title_trgm',
+            'documents',
+            ['title'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_documents_title_trgm', table_name='documents')
+    op.drop_index('ix_document_collaborators_user_document', table_name='document_collaborators')
@@ -0,0 +1,71 @@
+"""compress document bodies
+
+Revision ID: e4a8c3d1b659
+Revises: 9d2b6e1f4a07
+Create Date: 2026-10-19 15:02:37.509114
+
+"""
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a8c3d1b659'
+down_revision: Union[str, Sequence[str], None] = '9d2b6e1f4a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Existing values are converted to plain UTF-8 bytes, which the compressed
+# column types read as-is; run scripts/backfill_compression.py afterwards
+# to compress the large ones.
+COLUMNS = (
+    ('documents', 'content', sa.Text(), "convert_to(content, 'UTF8')", "convert_from(content, 'UTF8')"),
+    ('document_blocks', 'data', sa.JSON(), "convert_to(data::text, 'UTF8')", "convert_from(data, 'UTF8')::json"),
+)
+
+
+def _decompress(data: bytes) -> bytes:
+    # Frozen copy of the header scheme in app/models/types.py
+    data = bytes(data)
+    if data[:2] == b"\x00z":
+        return zlib.decompress(data[2:])
+    if data[:2] == b"\x00s":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data[2:])
+    return data
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table, column, old_type, to_bytes, _ in COLUMNS:
+        if is_postgresql:
+            op.alter_column(table, column, type_=sa.LargeBinary(), existing_type=old_type, postgresql_using=to_bytes)
+        else:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.alter_column(column, type_=sa.LargeBinary(), existing_type=old_type)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    is_postgresql = connection.dialect.name == 'postgresql'
+    for table, column, old_type, _, from_bytes in COLUMNS:
+        # Text and JSON cannot hold compressed payloads; inflate them first
+        target = sa.table(table, sa.column('id', sa.Integer), sa.column(column, sa.LargeBinary))
+        rows = connection.execute(
+            sa.select(target.c.id, target.c[column]).where(sa.func.substr(target.c[column], 1, 1) == b"\x00")
+        ).all()
+        for row_id, value in rows:
+            connection.execute(
+                target.update().where(target.c.id == row_id).values({column: _decompress(value)})
+            )
+
+        if is_postgresql:
+            op.alter_column(table, column, type_=old_type, existing_type=sa.LargeBinary(), postgresql_using=from_bytes)
+        else:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.alter_column(column, type_=old_type, existing_type=sa.LargeBinary())
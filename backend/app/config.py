@@ -7,6 +7,67 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int
     refresh_token_expire_days: int = 7  # Add this
     reset_token_expire_minutes: int = 30  # Add this
+    typeahead_cache_ttl_seconds: int = 30
+    typeahead_cache_max_entries: int = 10000
+    typeahead_slo_ms: float = 50.0  # p95 target checked by scripts/bench_typeahead.py
+    autosave_flush_interval_seconds: float = 5.0  # Max time an acknowledged autosave stays in memory
+    autosave_idle_seconds: float = 1.0  # Flush early once a document stops receiving autosaves
+    autosave_max_documents: int = 10000  # Beyond this, autosaves are written through synchronously
+    autosave_max_flush_attempts: int = 5  # Failed flushes are retried with a backoff, then dropped
+    compression_threshold_bytes: int = 4096  # Document bodies smaller than this are stored uncompressed
+    compression_algorithm: str = "zlib"  # zlib or zstd (needs the zstandard package)
+    compression_level: int = 1  # Favors write latency; see scripts/bench_compression.py
+    revision_snapshot_interval: int = 20  # Full snapshot every N revisions bounds rebuild cost
+    revision_compaction_age_days: int = 30  # Revisions older than this are thinned by scripts/compact_revisions.py
+    revision_compaction_bucket_minutes: int = 60  # Keep one old revision per bucket
+    collab_history_size: int = 1000  # Relayed operations kept per room for reconnect catch-up
+    collab_heartbeat_seconds: float = 20.0  # Server pings a silent socket this often
+    collab_idle_timeout_seconds: float = 60.0  # Close sockets that have sent nothing for this long
+    collab_auth_timeout_seconds: float = 10.0  # Time allowed for the join message
+    collab_max_message_bytes: int = 65536
+    collab_persist_interval_seconds: float = 2.0  # Live room state is written back to content_blocks this often
+    collab_presence_interval_seconds: float = 0.1  # Cursor updates are coalesced and fanned out at most this often per room
+    collab_presence_ttl_seconds: float = 30.0  # Presence not refreshed for this long is dropped
+    collab_send_queue_size: int = 256  # Messages queued per socket before the slow consumer policy applies
+    collab_send_batch_size: int = 64  # Max messages per frame when a socket's queue is backed up
+    collab_slow_consumer_policy: str = "resync"  # resync (drop queued messages, send state) or disconnect
+    collab_backplane: str = "memory"  # memory (single worker) or postgres (LISTEN/NOTIFY on database_url)
+    collab_backplane_flush_seconds: float = 0.01  # Events published within this window share a round trip
+    collab_backplane_max_batch: int = 100  # Flush early once this many events are queued
+    collab_backplane_payload_bytes: int = 7900  # Postgres rejects NOTIFY payloads over 8000 bytes
+    collab_backplane_handoff_seconds: float = 0.25  # How long a new room waits for another worker's replica
+    change_feed_buffer_size: int = 10000  # Recent change events kept per worker for Last-Event-ID resume
+    change_feed_heartbeat_seconds: float = 15.0  # Idle change streams get a comment this often
+    change_feed_resume_seconds: float = 300.0  # Events are recorded this long after the last stream closes
+    outbox_poll_interval_seconds: float = 0.5  # Outbox consumers also wake as soon as this worker commits events
+    outbox_retention_hours: float = 72.0  # scripts/outbox.py prune keeps events this long
+    metrics_token: str = ""  # When set, /metrics requires "Authorization: Bearer <token>"
+    server_timing_header: bool = False  # Report each request's query count and database time in a Server-Timing header
+    repeated_query_threshold: int = 10  # Log a warning when one request runs the same statement this many times
+    profile_dir: str = "profiles"  # Request profiles taken with the X-Profile header are stored here
+    profile_sample_interval_ms: float = 2.0
+    profile_keep: int = 50  # Older profiles are deleted as new ones are written
+    slow_query_ms: float = 500.0  # Statements at least this slow are logged with their plan; 0 disables
+    slow_query_explain: bool = True  # Capture plans of slow SELECTs (EXPLAIN ANALYZE on PostgreSQL)
+    slow_query_explain_timeout_ms: float = 10000.0
+    slow_query_explains_per_minute: int = 6  # Per worker, so plan capture cannot add much load
+    slow_query_explain_interval_seconds: float = 600.0  # The same statement is explained at most this often
+    slow_query_explain_queue: int = 20  # Slow queries waiting for plan capture; more are dropped
+    slow_query_log_size: int = 100  # Recent slow queries listed at /admin/slow-queries
+    memory_snapshot_dir: str = "memory_snapshots"  # tracemalloc snapshots taken from /admin/memory/snapshots
+    memory_snapshot_keep: int = 20
+    memory_route_window_seconds: float = 900.0  # Per-route allocation peaks are reported over this window
+    memory_route_max_samples: int = 1000  # Requests kept per route within the window
+    export_preload: bool = False  # Import the PDF/DOCX exporters at startup instead of on the first export
+    server_host: str = "127.0.0.1"
+    server_port: int = 8000
+    server_workers: int = 0  # 0: one per available CPU (1 with the memory backplane)
+    server_threadpool_size: int = 0  # Threads per worker for sync routes; 0: db_pool_size + db_max_overflow
+    server_keepalive_seconds: int = 5  # Keep above the load balancer's idle timeout when behind one
+    db_pool_size: int = 5  # Connections kept open per worker
+    db_max_overflow: int = 10  # Extra connections per worker under load
+    db_pool_timeout_seconds: float = 30.0  # How long a request waits for a connection
+    db_max_connections: int = 100  # Connections the database allows this app; the capacity plan stays under it
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,125 @@
+"""
+Capacity plan for a deployment: workers, threads and database connections.
+
+Derived from the CPUs available to the process and the server_* and db_*
+settings, where 0 means "derive it":
+
+- workers: one per available CPU (scheduler affinity and the cgroup CPU
+  quota both count), but a single worker while collab_backplane is
+  "memory", since collaboration rooms then live in one process
+- threadpool_size: sync routes and dependencies run in AnyIO's
+  threadpool and nearly all of them hold a database connection, so each
+  worker gets as many threads as its pool can hand out connections
+  (db_pool_size + db_max_overflow); more threads would only queue for a
+  connection while holding memory
+- database connections: every worker opens up to db_pool_size +
+  db_max_overflow, plus two backplane connections with the postgres
+  backplane; the total is checked against db_max_connections
+
+app/server.py prints the plan at startup and hands the resolved values to
+its workers through the environment; app/main.py applies the threadpool
+size in each worker.
+"""
+import math
+import os
+from typing import List, Optional
+
+from app.config import settings
+
+
+def available_cpus() -> int:
+    """CPUs this process may use, honouring affinity and a cgroup quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(math.ceil(quota), 1))
+    return cpus
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+class CapacityPlan:
+    def __init__(self, cpus: int, workers: int, threadpool_size: int, pool_size: int, max_overflow: int):
+        self.cpus = cpus
+        self.workers = workers
+        self.threadpool_size = threadpool_size
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.backplane_connections = 2 if settings.collab_backplane == "postgres" else 0
+        self.keepalive_seconds = settings.server_keepalive_seconds
+
+    @property
+    def connections_per_worker(self) -> int:
+        return self.pool_size + self.max_overflow + self.backplane_connections
+
+    @property
+    def total_connections(self) -> int:
+        return self.workers * self.connections_per_worker
+
+    def warnings(self) -> List[str]:
+        warnings = []
+        if self.total_connections > settings.db_max_connections:
+            warnings.append(
+                f"up to {self.total_connections} database connections, over db_max_connections="
+                f"{settings.db_max_connections}; lower workers or db_pool_size/db_max_overflow"
+            )
+        if self.threadpool_size > self.pool_size + self.max_overflow:
+            warnings.append(
+                f"{self.threadpool_size} threads per worker share {self.pool_size + self.max_overflow} connections; "
+                "threads beyond that wait for a connection"
+            )
+        if self.workers > self.cpus:
+            warnings.append(f"{self.workers} workers on {self.cpus} CPUs")
+        return warnings
+
+    def describe(self) -> str:
+        lines = [
+            f"Capacity plan ({self.cpus} CPUs available):",
+            f"  workers                 {self.workers}",
+            f"  threads per worker      {self.threadpool_size} (sync routes and dependencies)",
+            f"  db pool per worker      {self.pool_size} + {self.max_overflow} overflow"
+            + (f" + {self.backplane_connections} backplane" if self.backplane_connections else ""),
+            f"  db connections, total   up to {self.total_connections} of {settings.db_max_connections}",
+            f"  concurrent sync calls   {self.workers * self.threadpool_size}",
+            f"  keep-alive              {self.keepalive_seconds}s",
+        ]
+        lines.extend(f"  warning: {warning}" for warning in self.warnings())
+        return "\n".join(lines)
+
+
+def threadpool_size() -> int:
+    """Threads per worker for sync routes and dependencies"""
+    return settings.server_threadpool_size or settings.db_pool_size + settings.db_max_overflow
+
+
+def plan_capacity(cpus: Optional[int] = None) -> CapacityPlan:
+    """Resolve the settings into a plan; raises ValueError for unworkable combinations"""
+    cpus = cpus or available_cpus()
+    workers = settings.server_workers
+    if settings.collab_backplane == "memory":
+        if workers > 1:
+            raise ValueError("collab_backplane=memory keeps rooms in one process; use 1 worker or the postgres backplane")
+        workers = 1
+    elif workers <= 0:
+        workers = cpus
+    return CapacityPlan(cpus, workers, threadpool_size(), settings.db_pool_size, settings.db_max_overflow)
@@ -0,0 +1,73 @@
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+
+def document_etag(document_id: int, version: int, buffered_sequence: Optional[int] = None) -> str:
+    """
+    Strong ETag for a single document representation.
+
+    Representations that include unflushed autosaves carry the buffer
+    sequence as well; parse_if_match never accepts those tags.
+    """
+    if buffered_sequence is not None:
+        return f'"{document_id}-{version}.{buffered_sequence}"'
+    return f'"{document_id}-{version}"'
+
+
+def list_etag(rows: Iterable[Tuple[int, int]]) -> str:
+    """
+    Weak ETag for a page of documents, built from (id, version) pairs.
+
+    Weak because the body is only semantically equivalent: membership,
+    order and per-document versions are covered, serialization details are not.
+    """
+    digest = hashlib.sha1()
+    for document_id, version in rows:
+        digest.update(f"{document_id}:{version};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an If-None-Match header against the current ETag.
+
+    Uses weak comparison as required for If-None-Match (RFC 9110 13.1.2).
+    """
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    current = _opaque_tag(etag)
+    return any(
+        _opaque_tag(candidate.strip()) == current
+        for candidate in if_none_match.split(",")
+    )
+
+
+def parse_if_match(if_match: Optional[str], document_id: int) -> Optional[List[int]]:
+    """
+    Extract the document versions an If-Match header allows.
+
+    Returns None when there is no precondition (header absent or "*").
+    Uses strong comparison, so weak tags and tags for other documents are
+    dropped; an empty list therefore means the precondition cannot hold.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+
+    versions = []
+    prefix = f'"{document_id}-'
+    for candidate in if_match.split(","):
+        candidate = candidate.strip()
+        if not (candidate.startswith(prefix) and candidate.endswith('"')):
+            continue
+        version = candidate[len(prefix):-1]
+        if version.isdigit():
+            versions.append(int(version))
+    return versions
@@ -0,0 +1,310 @@
+"""
+Memory instrumentation for this worker process.
+
+Always available, at no per-request cost:
+
+- process_memory(): resident set size now (from /proc, Linux only) and
+  at its peak (getrusage); the current size is also exported as
+  process_resident_memory_bytes at /metrics
+- gc_stats(): collections, collected and uncollectable objects per
+  generation, plus the time spent in collections (gc_pause_seconds,
+  measured with gc.callbacks)
+
+On demand, while tracemalloc is tracing (started from /admin/memory/tracing):
+
+- snapshots are written to settings.memory_snapshot_dir in tracemalloc's
+  own format, so they can be downloaded and loaded with
+  tracemalloc.Snapshot.load(), and compared with each other on the server
+- MemoryTrackingMiddleware charges each request the peak traced
+  allocation above what was allocated when it started, and keeps these
+  per route template for settings.memory_route_window_seconds. The peak
+  is process-wide, so a request that overlaps others is charged the
+  largest allocation among them: an upper bound, exact when requests
+  do not overlap.
+
+Every worker answers for itself; with several workers, each request to
+the admin endpoints reaches one of them (the pid is in every response).
+"""
+import gc
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.core import metrics
+from app.core.request_metrics import route_template
+
+SNAPSHOT_SUFFIX = ".tracemalloc"
+
+resident_memory = metrics.gauge("process_resident_memory_bytes", "Resident set size of this worker")
+gc_pauses = metrics.histogram(
+    "gc_pause_seconds",
+    "Time spent in garbage collections, by generation",
+    ["generation"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
+
+
+# -- Process and GC --------------------------------------------------------------
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_memory() -> dict:
+    """Resident memory of this worker now and at its peak, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": _rss_bytes(),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        "peak_rss_bytes": peak if sys.platform == "darwin" else peak * 1024
+    }
+
+
+def update_process_metrics() -> None:
+    """Refresh process gauges before a scrape"""
+    rss = _rss_bytes()
+    if rss is not None:
+        resident_memory.set(rss)
+    _record_gc_pauses()
+
+
+_gc_started: Dict[int, float] = {}
+# A collection can start while any lock is held, including a metric's own,
+# so the callback only appends here and pauses reach the histogram at
+# scrape time. Bounded in case nothing ever scrapes.
+_gc_pending: deque = deque(maxlen=10000)
+
+
+def _time_collection(phase: str, info: dict) -> None:
+    if phase == "start":
+        _gc_started[threading.get_ident()] = time.perf_counter()
+        return
+    started = _gc_started.pop(threading.get_ident(), None)
+    if started is not None:
+        _gc_pending.append((str(info["generation"]), time.perf_counter() - started))
+
+
+def _record_gc_pauses() -> None:
+    # Only what is pending now: recording allocates, which can queue more
+    for _ in range(len(_gc_pending)):
+        try:
+            generation, duration = _gc_pending.popleft()
+        except IndexError:
+            break
+        gc_pauses.observe(duration, generation=generation)
+
+
+gc.callbacks.append(_time_collection)
+
+
+def gc_stats() -> dict:
+    _record_gc_pauses()
+    return {
+        "enabled": gc.isenabled(),
+        "thresholds": list(gc.get_threshold()),
+        "counts": list(gc.get_count()),
+        "generations": [
+            {"generation": generation, **stats}
+            for generation, stats in enumerate(gc.get_stats())
+        ],
+        "pause_seconds": {
+            key[0]: {"collections": int(sum(state[:-1])), "total": round(state[-1], 6)}
+            for key, state in gc_pauses.samples()
+        }
+    }
+
+
+# -- Tracing and snapshots -------------------------------------------------------
+
+def start_tracing(frames: int) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+    """Stop tracing; route peaks are kept until they leave the window"""
+    tracemalloc.stop()
+
+
+def tracing_status() -> dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else None,
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0
+    }
+
+
+def take_snapshot() -> str:
+    """Write a snapshot of traced allocations; returns its name"""
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not tracing; start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    os.makedirs(settings.memory_snapshot_dir, exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}"
+    snapshot.dump(os.path.join(settings.memory_snapshot_dir, name + SNAPSHOT_SUFFIX))
+    _prune_snapshots()
+    return name
+
+
+def list_snapshots() -> List[dict]:
+    """Stored snapshots, newest first"""
+    if not os.path.isdir(settings.memory_snapshot_dir):
+        return []
+    snapshots = []
+    for entry in os.scandir(settings.memory_snapshot_dir):
+        if entry.is_file() and entry.name.endswith(SNAPSHOT_SUFFIX):
+            stat = entry.stat()
+            snapshots.append({
+                "name": entry.name[:-len(SNAPSHOT_SUFFIX)],
+                "size": stat.st_size,
+                "created_at": datetime.utcfromtimestamp(stat.st_mtime)
+            })
+    snapshots.sort(key=lambda snapshot: snapshot["created_at"], reverse=True)
+    return snapshots
+
+
+def snapshot_path(name: str) -> Optional[str]:
+    """Path of a stored snapshot, or None for unknown names"""
+    if not re.fullmatch(r"[A-Za-z0-9_\-]+", name):
+        return None
+    path = os.path.join(settings.memory_snapshot_dir, name + SNAPSHOT_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+def _prune_snapshots() -> None:
+    for snapshot in list_snapshots()[settings.memory_snapshot_keep:]:
+        try:
+            os.remove(os.path.join(settings.memory_snapshot_dir, snapshot["name"] + SNAPSHOT_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+
+def compare_snapshots(name: str, base: Optional[str] = None, group_by: str = "lineno", limit: int = 25) -> Optional[List[dict]]:
+    """
+    Largest allocation sites of a snapshot, or the largest changes since base.
+    Returns None if either snapshot does not exist.
+    """
+    path = snapshot_path(name)
+    base_path = snapshot_path(base) if base is not None else None
+    if path is None or (base is not None and base_path is None):
+        return None
+    snapshot = tracemalloc.Snapshot.load(path)
+    if base_path is None:
+        return [
+            {"location": _location(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+    differences = snapshot.compare_to(tracemalloc.Snapshot.load(base_path), group_by)
+    return [
+        {
+            "location": _location(stat.traceback),
+            "size_bytes": stat.size,
+            "size_diff_bytes": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff
+        }
+        for stat in differences[:limit]
+    ]
+
+
+def _location(traceback: tracemalloc.Traceback) -> str:
+    """Most recent frame first; grouping by filename leaves no line numbers"""
+    return " <- ".join(
+        f"{frame.filename}:{frame.lineno}" if frame.lineno else frame.filename
+        for frame in reversed(traceback)
+    )
+
+
+# -- Per-route peaks -------------------------------------------------------------
+
+class RoutePeaks:
+    """Peak traced allocation per request, by route, over a rolling window"""
+
+    def __init__(self, window: float, max_samples: int):
+        self.window = window
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def request_started(self) -> int:
+        """Traced bytes allocated when the request starts"""
+        with self._lock:
+            if self._in_flight == 0:
+                tracemalloc.reset_peak()
+            self._in_flight += 1
+        return tracemalloc.get_traced_memory()[0]
+
+    def request_finished(self, route: str, started_with: int) -> None:
+        peak = max(tracemalloc.get_traced_memory()[1] - started_with, 0) if tracemalloc.is_tracing() else None
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if peak is None:
+                return
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(maxlen=self.max_samples)
+            samples.append((now, peak))
+
+    def summary(self) -> List[dict]:
+        """Per route: requests, largest and mean peak in the window, largest first"""
+        cutoff = time.monotonic() - self.window
+        routes = []
+        with self._lock:
+            for route, samples in list(self._samples.items()):
+                while samples and samples[0][0] < cutoff:
+                    samples.popleft()
+                if not samples:
+                    del self._samples[route]
+                    continue
+                peaks = sorted(peak for _, peak in samples)
+                routes.append({
+                    "route": route,
+                    "requests": len(peaks),
+                    "max_peak_bytes": peaks[-1],
+                    "p95_peak_bytes": peaks[min(int(len(peaks) * 0.95), len(peaks) - 1)],
+                    "mean_peak_bytes": sum(peaks) // len(peaks)
+                })
+        routes.sort(key=lambda route: route["max_peak_bytes"], reverse=True)
+        return routes
+
+
+route_peaks = RoutePeaks(settings.memory_route_window_seconds, settings.memory_route_max_samples)
+
+
+class MemoryTrackingMiddleware:
+    """Records per-route allocation peaks while tracemalloc is tracing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+        started_with = route_peaks.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_peaks.request_finished(f"{scope['method']} {route_template(scope)}", started_with)
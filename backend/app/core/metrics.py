@@ -0,0 +1,203 @@
+"""
+In-process metrics registry.
+
+Counters, gauges and histograms are per worker process and keyed by label
+values. Instruments are created once at import time via counter(), gauge()
+and histogram() and are safe to update from the event loop and the sync
+route threadpool. Hot paths can bind label values once with labels() and
+skip the per-call label check. render_text() produces the Prometheus text
+exposition format.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: Dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def labels(self, **labels: str) -> "_Child":
+        """The instrument with these label values bound"""
+        return _Child(self, self._key(labels))
+
+
+class _Child:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._metric._inc_key(self._key, amount)
+
+    def set(self, value: float) -> None:
+        self._metric._set_key(self._key, value)
+
+    def observe(self, value: float) -> None:
+        self._metric._observe_key(self._key, value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._inc_key(self._key(labels), amount)
+
+    def _inc_key(self, key: Tuple[str, ...], amount: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._set_key(self._key(labels), value)
+
+    def _set_key(self, key: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        self._observe_key(self._key(labels), value)
+
+    def _observe_key(self, key: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], List[float]]]:
+        with self._lock:
+            return [(key, list(state)) for key, state in self._values.items()]
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+
+def _register(metric_class, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+    with _registry_lock:
+        existing = _registry.get(name)
+        if existing is not None:
+            if not isinstance(existing, metric_class) or existing.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' already registered with a different type or labels")
+            return existing
+        metric = metric_class(name, documentation, labelnames, **kwargs)
+        _registry[name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Optional[Sequence[float]] = None
+) -> Histogram:
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets or DEFAULT_BUCKETS)
+
+
+def registered_metrics() -> List[_Metric]:
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_text() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for metric in sorted(registered_metrics(), key=lambda metric: metric.name):
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quotes=False)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        samples = sorted(metric.samples())
+        if isinstance(metric, Histogram):
+            for key, state in samples:
+                labels = list(zip(metric.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), state):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(state[-1])}")
+                lines.append(f"{metric.name}_count{_format_labels(labels)} {cumulative}")
+        elif not samples and not metric.labelnames:
+            lines.append(f"{metric.name} 0")
+        else:
+            for key, value in samples:
+                lines.append(f"{metric.name}{_format_labels(list(zip(metric.labelnames, key)))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,229 @@
+"""
+On-demand sampling profiler for single requests.
+
+An admin flags a request with an "X-Profile: 1" header. The request then
+runs with a sampler thread that records its stacks every
+settings.profile_sample_interval_ms and writes them to
+settings.profile_dir in collapsed-stack format ("outer;inner;leaf count"
+per line), which flamegraph.pl, speedscope and inferno read directly. The
+response carries the profile's name in X-Profile-Id; the file is written
+when the request finishes (after the last byte of a streamed response) and
+admins download it from /admin/profiles/{name}.
+
+Samples are wall-clock and only cover the flagged request: event loop
+samples are kept when the loop is running the request's coroutine, and
+threadpool samples when the worker thread is running a call made from the
+request's context (sync routes and dependencies). Samples where none of
+its code was running are recorded as "(waiting)".
+
+Unflagged requests cost one scan of the request headers. A flag from a
+user who is not an admin is ignored.
+"""
+import contextvars
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core import metrics
+from app.core.security import get_user_from_token
+from app.database import SessionLocal
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_SUFFIX = ".collapsed"
+WAITING = "(waiting)"
+
+profiles_recorded = metrics.counter("request_profiles_total", "Requests profiled on demand")
+
+# Set for the duration of a flagged request; read by the sampler through worker threads' contexts
+_active_profile: contextvars.ContextVar[Optional["RequestProfiler"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}".replace(";", ":")
+
+
+def _collapse(frame, stop=None) -> List[str]:
+    """Labels from the outermost frame (or stop) to frame"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        if frame is stop:
+            break
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _context_root(frame, profiler: "RequestProfiler"):
+    """The frame that runs the profiled context in a worker thread, if any"""
+    outermost = []
+    while frame is not None:
+        outermost.append(frame)
+        frame = frame.f_back
+    # Executors run contexts near the bottom of the thread's stack
+    for candidate in reversed(outermost[-8:]):
+        for value in candidate.f_locals.values():
+            if isinstance(value, contextvars.Context) and value.get(_active_profile) is profiler:
+                return candidate
+    return None
+
+
+class RequestProfiler:
+    def __init__(self, label: str, interval: float):
+        self.label = label
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started_at = datetime.utcnow()
+        self.name = "-".join([
+            f"{self.started_at:%Y%m%dT%H%M%S}",
+            re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:60],
+            uuid.uuid4().hex[:8]
+        ])
+        self._loop_thread = threading.get_ident()
+        self._request_frame = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, request_frame) -> None:
+        self._request_frame = request_frame
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own)
+
+    def _sample(self, own: int) -> None:
+        recorded = False
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident == self._loop_thread:
+                stack = self._loop_stack(frame)
+            else:
+                root = _context_root(frame, self)
+                stack = _collapse(frame, root) if root is not None else None
+            if stack:
+                self.samples[";".join([self.label, *stack])] += 1
+                recorded = True
+        if not recorded:
+            self.samples[f"{self.label};{WAITING}"] += 1
+
+    def _loop_stack(self, frame) -> Optional[List[str]]:
+        top = frame
+        while frame is not None:
+            if frame is self._request_frame:
+                return _collapse(top, frame)
+            frame = frame.f_back
+        return None
+
+    def save(self) -> None:
+        """Write the samples to profile_dir under self.name"""
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        path = os.path.join(settings.profile_dir, self.name + PROFILE_SUFFIX)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune_profiles()
+        profiles_recorded.inc()
+
+
+# -- Stored profiles -------------------------------------------------------------
+
+def list_profiles() -> List[dict]:
+    """Stored profiles, newest first"""
+    if not os.path.isdir(settings.profile_dir):
+        return []
+    profiles = []
+    for entry in os.scandir(settings.profile_dir):
+        if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX):
+            stat = entry.stat()
+            profiles.append({
+                "name": entry.name[:-len(PROFILE_SUFFIX)],
+                "size": stat.st_size,
+                "created_at": datetime.utcfromtimestamp(stat.st_mtime)
+            })
+    profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a stored profile, or None for unknown names"""
+    if not re.fullmatch(r"[A-Za-z0-9_\-]+", name):
+        return None
+    path = os.path.join(settings.profile_dir, name + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+def _prune_profiles() -> None:
+    for profile in list_profiles()[settings.profile_keep:]:
+        try:
+            os.remove(os.path.join(settings.profile_dir, profile["name"] + PROFILE_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+
+# -- Middleware ------------------------------------------------------------------
+
+def _is_admin_token(authorization: Optional[bytes]) -> bool:
+    if not authorization or not authorization.lower().startswith(b"bearer "):
+        return False
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(db, authorization[7:].decode("latin-1").strip())
+        return user is not None and bool(user.is_admin)
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        flag = authorization = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                flag = value
+            elif name == b"authorization":
+                authorization = value
+        if not flag or flag in (b"0", b"false") or not await run_in_threadpool(_is_admin_token, authorization):
+            await self.app(scope, receive, send)
+            return
+        await self._profile(scope, receive, send)
+
+    async def _profile(self, scope, receive, send):
+        profiler = RequestProfiler(f"{scope['method']} {scope['path']}", settings.profile_sample_interval_ms / 1000)
+        token = _active_profile.set(profiler)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), (b"x-profile-id", profiler.name.encode())]}
+            await send(message)
+
+        profiler.start(sys._getframe())
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _active_profile.reset(token)
+            profiler.stop()
+            await run_in_threadpool(profiler.save)
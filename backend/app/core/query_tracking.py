@@ -0,0 +1,178 @@
+"""
+Per-request SQL statement counting.
+
+Engine events count every statement executed and the time spent in the
+database driver, attributed to the request that ran it through a context
+variable (FastAPI's threadpool copies the context, so sync routes and
+dependencies are included). Background threads such as the autosave
+flusher and the outbox runner are not attributed to any request.
+
+QueryTrackingMiddleware starts the tracking for each HTTP request and at
+the end of it:
+
+- records http_request_db_queries{route}
+- logs a warning when the request ran the same statement text
+  settings.repeated_query_threshold times or more, which is usually an
+  N+1 pattern (a query per row of an earlier result)
+- with settings.server_timing_header, adds
+  Server-Timing: db;dur=<ms>;desc="<n> queries" to the response
+
+query_budget() asserts how many statements a block of code, or the
+requests made through a TestClient inside it, may run:
+
+    with query_budget(3):
+        client.get(f"/documents/{document_id}", headers=headers)
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.core import metrics
+from app.core.request_metrics import route_template
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+db_queries = metrics.histogram(
+    "http_request_db_queries",
+    "SQL statements run per HTTP request, by route template",
+    ["route"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+repeated_queries = metrics.counter(
+    "http_request_repeated_queries_total",
+    "Requests that ran one statement at least repeated_query_threshold times",
+    ["route"]
+)
+
+
+class QueryStats:
+    """Statements run by one request or tracked block"""
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def merge(self, other: "QueryStats") -> None:
+        self.count += other.count
+        self.duration += other.duration
+        self.statements.update(other.statements)
+
+    def most_repeated(self):
+        """(statement, times) for the statement run most often, or None"""
+        common = self.statements.most_common(1)
+        return common[0] if common else None
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+
+# Collectors of query_budget() blocks, which also receive finished requests' stats
+_collectors: List[QueryStats] = []
+_collectors_lock = threading.Lock()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, so a statement that raises leaves nothing behind
+    if context is not None and _current.get() is not None:
+        context.query_tracking_started = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "query_tracking_started", None)
+    if stats is not None and started is not None:
+        stats.add(statement, time.perf_counter() - started)
+
+
+def current_request() -> Optional[str]:
+    """Method and route template ("GET /documents/{document_id}") of the request in this context, if any"""
+    stats = _current.get()
+    if stats is None or stats.scope is None:
+        return None
+    return f"{stats.scope['method']} {route_template(stats.scope)}"
+
+
+@contextmanager
+def track_queries(scope: Optional[dict] = None) -> Iterator[QueryStats]:
+    """Count the statements run in this context (and threadpool calls made from it)"""
+    stats = QueryStats(scope)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Fail with AssertionError if the block, and requests finished during it, run more than max_queries statements"""
+    collected = QueryStats()
+    with _collectors_lock:
+        _collectors.append(collected)
+    try:
+        with track_queries() as own:
+            yield collected
+    finally:
+        with _collectors_lock:
+            _collectors.remove(collected)
+    collected.merge(own)
+    if collected.count > max_queries:
+        listing = "\n".join(f"  {times}x {statement}" for statement, times in collected.statements.most_common())
+        raise AssertionError(f"{collected.count} queries run, budget is {max_queries}:\n{listing}")
+
+
+def _finished(stats: QueryStats) -> None:
+    if _collectors:
+        with _collectors_lock:
+            for collected in _collectors:
+                collected.merge(stats)
+
+
+class QueryTrackingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.server_timing_header:
+                timing = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        with track_queries(scope) as stats:
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                self._record(scope, stats)
+
+    def _record(self, scope, stats: QueryStats) -> None:
+        route = route_template(scope)
+        db_queries.observe(stats.count, route=route)
+        repeated = stats.most_repeated()
+        if repeated is not None and repeated[1] >= settings.repeated_query_threshold:
+            repeated_queries.inc(route=route)
+            logger.warning(
+                "%s %s ran the same statement %d times (%d queries in total): %s",
+                scope["method"], route, repeated[1], stats.count, " ".join(repeated[0].split())[:300]
+            )
+        _finished(stats)
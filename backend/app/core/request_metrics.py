@@ -0,0 +1,102 @@
+"""
+Per-route HTTP metrics, recorded by a plain ASGI middleware.
+
+Requests are labelled by method and route template (/documents/{document_id},
+not /documents/42), so label cardinality is bounded by the route table;
+requests that match no route share route="unmatched". Recorded per request:
+
+    http_requests_total{method, route, status}
+    http_request_duration_seconds{method, route}   time to the last body byte
+    http_response_size_bytes{method, route}        body bytes sent
+    http_requests_in_flight{route}                 computed at scrape time
+
+The route is only known once the router has run, so in-flight requests are
+tracked as open scopes and grouped by route when /metrics is rendered.
+Label values are bound once per (method, route, status) combination; the
+added cost per request is measured by scripts/bench_request_metrics.py.
+WebSocket connections are not recorded here (see the collab_* metrics).
+"""
+import time
+from typing import Dict, Tuple
+
+from app.core import metrics
+
+UNMATCHED = "unmatched"
+
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"])
+http_duration = metrics.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+http_response_size = metrics.histogram(
+    "http_response_size_bytes",
+    "HTTP response body size by route template",
+    ["method", "route"],
+    buckets=(100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+)
+http_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests being handled, by route template", ["route"])
+
+# Scopes of the requests being handled, by id(scope)
+_active: Dict[int, dict] = {}
+_in_flight_routes = set()
+
+
+def route_template(scope: dict) -> str:
+    """Template of the route that handled the request, once the router has run"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._bound: Dict[Tuple[str, str, int], tuple] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        # [status, body bytes]
+        response = [500, 0]
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.body":
+                response[1] += len(message.get("body", b""))
+            elif message["type"] == "http.response.start":
+                response[0] = message["status"]
+            await send(message)
+
+        token = id(scope)
+        _active[token] = scope
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            del _active[token]
+            key = (scope["method"], route_template(scope), response[0])
+            bound = self._bound.get(key)
+            if bound is None:
+                bound = self._bound[key] = (
+                    http_requests.labels(method=key[0], route=key[1], status=str(key[2])),
+                    http_duration.labels(method=key[0], route=key[1]),
+                    http_response_size.labels(method=key[0], route=key[1])
+                )
+            bound[0].inc()
+            bound[1].observe(time.perf_counter() - started)
+            bound[2].observe(response[1])
+
+
+def update_in_flight() -> None:
+    """Refresh http_requests_in_flight from the requests open right now"""
+    counts: Dict[str, int] = {}
+    for scope in list(_active.values()):
+        route = route_template(scope)
+        counts[route] = counts.get(route, 0) + 1
+    for route in _in_flight_routes - set(counts):
+        http_in_flight.set(0, route=route)
+    for route, count in counts.items():
+        http_in_flight.set(count, route=route)
+    _in_flight_routes.update(counts)
@@ -58,6 +58,20 @@ def verify_access_token(token: str) -> Optional[str]:
     except JWTError:
         return None
 
+def get_user_from_token(db: Session, token: str) -> Optional[User]:
+    """
+    Resolve an access token to an active user, or None.
+    For transports that cannot use the OAuth2 dependency (e.g. WebSockets).
+    """
+    user_identifier = verify_access_token(token)
+    if user_identifier is None:
+        return None
+    
+    user = db.query(User).filter(User.email == user_identifier).first()
+    if user is None or not user.is_active:
+        return None
+    return user
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
@@ -93,6 +107,18 @@ def get_current_user(
     
     return user
 
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Dependency for admin-only endpoints
+    Usage: admin: User = Depends(get_current_admin)
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create refresh token (long-lived)"""
     from app.config import settings
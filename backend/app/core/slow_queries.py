@@ -0,0 +1,235 @@
+"""
+Slow query log with plan capture.
+
+Every statement that takes settings.slow_query_ms or longer is logged (at
+WARNING, logger app.core.slow_queries) with its duration, the request that
+ran it ("GET /documents/search", or "-" for background work) and the shape
+of its bound parameters: types and lengths, never values.
+
+Plans are captured afterwards by a background thread on its own pooled
+connection, so the request that ran the statement never waits for them:
+EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL, inside a transaction that is
+rolled back and under slow_query_explain_timeout_ms; EXPLAIN QUERY PLAN
+on SQLite. Only SELECT statements are explained, since ANALYZE executes
+the statement. Capture is rate limited so it cannot add load while the
+database is already slow:
+
+- at most slow_query_explains_per_minute plans per worker
+- the same statement text is explained at most once per
+  slow_query_explain_interval_seconds
+- at most slow_query_explain_queue statements wait for capture; more are
+  dropped
+
+The last slow_query_log_size slow queries, with their plans once captured,
+are listed by GET /admin/slow-queries.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.core import metrics
+from app.core.query_tracking import current_request
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+slow_queries = metrics.counter("db_slow_queries_total", "Statements over slow_query_ms, by request route", ["route"])
+explains = metrics.counter("db_slow_query_explains_total", "Plan captures for slow queries", ["result"])
+
+# Set on the capture thread's connection so its own EXPLAINs are not logged as slow queries
+EXPLAIN_CONNECTION = "slow_query_explain"
+
+
+def _parameter_shape(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return f"{type(value).__name__}({len(value)})"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, dict):
+        return f"dict{{{len(value)}}}"
+    return type(value).__name__
+
+
+def parameter_shapes(parameters, executemany: bool):
+    """Types and lengths of bound parameters, without their values"""
+    if executemany:
+        return f"{len(parameters)} parameter sets"
+    if isinstance(parameters, dict):
+        return {name: _parameter_shape(value) for name, value in parameters.items()}
+    return [_parameter_shape(value) for value in parameters or ()]
+
+
+class SlowQuery:
+    def __init__(self, statement: str, parameters, shapes, duration: float, request: Optional[str]):
+        self.statement = statement
+        self.parameters = parameters
+        self.shapes = shapes
+        self.duration = duration
+        self.request = request
+        self.logged_at = datetime.utcnow()
+        self.plan: Optional[str] = None
+        self.plan_status = "pending"
+
+    def as_dict(self) -> dict:
+        return {
+            "statement": self.statement,
+            "parameters": self.shapes,
+            "duration_ms": round(self.duration * 1000, 1),
+            "request": self.request,
+            "logged_at": self.logged_at,
+            "plan": self.plan,
+            "plan_status": self.plan_status
+        }
+
+
+class SlowQueryLog:
+    """Recent slow queries and the background thread that captures their plans"""
+
+    def __init__(self, size: int, queue_size: int, per_minute: int, repeat_interval: float):
+        self.recent: deque = deque(maxlen=size)
+        self.per_minute = per_minute
+        self.repeat_interval = repeat_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._explained_at: Dict[str, float] = {}
+        self._capture_times: deque = deque()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, statement: str, parameters, executemany: bool, duration: float) -> None:
+        request = current_request()
+        shapes = parameter_shapes(parameters, executemany)
+        slow = SlowQuery(statement, None if executemany else parameters, shapes, duration, request)
+        slow_queries.inc(route=request or "-")
+        logger.warning(
+            "Slow query (%.0f ms) in %s: %s parameters=%s",
+            duration * 1000, request or "-", " ".join(statement.split()), shapes
+        )
+        with self._lock:
+            self.recent.append(slow)
+        explainable = not executemany and statement.lstrip()[:6].upper() == "SELECT"
+        if not settings.slow_query_explain or not explainable or self._thread is None:
+            slow.parameters = None
+            slow.plan_status = "skipped"
+            return
+        try:
+            self._queue.put_nowait(slow)
+        except queue.Full:
+            slow.parameters = None
+            slow.plan_status = "dropped"
+            explains.inc(result="dropped")
+
+    def _allowed(self, slow: SlowQuery) -> bool:
+        now = time.monotonic()
+        last = self._explained_at.get(slow.statement)
+        if last is not None and now - last < self.repeat_interval:
+            return False
+        while self._capture_times and now - self._capture_times[0] >= 60:
+            self._capture_times.popleft()
+        if len(self._capture_times) >= self.per_minute:
+            return False
+        self._capture_times.append(now)
+        self._explained_at[slow.statement] = now
+        if len(self._explained_at) > 1000:
+            self._explained_at = {
+                statement: at for statement, at in self._explained_at.items() if now - at < self.repeat_interval
+            }
+        return True
+
+    def capture(self, slow: SlowQuery) -> None:
+        if not self._allowed(slow):
+            slow.parameters = None
+            slow.plan_status = "rate limited"
+            explains.inc(result="rate_limited")
+            return
+        try:
+            slow.plan = explain(slow.statement, slow.parameters)
+            slow.plan_status = "captured"
+            explains.inc(result="captured")
+        except Exception as e:
+            slow.plan_status = f"failed: {e.__class__.__name__}"
+            explains.inc(result="failed")
+            logger.warning("Could not capture plan for slow query in %s", slow.request or "-", exc_info=True)
+            return
+        finally:
+            # Parameter values are only kept until the plan is captured
+            slow.parameters = None
+        logger.warning(
+            "Plan for slow query (%.0f ms) in %s:\n%s",
+            slow.duration * 1000, slow.request or "-", slow.plan
+        )
+
+    def entries(self) -> List[dict]:
+        """Recent slow queries, newest first"""
+        with self._lock:
+            return [slow.as_dict() for slow in reversed(self.recent)]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                slow = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.capture(slow)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def explain(statement: str, parameters) -> str:
+    """The plan of a statement, run on a separate connection and rolled back"""
+    with engine.connect() as conn:
+        conn.info[EXPLAIN_CONNECTION] = True
+        try:
+            if conn.dialect.name == "postgresql":
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.slow_query_explain_timeout_ms)}")
+                rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters).all()
+                return "\n".join(row[0] for row in rows)
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            return "\n".join(str(row[-1]) for row in rows)
+        finally:
+            conn.info.pop(EXPLAIN_CONNECTION, None)
+            conn.rollback()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.slow_query_started = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "slow_query_started", None)
+    if started is None or settings.slow_query_ms <= 0 or conn.info.get(EXPLAIN_CONNECTION):
+        return
+    duration = time.perf_counter() - started
+    if duration * 1000 >= settings.slow_query_ms:
+        slow_query_log.record(statement, parameters, executemany, duration)
+
+
+slow_query_log = SlowQueryLog(
+    size=settings.slow_query_log_size,
+    queue_size=settings.slow_query_explain_queue,
+    per_minute=settings.slow_query_explains_per_minute,
+    repeat_interval=settings.slow_query_explain_interval_seconds
+)
@@ -1,10 +1,21 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base 
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
 DATABASE_URL = settings.database_url
-engine = create_engine(DATABASE_URL)
+# Pool sizing is per worker process; see app/core/capacity.py
+if make_url(DATABASE_URL).get_backend_name() == "sqlite":
+    engine = create_engine(DATABASE_URL)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_pre_ping=True
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
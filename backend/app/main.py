@@ -1,10 +1,52 @@
+from contextlib import asynccontextmanager
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.config import settings
 from app.database import Base, engine
 from app import models
-from app.routes import auth_router, documents_router
+from app.core.capacity import threadpool_size
+from app.core.memory import MemoryTrackingMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.query_tracking import QueryTrackingMiddleware
+from app.core.request_metrics import RequestMetricsMiddleware
+from app.core.slow_queries import slow_query_log
+from app.routes import admin_router, auth_router, documents_router, metrics_router
+from app.services.autosave import autosave_buffer
+from app.services.change_feed import change_feed_consumer
+from app.services.document_service import preload_export_modules
+from app.services.outbox import outbox_runner
+from app.websocket import collaboration_access_consumer, hub, websocket_router
 
-app = FastAPI(title="Collaborative Docs API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync routes run in this threadpool; size it to the connection pool
+    to_thread.current_default_thread_limiter().total_tokens = threadpool_size()
+    if settings.export_preload:
+        preload_export_modules()
+    autosave_buffer.start()
+    slow_query_log.start()
+    outbox_runner.register(change_feed_consumer)
+    outbox_runner.register(collaboration_access_consumer)
+    outbox_runner.start()
+    await hub.start()
+    yield
+    # Write back live collaboration state and acknowledged autosaves before the
+    # worker exits; a failing step must not skip the ones after it
+    try:
+        await hub.stop()
+    finally:
+        try:
+            autosave_buffer.stop()
+        finally:
+            try:
+                outbox_runner.stop()
+            finally:
+                slow_query_log.stop()
+
+
+app = FastAPI(title="Collaborative Docs API", lifespan=lifespan)
 
 # CORS Middleware Configuration
 app.add_middleware(
@@ -21,9 +63,20 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allow all headers
 )
+# Per-route latency, status and size metrics, served at /metrics
+app.add_middleware(RequestMetricsMiddleware)
+# Statements and database time per request, with N+1 warnings
+app.add_middleware(QueryTrackingMiddleware)
+# Admins can profile a single request with an X-Profile: 1 header
+app.add_middleware(ProfilingMiddleware)
+# Per-route allocation peaks, only while tracemalloc is started from /admin/memory/tracing
+app.add_middleware(MemoryTrackingMiddleware)
 
 app.include_router(auth_router)
 app.include_router(documents_router)
+app.include_router(websocket_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 @app.get("/")
 def root():
@@ -1,4 +1,8 @@
 from .user import User
 from .document import Document
+from .document_block import DocumentBlock
+from .document_revision import DocumentRevision
 from .document_collaborator import DocumentCollaborator
+from .document_tombstone import DocumentTombstone
+from .outbox import OutboxEvent, OutboxCheckpoint
 from .share_link import ShareLink
\ No newline at end of file
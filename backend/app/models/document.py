@@ -1,21 +1,39 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.types import CompressedText
 
 class Document(Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     title = Column(String(255), nullable=False)
-    content = Column(Text, default="")  # For plain text or backwards compatibility
+    # For plain text or backwards compatibility. Compressed when large and
+    # deferred, so it is only read (and decompressed) when accessed
+    content = deferred(Column(CompressedText, default=""))
     content_type = Column(String(20), default="plain")  # plain, html, markdown, structured
-    content_blocks = Column(JSON, nullable=True)  # Structured content with inline styles per block
     styles = Column(JSON, nullable=True)  # Global document styles
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every update, backs ETag/If-Match
+    content_hash = Column(String(96), nullable=True)  # Fingerprint of content/blocks/styles, see services/content_hash.py
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)  # Stamped on every write, see services/sync_service.py
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     owner = relationship("User", back_populates="documents")
     collaborators = relationship("DocumentCollaborator", back_populates="document", cascade="all, delete-orphan")
+    # Structured content lives in document_blocks, one row per block
+    blocks = relationship(
+        "DocumentBlock",
+        back_populates="document",
+        order_by="DocumentBlock.position",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    
+    @property
+    def content_blocks(self):
+        """Structured content with inline styles per block, assembled from document_blocks"""
+        return [block.to_dict() for block in self.blocks]
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.types import CompressedJSON
+
+# Fractional keys must sort byte-wise; force the C collation on PostgreSQL
+PositionKey = String(64).with_variant(String(64, collation="C"), "postgresql")
+
+class DocumentBlock(Base):
+    __tablename__ = "document_blocks"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    block_id = Column(String(64), nullable=False)  # Stable id exposed to clients as block["id"]
+    position = Column(PositionKey, nullable=False)  # Fractional ordering key, see services/block_store.py
+    data = Column(CompressedJSON, nullable=False)  # Block body (type, text/content, styles) without the id
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('document_id', 'block_id', name='unique_document_block'),
+        Index('ix_document_blocks_document_position', 'document_id', 'position'),
+    )
+
+    # Relationships
+    document = relationship("Document", back_populates="blocks")
+
+    def to_dict(self) -> dict:
+        """Block in the content_blocks shape used by DocumentOut"""
+        return {"id": self.block_id, **self.data}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint, DateTime
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, UniqueConstraint, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -10,12 +10,17 @@ class DocumentCollaborator(Base):
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     role = Column(String(20), nullable=False)  # 'owner', 'editor', 'reader'
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # Stamped when access is granted or changes
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # Ensure one user can only have one role per document
     __table_args__ = (
         UniqueConstraint('document_id', 'user_id', name='unique_document_user'),
+        # Serves "documents accessible to user X" lookups (lists, typeahead)
+        Index('ix_document_collaborators_user_document', 'user_id', 'document_id'),
+        # Serves "documents newly shared with user X" for the sync API
+        Index('ix_document_collaborators_user_change_seq', 'user_id', 'change_seq'),
     )
     
     # Relationships
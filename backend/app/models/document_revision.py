@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.types import CompressedJSON
+
+class DocumentRevision(Base):
+    __tablename__ = "document_revisions"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)  # Document version this revision captures
+    kind = Column(String(10), nullable=False)  # 'snapshot' (full state) or 'delta'
+    base_revision = Column(Integer, nullable=True)  # Revision a delta applies to; NULL for snapshots
+    data = Column(CompressedJSON, nullable=False)  # Full state or delta, see services/revision_service.py
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('document_id', 'revision', name='unique_document_revision'),
+    )
@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class DocumentTombstone(Base):
+    """A document a user could see and no longer can, reported by the sync API"""
+    __tablename__ = "document_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(Integer, nullable=False)  # No foreign key: the document may be gone
+    reason = Column(String(10), nullable=False)  # 'deleted' or 'revoked'
+    change_seq = Column(BigInteger, nullable=False)  # See services/sync_service.py
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Regaining access removes the tombstone, so there is at most one
+        UniqueConstraint('user_id', 'document_id', name='unique_tombstone_user_document'),
+        Index('ix_document_tombstones_user_change_seq', 'user_id', 'change_seq'),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class OutboxEvent(Base):
+    """A document mutation, written in the same transaction as the mutation itself"""
+    __tablename__ = "document_outbox"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    txid = Column(BigInteger, nullable=False, default=0)  # Writing transaction, orders events by commit; see services/outbox.py
+    event_type = Column(String(20), nullable=False)  # created, updated, deleted, shared, unshared
+    document_id = Column(Integer, nullable=False)  # No foreign key: deleted documents keep their events
+    data = Column(JSON, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Consumers read in (txid, id) order
+        Index('ix_document_outbox_txid_id', 'txid', 'id'),
+        # Pruned ids must never be handed out again
+        {"sqlite_autoincrement": True},
+    )
+
+
+class OutboxCheckpoint(Base):
+    """How far a durable consumer has processed the outbox"""
+    __tablename__ = "outbox_checkpoints"
+
+    consumer = Column(String(64), primary_key=True)
+    txid = Column(BigInteger, nullable=False, default=0)
+    event_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
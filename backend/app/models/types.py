@@ -0,0 +1,116 @@
+"""
+Column types that compress large values transparently.
+
+Values are stored as bytes. Anything below compression_threshold_bytes is
+kept as plain UTF-8 so small rows pay no CPU cost; larger values are stored
+as a two-byte header followed by the compressed payload:
+
+    b"\\x00z" + zlib data
+    b"\\x00s" + zstd data (when the zstandard package is installed)
+
+Plain text never starts with NUL (PostgreSQL text cannot contain it), so the
+header is unambiguous and rows written before compression was enabled, or
+by the backfill, read back unchanged.
+"""
+import json
+import logging
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_MARK = b"\x00"
+ZLIB_HEADER = b"\x00z"
+ZSTD_HEADER = b"\x00s"
+
+
+_zstd_warned = False
+
+
+def _use_zstd() -> bool:
+    global _zstd_warned
+    if settings.compression_algorithm != "zstd":
+        return False
+    if zstandard is None:
+        if not _zstd_warned:
+            logger.warning("COMPRESSION_ALGORITHM=zstd but zstandard is not installed; using zlib")
+            _zstd_warned = True
+        return False
+    return True
+
+
+def is_compressed(data: Optional[bytes]) -> bool:
+    return data is not None and bytes(data[:1]) == HEADER_MARK
+
+
+def compress_bytes(raw: bytes) -> bytes:
+    """Encode raw UTF-8 for storage, compressing it if it is large enough to pay off"""
+    if len(raw) < settings.compression_threshold_bytes and raw[:1] != HEADER_MARK:
+        return raw
+
+    if _use_zstd():
+        compressed = ZSTD_HEADER + zstandard.ZstdCompressor(level=settings.compression_level).compress(raw)
+    else:
+        compressed = ZLIB_HEADER + zlib.compress(raw, settings.compression_level)
+
+    # Incompressible input: keep it plain unless plain would be ambiguous
+    if len(compressed) >= len(raw) and raw[:1] != HEADER_MARK:
+        return raw
+    return compressed
+
+
+def decompress_bytes(data: bytes) -> bytes:
+    if isinstance(data, str):
+        # SQLite keeps the original text storage class for rows migrated in place
+        return data.encode("utf-8")
+    data = bytes(data)
+    header = data[:2]
+    if header == ZLIB_HEADER:
+        return zlib.decompress(data[2:])
+    if header == ZSTD_HEADER:
+        if zstandard is None:
+            raise RuntimeError("Row is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data[2:])
+    return data
+
+
+class CompressedText(TypeDecorator):
+    """Text stored as bytes, compressed above the configured threshold"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress_bytes(value.encode("utf-8"))
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return decompress_bytes(value).decode("utf-8")
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON stored as bytes, compressed above the configured threshold"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress_bytes(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Any:
+        if value is None:
+            return None
+        return json.loads(decompress_bytes(value))
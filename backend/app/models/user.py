@@ -11,6 +11,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Integer, default=1)
+    is_admin = Column(Integer, default=0, server_default="0", nullable=False)
     refresh_token = Column(Text, nullable=True)  # Add this
     reset_token = Column(String, nullable=True)  # Add this
     reset_token_expires = Column(DateTime, nullable=True)  # Add this
@@ -1,2 +1,4 @@
 from .auth import router as auth_router
 from .documents import router as documents_router
+from .metrics import router as metrics_router
+from .admin import router as admin_router
@@ -0,0 +1,135 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from typing import List, Optional
+from app.core import memory
+from app.core.profiling import PROFILE_SUFFIX, list_profiles, profile_path
+from app.core.security import get_current_admin
+from app.core.slow_queries import slow_query_log
+from app.models.user import User
+from app.schemas.admin import (
+    AllocationStatOut,
+    MemoryOut,
+    ProfileOut,
+    RouteMemoryOut,
+    SlowQueryOut,
+    SnapshotOut,
+    TracingOut,
+    TracingStart
+)
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.get("/profiles", response_model=List[ProfileOut])
+def get_profiles(admin: User = Depends(get_current_admin)):
+    """
+    Request profiles taken with the X-Profile header, newest first.
+    """
+    return list_profiles()
+
+@router.get("/profiles/{name}")
+def download_profile(name: str, admin: User = Depends(get_current_admin)):
+    """
+    Download a profile in collapsed-stack format (flamegraph.pl, speedscope).
+    """
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=name + PROFILE_SUFFIX)
+
+@router.get("/slow-queries", response_model=List[SlowQueryOut])
+def get_slow_queries(admin: User = Depends(get_current_admin)):
+    """
+    Recent statements over settings.slow_query_ms on this worker, newest first,
+    with their plans once captured.
+    """
+    return slow_query_log.entries()
+
+@router.get("/memory", response_model=MemoryOut)
+def get_memory(admin: User = Depends(get_current_admin)):
+    """
+    Resident memory, garbage collector and tracemalloc state of the worker
+    that handles this request.
+    """
+    return {**memory.process_memory(), "gc": memory.gc_stats(), "tracing": memory.tracing_status()}
+
+@router.post("/memory/tracing", response_model=TracingOut)
+def start_memory_tracing(options: TracingStart, admin: User = Depends(get_current_admin)):
+    """
+    Start tracemalloc on this worker. Allocations get slower and use more
+    memory while it runs; per-route peaks are recorded until it is stopped.
+    """
+    memory.start_tracing(options.frames)
+    return memory.tracing_status()
+
+@router.delete("/memory/tracing", response_model=TracingOut)
+def stop_memory_tracing(admin: User = Depends(get_current_admin)):
+    """
+    Stop tracemalloc on this worker.
+    """
+    memory.stop_tracing()
+    return memory.tracing_status()
+
+@router.get("/memory/routes", response_model=List[RouteMemoryOut])
+def get_route_memory(admin: User = Depends(get_current_admin)):
+    """
+    Peak traced allocation per request by route over the last
+    settings.memory_route_window_seconds, largest first.
+    """
+    return memory.route_peaks.summary()
+
+@router.post("/memory/snapshots", response_model=SnapshotOut, status_code=status.HTTP_201_CREATED)
+def take_memory_snapshot(admin: User = Depends(get_current_admin)):
+    """
+    Write a tracemalloc snapshot of this worker.
+    """
+    try:
+        name = memory.take_snapshot()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    return next(snapshot for snapshot in memory.list_snapshots() if snapshot["name"] == name)
+
+@router.get("/memory/snapshots", response_model=List[SnapshotOut])
+def get_memory_snapshots(admin: User = Depends(get_current_admin)):
+    """
+    Stored tracemalloc snapshots, newest first.
+    """
+    return memory.list_snapshots()
+
+@router.get("/memory/snapshots/{name}", response_model=List[AllocationStatOut])
+def get_memory_snapshot_stats(
+    name: str,
+    base: Optional[str] = Query(None, description="Snapshot to diff against"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=500),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Largest allocation sites in a snapshot, or with base, the largest
+    changes since that snapshot.
+    """
+    stats = memory.compare_snapshots(name, base, group_by, limit)
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Snapshot not found"
+        )
+    return stats
+
+@router.get("/memory/snapshots/{name}/download")
+def download_memory_snapshot(name: str, admin: User = Depends(get_current_admin)):
+    """
+    Download a snapshot; load it with tracemalloc.Snapshot.load().
+    """
+    path = memory.snapshot_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Snapshot not found"
+        )
+    return FileResponse(path, media_type="application/octet-stream", filename=name + memory.SNAPSHOT_SUFFIX)
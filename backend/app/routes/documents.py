@@ -1,18 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.schemas.document import DocumentCreate, DocumentUpdate, DocumentOut
+from app.schemas.document import (
+    DocumentCreate,
+    DocumentUpdate,
+    DocumentOut,
+    DocumentTitleOut,
+    DocumentChangesOut,
+    JsonPatchOperation,
+    DocumentBlocksOut,
+    BlockInsert,
+    BlockOut,
+    AutosaveAck,
+    validate_content_block
+)
+from app.schemas.revision import RevisionSummaryOut, RevisionOut
 from app.schemas.collaborator import CollaboratorAdd, CollaboratorOut, CollaboratorRemove, CollaboratorUpdateRole, ShareLinkCreate, ShareLinkOut
 from app.services.document_service import (
     create_document,
     get_document_by_id,
+    get_document_version_info,
     get_user_documents,
+    get_user_document_versions,
     get_all_documents,
+    get_all_document_versions,
     update_document,
+    DocumentVersionConflict,
+    patch_document_blocks,
+    get_document_blocks,
+    insert_document_block,
+    update_document_block,
+    delete_document_block,
     delete_document,
     search_documents,
+    typeahead_documents,
     get_user_role_for_document,
     add_collaborator,
     remove_collaborator,
@@ -26,10 +49,50 @@ from app.services.document_service import (
     export_document_to_docx
 )
 from app.core.security import get_current_user
+from app.core.etag import document_etag, list_etag, etag_matches, parse_if_match
+from app.services.json_patch import JsonPatchTestFailed
+from app.services.revision_service import list_revisions, get_revision
+from app.services.autosave import autosave_buffer, AutosaveBufferFull, AutosaveFlushFailed, AUTOSAVE_FIELDS
+from app.services.change_feed import change_feed
+from app.services.sync_service import get_changes, InvalidSyncCursor
 from app.models.user import User
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
+MAX_PATCH_OPERATIONS = 500
+
+
+def _require_document_role(db: Session, document_id: int, user_id: int, allowed_roles: List[str]) -> int:
+    """Check the caller's role in one query; returns the current document version"""
+    version_info = get_document_version_info(db, document_id, user_id)
+    
+    if not version_info:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    version, user_role = version_info
+    if user_role not in allowed_roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Access denied. Your role: {user_role or 'none'}. Required role: {' or '.join(allowed_roles)}."
+        )
+    
+    return version
+
+
+def _flush_autosaves(document_id: int) -> None:
+    """Write autosaves acknowledged before an explicit write, so it is applied on top of them"""
+    try:
+        autosave_buffer.flush_before_write(document_id)
+    except AutosaveFlushFailed:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Autosaved changes to this document could not be saved yet. Retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+
 
 @router.post("/", response_model=DocumentOut, status_code=status.HTTP_201_CREATED)
 def create_new_document(
@@ -55,24 +118,41 @@ def create_new_document(
 
 @router.get("/", response_model=List[DocumentOut])
 def list_documents(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all documents for the current user"""
+    # Validate against (id, version) only; bodies are loaded on a miss
+    etag = list_etag(get_user_document_versions(db, current_user.id, skip, limit))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     documents = get_user_documents(db, current_user.id, skip, limit)
+    response.headers.update(headers)
     return documents
 
 
 @router.get("/all", response_model=List[DocumentOut])
 def list_all_documents(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     db: Session = Depends(get_db)
 ):
     """Get all documents (public endpoint for browsing)"""
+    etag = list_etag(get_all_document_versions(db, skip, limit))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     documents = get_all_documents(db, skip, limit)
+    response.headers.update(headers)
     return documents
 
 
@@ -97,29 +177,113 @@ def search_user_documents(
     return documents
 
 
+@router.get("/typeahead", response_model=List[DocumentTitleOut])
+def typeahead_user_documents(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=25),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """As-you-type title lookup across documents the current user can access"""
+    query = q.strip()
+    if not query:
+        return []
+    
+    return typeahead_documents(db, query, current_user.id, limit)
+
+
+@router.get("/sync", response_model=DocumentChangesOut)
+def sync_documents(
+    cursor: str = Query(None, max_length=200),
+    limit: int = Query(100, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Documents created or modified since cursor, plus removed ones.
+
+    Without a cursor, returns every accessible document. Keep calling with
+    the returned cursor while has_more is true; store the last cursor and
+    send it next time to receive only what changed. Documents may repeat
+    across calls and should be applied as upserts.
+    """
+    try:
+        return get_changes(db, current_user.id, cursor, limit)
+    except InvalidSyncCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/changes")
+def stream_document_changes(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of changes to the current user's document list.
+
+    Events: created, updated, deleted, shared, unshared, each with a JSON
+    body naming the document_id. Reconnect with Last-Event-ID to resume; a
+    "reset" event means some changes were missed and the list should be
+    reloaded. See app/services/change_feed.py.
+    """
+    user_id = current_user.id
+    # The stream may stay open for hours; do not hold a pooled connection for it
+    db.close()
+    return StreamingResponse(
+        change_feed.stream(user_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{document_id}", response_model=DocumentOut)
 def get_document(
     document_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get a specific document by ID"""
-    document = get_document_by_id(db, document_id)
+    # One cheap lookup yields both the validator and the caller's role
+    version_info = get_document_version_info(db, document_id, current_user.id)
     
-    if not document:
+    if not version_info:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
         )
     
+    version, user_role = version_info
+    
     # Check if user has access to the document (owner, editor, or reader)
-    user_role = get_user_role_for_document(db, document_id, current_user.id)
     if not user_role:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this document"
         )
     
+    # Read through unflushed autosaves so editors see what they were acknowledged
+    buffered = autosave_buffer.pending(document_id)
+    etag = document_etag(document_id, version, buffered["sequence"] if buffered else None)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    document = get_document_by_id(db, document_id, with_content=True)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    response.headers.update(headers)
+    if buffered:
+        return DocumentOut.model_validate(document).model_copy(update=buffered["fields"])
     return document
 
 
@@ -127,20 +291,27 @@ def get_document(
 def update_existing_document(
     document_id: int,
     document_data: DocumentUpdate,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update a document - owner and editor can update"""
-    document = get_document_by_id(db, document_id)
+    """
+    Update a document - owner and editor can update
     
-    if not document:
+    Send If-Match with the document's ETag to guard against lost updates;
+    a stale ETag is rejected with 412 Precondition Failed.
+    """
+    version_info = get_document_version_info(db, document_id, current_user.id)
+    
+    if not version_info:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found"
         )
     
     # CRITICAL: Check user's role for this document
-    user_role = get_user_role_for_document(db, document_id, current_user.id)
+    _, user_role = version_info
     
     if not user_role:
         raise HTTPException(
@@ -168,9 +339,17 @@ def update_existing_document(
             detail="No fields to update"
         )
     
+    expected_versions = parse_if_match(request.headers.get("if-match"), document_id)
+    # Apply this write on top of any autosaves acknowledged before it
+    _flush_autosaves(document_id)
+    
     try:
-        updated_document = update_document(db, document_id, document_data)
-        return updated_document
+        updated_document = update_document(db, document_id, document_data, expected_versions, author_id=current_user.id)
+    except DocumentVersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Document has been modified since it was fetched. Reload and retry."
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -181,6 +360,334 @@ def update_existing_document(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update document"
         )
+    
+    if not updated_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    response.headers["ETag"] = document_etag(document_id, updated_document.version)
+    return updated_document
+
+
+@router.patch("/{document_id}", response_model=DocumentOut)
+def patch_existing_document(
+    document_id: int,
+    operations: List[JsonPatchOperation],
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Partially update content_blocks with RFC 6902 JSON Patch - owner and editor can patch
+    
+    Paths are rooted at the document, e.g. {"op": "replace", "path": "/content_blocks/4/text", "value": "..."}.
+    Supports If-Match like PUT.
+    """
+    if not operations:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No operations to apply"
+        )
+    
+    if len(operations) > MAX_PATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A patch cannot contain more than {MAX_PATCH_OPERATIONS} operations"
+        )
+    
+    version_info = get_document_version_info(db, document_id, current_user.id)
+    
+    if not version_info:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    _, user_role = version_info
+    
+    if user_role not in ["owner", "editor"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Access denied. Your role '{user_role or 'none'}' cannot edit documents. Required role: owner or editor."
+        )
+    
+    expected_versions = parse_if_match(request.headers.get("if-match"), document_id)
+    _flush_autosaves(document_id)
+    
+    try:
+        patched_document = patch_document_blocks(
+            db,
+            document_id,
+            [operation.model_dump(by_alias=True, exclude_unset=True) for operation in operations],
+            expected_versions,
+            author_id=current_user.id
+        )
+    except DocumentVersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Document has been modified since it was fetched. Reload and retry."
+        )
+    except JsonPatchTestFailed as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to patch document"
+        )
+    
+    if not patched_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    response.headers["ETag"] = document_etag(document_id, patched_document.version)
+    return patched_document
+
+
+@router.put("/{document_id}/autosave", response_model=AutosaveAck, status_code=status.HTTP_202_ACCEPTED)
+def autosave_document(
+    document_id: int,
+    document_data: DocumentUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Buffer an editor autosave - owner and editor can autosave
+    
+    The write is acknowledged before it is committed and is coalesced with
+    other autosaves of the same document; see services/autosave.py for the
+    durability rules. Title changes and If-Match are not supported here; use PUT.
+    """
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor"])
+    
+    fields = document_data.model_dump(exclude_unset=True)
+    unsupported = sorted(set(fields) - set(AUTOSAVE_FIELDS))
+    if unsupported:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Autosave cannot change: {', '.join(unsupported)}. Use PUT /documents/{document_id}."
+        )
+    
+    if not fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update"
+        )
+    
+    # Reject bad blocks now; a buffered write has no caller to report to later
+    try:
+        for block in fields.get("content_blocks") or []:
+            validate_content_block(block)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    try:
+        return autosave_buffer.submit(document_id, fields, current_user.id)
+    except AutosaveBufferFull:
+        pass
+    
+    # Buffer is at capacity: fall back to a synchronous write
+    try:
+        updated_document = update_document(db, document_id, document_data, author_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if not updated_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    return {
+        "document_id": document_id,
+        "sequence": 0,
+        "buffered_fields": [],
+        "flush_within_seconds": 0.0,
+        "durable": True
+    }
+
+
+@router.get("/{document_id}/blocks", response_model=DocumentBlocksOut)
+def list_document_blocks(
+    document_id: int,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Read a window of a structured document's blocks by position - any collaborator can read"""
+    version = _require_document_role(db, document_id, current_user.id, ["owner", "editor", "reader"])
+    total, blocks = get_document_blocks(db, document_id, offset, limit)
+    
+    response.headers["ETag"] = document_etag(document_id, version)
+    return {
+        "document_id": document_id,
+        "version": version,
+        "total": total,
+        "offset": offset,
+        "blocks": blocks
+    }
+
+
+@router.post("/{document_id}/blocks", response_model=BlockOut, status_code=status.HTTP_201_CREATED)
+def insert_block_into_document(
+    document_id: int,
+    block_data: BlockInsert,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Insert one block after after_block_id (or at the start) - owner and editor can edit"""
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor"])
+    expected_versions = parse_if_match(request.headers.get("if-match"), document_id)
+    _flush_autosaves(document_id)
+    
+    try:
+        result = insert_document_block(db, document_id, block_data.block, block_data.after_block_id, expected_versions, current_user.id)
+    except DocumentVersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Document has been modified since it was fetched. Reload and retry."
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    block, version = result
+    response.headers["ETag"] = document_etag(document_id, version)
+    return {"document_id": document_id, "version": version, "block": block}
+
+
+@router.put("/{document_id}/blocks/{block_id}", response_model=BlockOut)
+def replace_document_block(
+    document_id: int,
+    block_id: str,
+    block: dict,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Replace the body of one block - owner and editor can edit"""
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor"])
+    expected_versions = parse_if_match(request.headers.get("if-match"), document_id)
+    _flush_autosaves(document_id)
+    
+    try:
+        result = update_document_block(db, document_id, block_id, block, expected_versions, current_user.id)
+    except DocumentVersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Document has been modified since it was fetched. Reload and retry."
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Block not found"
+        )
+    
+    stored_block, version = result
+    response.headers["ETag"] = document_etag(document_id, version)
+    return {"document_id": document_id, "version": version, "block": stored_block}
+
+
+@router.delete("/{document_id}/blocks/{block_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_document_block(
+    document_id: int,
+    block_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete one block - owner and editor can edit"""
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor"])
+    expected_versions = parse_if_match(request.headers.get("if-match"), document_id)
+    _flush_autosaves(document_id)
+    
+    try:
+        version = delete_document_block(db, document_id, block_id, expected_versions, current_user.id)
+    except DocumentVersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Document has been modified since it was fetched. Reload and retry."
+        )
+    
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Block not found"
+        )
+    
+    response.headers["ETag"] = document_etag(document_id, version)
+    return None
+
+
+@router.get("/{document_id}/revisions", response_model=List[RevisionSummaryOut])
+def list_document_revisions(
+    document_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List a document's revisions, newest first - any collaborator can view"""
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor", "reader"])
+    return list_revisions(db, document_id, skip, limit)
+
+
+@router.get("/{document_id}/revisions/{revision}", response_model=RevisionOut)
+def get_document_revision(
+    document_id: int,
+    revision: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a document as it was at one revision - any collaborator can view"""
+    _require_document_role(db, document_id, current_user.id, ["owner", "editor", "reader"])
+    
+    state = get_revision(db, document_id, revision)
+    if not state:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Revision not found"
+        )
+    
+    return state
 
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -221,6 +728,7 @@ def delete_existing_document(
             detail="Access denied. You are not the owner of this document."
         )
     
+    autosave_buffer.discard(document_id)
     delete_document(db, document_id)
     return None
 
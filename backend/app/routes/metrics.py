@@ -0,0 +1,30 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.core import metrics
+from app.core.memory import update_process_metrics
+from app.core.request_metrics import update_in_flight
+
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Every registered metric in Prometheus text format"""
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if authorization is None or not secrets.compare_digest(authorization, expected):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid metrics token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    update_in_flight()
+    update_process_metrics()
+    return PlainTextResponse(metrics.render_text(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,53 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+class ProfileOut(BaseModel):
+    name: str
+    size: int
+    created_at: datetime
+
+class SlowQueryOut(BaseModel):
+    statement: str
+    parameters: Any
+    duration_ms: float
+    request: Optional[str] = None
+    logged_at: datetime
+    plan: Optional[str] = None
+    plan_status: str
+
+class TracingStart(BaseModel):
+    frames: int = Field(1, ge=1, le=100)  # Traceback depth recorded per allocation
+
+class TracingOut(BaseModel):
+    tracing: bool
+    frames: Optional[int] = None
+    traced_bytes: int
+    traced_peak_bytes: int
+    overhead_bytes: int
+
+class MemoryOut(BaseModel):
+    pid: int
+    rss_bytes: Optional[int] = None
+    peak_rss_bytes: int
+    gc: Dict[str, Any]
+    tracing: TracingOut
+
+class SnapshotOut(BaseModel):
+    name: str
+    size: int
+    created_at: datetime
+
+class AllocationStatOut(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+    size_diff_bytes: Optional[int] = None
+    count_diff: Optional[int] = None
+
+class RouteMemoryOut(BaseModel):
+    route: str
+    requests: int
+    max_peak_bytes: int
+    p95_peak_bytes: int
+    mean_peak_bytes: int
@@ -88,6 +88,24 @@ class DocumentStyles(BaseModel):
     class Config:
         extra = "allow"  # Allow additional custom styles
 
+def validate_content_block(block: Any) -> None:
+    """Validate a single content block, raising ValueError if malformed"""
+    if not isinstance(block, dict):
+        raise ValueError('Each block must be a dictionary')
+    
+    # Check if using character-level content
+    if 'content' in block:
+        if not isinstance(block['content'], list):
+            raise ValueError('Block content must be a list of text spans')
+        for span in block['content']:
+            if not isinstance(span, dict):
+                raise ValueError('Each text span must be a dictionary')
+            if 'text' not in span:
+                raise ValueError('Each text span must have a "text" field')
+    elif 'text' not in block:
+        # Neither content nor text provided
+        raise ValueError('Each block must have either "text" or "content" field')
+
 class DocumentBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=255)
     content: Optional[str] = ""  # For backwards compatibility or simple text
@@ -122,21 +140,7 @@ class DocumentCreate(DocumentBase):
                 raise ValueError('Content blocks must be a list')
             # Validate each block
             for block in v:
-                if not isinstance(block, dict):
-                    raise ValueError('Each block must be a dictionary')
-                
-                # Check if using character-level content
-                if 'content' in block:
-                    if not isinstance(block['content'], list):
-                        raise ValueError('Block content must be a list of text spans')
-                    for span in block['content']:
-                        if not isinstance(span, dict):
-                            raise ValueError('Each text span must be a dictionary')
-                        if 'text' not in span:
-                            raise ValueError('Each text span must have a "text" field')
-                elif 'text' not in block:
-                    # Neither content nor text provided
-                    raise ValueError('Each block must have either "text" or "content" field')
+                validate_content_block(block)
         return v
     
     @field_validator('styles')
@@ -188,9 +192,36 @@ class DocumentUpdate(BaseModel):
                 raise ValueError('Styles must be a valid JSON object')
         return v
 
+class JsonPatchOperation(BaseModel):
+    """A single RFC 6902 operation; paths are rooted at the document, e.g. /content_blocks/3/text"""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str = Field(..., max_length=512)
+    value: Optional[Any] = None
+    from_: Optional[str] = Field(None, alias="from", max_length=512)
+    
+    @field_validator('path', 'from_')
+    @classmethod
+    def validate_pointer(cls, v):
+        if v is not None and v != "" and not v.startswith("/"):
+            raise ValueError('JSON Pointer must be empty or start with "/"')
+        return v
+    
+    class Config:
+        populate_by_name = True
+        json_schema_extra = {
+            "example": {"op": "replace", "path": "/content_blocks/2/text", "value": "Updated paragraph"}
+        }
+
 class DocumentOut(DocumentBase):
+    """
+    content_blocks is [] for a document without blocks. Every block carries
+    a string "id" that the block endpoints address it by: ids sent by the
+    client are kept (as strings), and blocks written without one, with a
+    duplicate or with one over 64 characters get a generated id.
+    """
     id: int
     owner_id: int
+    version: int = 1
     created_at: datetime
     updated_at: datetime
 
@@ -200,3 +231,50 @@ class DocumentOut(DocumentBase):
 class DocumentWithOwner(DocumentOut):
     owner_email: str
     owner_username: Optional[str] = None
+
+
+class DocumentTitleOut(BaseModel):
+    """Lightweight typeahead result - never carries document content"""
+    id: int
+    title: str
+    updated_at: datetime
+
+
+class DocumentRemovedOut(BaseModel):
+    """A document the user can no longer see"""
+    document_id: int
+    reason: Literal["deleted", "revoked"]
+
+
+class DocumentChangesOut(BaseModel):
+    """One page of incremental sync; pass cursor back to continue"""
+    documents: List[DocumentOut]
+    removed: List[DocumentRemovedOut]
+    cursor: str
+    has_more: bool
+
+
+class DocumentBlocksOut(BaseModel):
+    """A window of a structured document's blocks, ordered by position"""
+    document_id: int
+    version: int
+    total: int
+    offset: int
+    blocks: List[Dict[str, Any]]
+
+class BlockInsert(BaseModel):
+    block: Dict[str, Any]
+    after_block_id: Optional[str] = Field(None, max_length=64)  # None inserts at the start
+
+class BlockOut(BaseModel):
+    document_id: int
+    version: int
+    block: Dict[str, Any]
+
+class AutosaveAck(BaseModel):
+    """Acknowledgement of a buffered autosave; durable is False until it is flushed"""
+    document_id: int
+    sequence: int
+    buffered_fields: List[str]
+    flush_within_seconds: float
+    durable: bool
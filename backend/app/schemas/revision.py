@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Literal, Optional
+from datetime import datetime
+
+class RevisionSummaryOut(BaseModel):
+    revision: int
+    kind: Literal["snapshot", "delta"]
+    author_id: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class RevisionOut(RevisionSummaryOut):
+    """A document exactly as it was at one revision"""
+    document_id: int
+    title: str
+    content: Optional[str] = None
+    content_type: Optional[str] = None
+    content_blocks: Optional[List[Dict[str, Any]]] = None
+    styles: Optional[Dict[str, Any]] = None
@@ -0,0 +1,68 @@
+"""
+Production entry point.
+
+Resolves the capacity plan (app/core/capacity.py), prints it, imports the
+app once up front so configuration and import errors stop the launch
+before any worker starts, and runs uvicorn with the planned workers and
+keep-alive. Resolved values are passed to the workers as environment
+variables, so every worker sizes its threadpool and connection pool the
+same way.
+
+Run from the backend directory:
+
+    python -m app.server
+    python -m app.server --workers 4 --port 8080
+    python -m app.server --plan    # print the plan and exit
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+from app.config import settings
+from app.core.capacity import plan_capacity
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers, help="0: derive from CPUs")
+    parser.add_argument("--threads", type=int, default=settings.server_threadpool_size, help="per worker; 0: derive from the pool")
+    parser.add_argument("--keepalive", type=int, default=settings.server_keepalive_seconds)
+    parser.add_argument("--plan", action="store_true", help="print the capacity plan and exit")
+    args = parser.parse_args()
+
+    settings.server_workers = args.workers
+    settings.server_threadpool_size = args.threads
+    settings.server_keepalive_seconds = args.keepalive
+    try:
+        plan = plan_capacity()
+    except ValueError as e:
+        print(f"Cannot start: {e}", file=sys.stderr)
+        return 2
+    print(plan.describe())
+    if args.plan:
+        return 0
+
+    # Workers are separate processes that read settings from the environment
+    os.environ["SERVER_WORKERS"] = str(plan.workers)
+    os.environ["SERVER_THREADPOOL_SIZE"] = str(plan.threadpool_size)
+    os.environ["SERVER_KEEPALIVE_SECONDS"] = str(plan.keepalive_seconds)
+
+    from app.main import app
+
+    uvicorn.run(
+        app if plan.workers == 1 else "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=plan.workers,
+        timeout_keep_alive=plan.keepalive_seconds,
+        proxy_headers=True
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
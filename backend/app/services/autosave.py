@@ -0,0 +1,317 @@
+"""
+Write-behind buffer for editor autosaves.
+
+PUT /documents/{id}/autosave acknowledges a write once it is held here
+instead of committing it. Successive autosaves of the same document are
+coalesced field by field (the latest value of each field wins) and flushed
+as one update_document() call.
+
+Durability rules:
+- An acknowledged autosave lives only in this worker's memory until its
+  flush commits. A crash loses at most autosave_flush_interval_seconds of
+  edits; a clean shutdown flushes everything.
+- A document is flushed when it has been idle for autosave_idle_seconds,
+  or when its oldest unflushed write reaches autosave_flush_interval_seconds,
+  whichever comes first.
+- Flushes are unconditional (no If-Match), so across workers the last
+  flush wins. Clients that need lost-update protection use PUT with If-Match.
+- On this worker, explicit writes (PUT, PATCH, block writes) flush pending
+  state first so they are applied on top of it, and are refused (503) if
+  it cannot be flushed, since the retried flush would overwrite them;
+  DELETE discards it.
+- GET /documents/{id} on this worker reads through the buffer, so editors
+  see their own acknowledged state.
+- Transient flush failures are retried with a backoff, up to
+  autosave_max_flush_attempts times, then dropped; writes that
+  update_document rejects (ValueError) are dropped at once. Both are
+  counted in autosave_dropped_total.
+- Revisions written by a flush are attributed to the user whose autosave
+  was buffered last.
+
+Metrics: autosave_flush_lag_seconds is the time from the first buffered
+write of a flush to its commit; the remaining counters and gauge describe
+acknowledged, coalesced, flushed and failed writes.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from app.config import settings
+from app.core import metrics
+from app.database import SessionLocal
+from app.schemas.document import DocumentUpdate
+from app.services.document_service import update_document
+
+logger = logging.getLogger(__name__)
+
+AUTOSAVE_FIELDS = ("content", "content_type", "content_blocks", "styles")
+
+autosave_writes = metrics.counter("autosave_writes_total", "Autosaves acknowledged into the buffer")
+autosave_coalesced = metrics.counter("autosave_coalesced_total", "Autosaves merged into an already pending write")
+autosave_flushes = metrics.counter("autosave_flushes_total", "Buffered documents written to the database", ["reason"])
+autosave_flush_failures = metrics.counter("autosave_flush_failures_total", "Flushes that failed and were retried or dropped")
+autosave_dropped = metrics.counter(
+    "autosave_dropped_total",
+    "Buffered documents given up on: rejected by update_document or out of retries",
+    ["reason"]
+)
+autosave_flush_lag = metrics.histogram(
+    "autosave_flush_lag_seconds",
+    "Time from the first buffered autosave to its commit",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
+autosave_pending = metrics.gauge("autosave_pending_documents", "Documents with unflushed autosaves")
+
+
+class AutosaveBufferFull(Exception):
+    """Raised when the buffer cannot take another document"""
+
+
+class AutosaveFlushFailed(Exception):
+    """Raised when buffered autosaves that an explicit write must follow could not be written"""
+
+
+class _PendingSave:
+    __slots__ = ("fields", "sequence", "author_id", "first_buffered_at", "last_buffered_at", "attempts", "retry_at")
+
+    def __init__(self, fields: dict, sequence: int, author_id: Optional[int], now: float):
+        self.fields = fields
+        self.sequence = sequence
+        self.author_id = author_id
+        self.first_buffered_at = now
+        self.last_buffered_at = now
+        self.attempts = 0
+        self.retry_at = 0.0
+
+
+class AutosaveBuffer:
+    def __init__(
+        self,
+        session_factory: Callable,
+        flush_interval: float,
+        idle_seconds: float,
+        max_documents: int,
+        max_attempts: int
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.idle_seconds = idle_seconds
+        self.max_documents = max_documents
+        self.max_attempts = max_attempts
+        self._pending: Dict[int, _PendingSave] = {}
+        self._inflight: Dict[int, _PendingSave] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # Per document: [lock, holders]. Serializes flushes of one document so
+        # a request thread waits for an in-progress flush instead of racing
+        # past it, without waiting behind flushes of other documents
+        self._flush_locks: Dict[int, list] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- Buffering ---------------------------------------------------------------
+
+    def submit(self, document_id: int, fields: dict, author_id: Optional[int] = None) -> dict:
+        """Buffer an autosave and return its acknowledgement"""
+        now = time.monotonic()
+        with self._lock:
+            self._sequence += 1
+            entry = self._pending.get(document_id)
+            if entry is None:
+                if len(self._pending) >= self.max_documents:
+                    raise AutosaveBufferFull()
+                entry = self._pending[document_id] = _PendingSave(dict(fields), self._sequence, author_id, now)
+                autosave_pending.set(len(self._pending))
+            else:
+                entry.fields.update(fields)
+                entry.sequence = self._sequence
+                entry.author_id = author_id
+                entry.last_buffered_at = now
+                autosave_coalesced.inc()
+
+            autosave_writes.inc()
+            flush_deadline = min(entry.first_buffered_at + self.flush_interval, now + self.idle_seconds)
+            return {
+                "document_id": document_id,
+                "sequence": entry.sequence,
+                "buffered_fields": sorted(entry.fields),
+                "flush_within_seconds": round(max(flush_deadline - now, 0.0), 3),
+                "durable": False
+            }
+
+    def pending(self, document_id: int) -> Optional[dict]:
+        """
+        Unflushed fields for a document (including a flush in progress) plus
+        the sequence of the latest one, or None if nothing is buffered.
+        """
+        with self._lock:
+            inflight = self._inflight.get(document_id)
+            entry = self._pending.get(document_id)
+            if inflight is None and entry is None:
+                return None
+
+            fields = {}
+            sequence = 0
+            for source in (inflight, entry):
+                if source is not None:
+                    fields.update(source.fields)
+                    sequence = source.sequence
+            return {"fields": fields, "sequence": sequence}
+
+    def discard(self, document_id: int) -> None:
+        """Drop buffered state, e.g. because the document was deleted"""
+        with self._lock:
+            self._pending.pop(document_id, None)
+            autosave_pending.set(len(self._pending))
+
+    # -- Flushing ----------------------------------------------------------------
+
+    @contextmanager
+    def _document_lock(self, document_id: int) -> Iterator[None]:
+        with self._lock:
+            held = self._flush_locks.get(document_id)
+            if held is None:
+                held = self._flush_locks[document_id] = [threading.Lock(), 0]
+            held[1] += 1
+        try:
+            with held[0]:
+                yield
+        finally:
+            with self._lock:
+                held[1] -= 1
+                if held[1] == 0:
+                    del self._flush_locks[document_id]
+
+    def flush_document(self, document_id: int, reason: str = "explicit") -> bool:
+        """Write one document's buffered state now; returns False if nothing was written"""
+        return self._flush(document_id, reason) == "flushed"
+
+    def flush_before_write(self, document_id: int) -> None:
+        """
+        Flush ahead of an explicit write to the document. Raises
+        AutosaveFlushFailed if its buffered state is still pending, in which
+        case the write must not go ahead: the retried flush would overwrite it.
+        """
+        if self._flush(document_id, "explicit") == "retrying":
+            raise AutosaveFlushFailed(document_id)
+
+    def _flush(self, document_id: int, reason: str) -> str:
+        """One flush attempt: "empty", "flushed", "dropped" or "retrying" """
+        if document_id not in self._pending and document_id not in self._inflight:
+            return "empty"
+
+        with self._document_lock(document_id):
+            with self._lock:
+                entry = self._pending.pop(document_id, None)
+                if entry is None:
+                    return "empty"
+                self._inflight[document_id] = entry
+                autosave_pending.set(len(self._pending))
+
+            try:
+                self._write(document_id, entry)
+            except ValueError:
+                # Rejected by update_document; retrying would fail the same way
+                autosave_flush_failures.inc()
+                autosave_dropped.inc(reason="rejected")
+                logger.warning("Dropping autosave for document %s rejected on flush", document_id, exc_info=True)
+                with self._lock:
+                    self._inflight.pop(document_id, None)
+                return "dropped"
+            except Exception:
+                autosave_flush_failures.inc()
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    autosave_dropped.inc(reason="retries")
+                    logger.exception(
+                        "Dropping autosave for document %s after %d failed flushes", document_id, entry.attempts
+                    )
+                    with self._lock:
+                        self._inflight.pop(document_id, None)
+                    return "dropped"
+                logger.warning(
+                    "Autosave flush failed for document %s (attempt %d of %d); will retry",
+                    document_id, entry.attempts, self.max_attempts, exc_info=True
+                )
+                entry.retry_at = time.monotonic() + min(self.flush_interval * 2 ** (entry.attempts - 1), 60.0)
+                with self._lock:
+                    self._inflight.pop(document_id, None)
+                    newer = self._pending.get(document_id)
+                    if newer is not None:
+                        entry.fields.update(newer.fields)
+                        entry.sequence = newer.sequence
+                        entry.author_id = newer.author_id
+                        entry.last_buffered_at = newer.last_buffered_at
+                    self._pending[document_id] = entry
+                    autosave_pending.set(len(self._pending))
+                return "retrying"
+
+            with self._lock:
+                self._inflight.pop(document_id, None)
+            autosave_flushes.inc(reason=reason)
+            autosave_flush_lag.observe(time.monotonic() - entry.first_buffered_at)
+            return "flushed"
+
+    def _write(self, document_id: int, entry: _PendingSave) -> None:
+        db = self.session_factory()
+        try:
+            updated = update_document(
+                db, document_id, DocumentUpdate.model_construct(**entry.fields), author_id=entry.author_id
+            )
+            if updated is None:
+                logger.warning("Dropping autosave for missing document %s", document_id)
+        finally:
+            db.close()
+
+    def flush_due(self) -> int:
+        """Flush documents that went idle or reached the maximum lag"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                (document_id, "max_lag" if now - entry.first_buffered_at >= self.flush_interval else "idle")
+                for document_id, entry in self._pending.items()
+                if now >= entry.retry_at
+                and (now - entry.last_buffered_at >= self.idle_seconds or now - entry.first_buffered_at >= self.flush_interval)
+            ]
+        return sum(self.flush_document(document_id, reason) for document_id, reason in due)
+
+    def flush_all(self, reason: str = "shutdown") -> int:
+        with self._lock:
+            document_ids = list(self._pending)
+        return sum(self.flush_document(document_id, reason) for document_id in document_ids)
+
+    # -- Background flusher ------------------------------------------------------
+
+    def _run(self) -> None:
+        tick = max(min(self.idle_seconds, self.flush_interval) / 2, 0.05)
+        while not self._stop.wait(tick):
+            try:
+                self.flush_due()
+            except Exception:
+                logger.exception("Autosave flusher iteration failed")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="autosave-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher and write everything still buffered"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
+
+
+autosave_buffer = AutosaveBuffer(
+    session_factory=SessionLocal,
+    flush_interval=settings.autosave_flush_interval_seconds,
+    idle_seconds=settings.autosave_idle_seconds,
+    max_documents=settings.autosave_max_documents,
+    max_attempts=settings.autosave_max_flush_attempts
+)
@@ -0,0 +1,279 @@
+"""
+Block-granular storage for structured documents.
+
+Each block is a row in document_blocks with a stable block_id and a
+fractional ordering key (position). Keys are base-36 fractions compared
+byte-wise, so a block can always be inserted between two neighbours by
+writing a single row; when keys grow too long the document is rebalanced.
+"""
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.document_block import DocumentBlock
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+MAX_KEY_LENGTH = 48
+MAX_BLOCK_ID_LENGTH = 64  # document_blocks.block_id is String(64)
+
+
+# -- Fractional ordering keys -------------------------------------------------
+# Keys represent fractions in (0, 1) and never end in "0", so there is
+# always room for another key between any two of them.
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _key_after(a: str) -> str:
+    # Appending bumps the leading digit, so keys grow one character per ~35 appends
+    if not a:
+        return DIGITS[BASE // 2]
+    digit = DIGITS.index(a[0])
+    if digit < BASE - 1:
+        return DIGITS[digit + 1]
+    return a[0] + _key_after(a[1:])
+
+
+def _key_before(b: str) -> str:
+    digit = DIGITS.index(b[0])
+    if digit >= 2:
+        return DIGITS[digit - 1]
+    if digit == 1:
+        return b[:1] if len(b) > 1 else DIGITS[0] + DIGITS[BASE // 2]
+    return DIGITS[0] + _key_before(b[1:])
+
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """Return a key sorting strictly between a and b (None means open-ended)"""
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"Invalid key range: {a!r} >= {b!r}")
+    if a is None and b is None:
+        return DIGITS[BASE // 2]
+    if a is None:
+        return _key_before(b)
+    if b is None:
+        return _key_after(a)
+    return _midpoint(a, b)
+
+
+def evenly_spaced_keys(count: int) -> List[str]:
+    """Short, evenly distributed keys for bulk loads and rebalancing"""
+    width = 1
+    while BASE ** width <= count + 1:
+        width += 1
+    span = BASE ** width
+    keys = []
+    for index in range(1, count + 1):
+        value = index * span // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, remainder = divmod(value, BASE)
+            digits.append(DIGITS[remainder])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+# -- Reads ----------------------------------------------------------------------
+
+def count_blocks(db: Session, document_id: int) -> int:
+    """Number of blocks stored for a document"""
+    return db.query(func.count(DocumentBlock.id)).filter(
+        DocumentBlock.document_id == document_id
+    ).scalar()
+
+
+def block_index(db: Session, document_id: int, block_id: str) -> Optional[int]:
+    """Zero-based position of a block in its document, or None if it does not exist"""
+    position = db.query(DocumentBlock.position).filter(
+        DocumentBlock.document_id == document_id,
+        DocumentBlock.block_id == block_id
+    ).scalar()
+    if position is None:
+        return None
+    return db.query(func.count(DocumentBlock.id)).filter(
+        DocumentBlock.document_id == document_id,
+        DocumentBlock.position < position
+    ).scalar()
+
+
+def load_blocks(db: Session, document_id: int, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+    """
+    Range read of a document's blocks by position.
+
+    Served by the (document_id, position) index, so reading a window of a
+    long document does not pull the rest of it.
+    """
+    query = db.query(DocumentBlock.block_id, DocumentBlock.data).filter(
+        DocumentBlock.document_id == document_id
+    ).order_by(DocumentBlock.position).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return [{"id": row.block_id, **row.data} for row in query.all()]
+
+
+# -- Writes ---------------------------------------------------------------------
+
+def _split_block(block: dict) -> tuple:
+    """Block id and data; ids that do not fit the column count as missing, as in the migration"""
+    data = dict(block)
+    block_id = data.pop("id", None)
+    if block_id in (None, ""):
+        return None, data
+    block_id = str(block_id)
+    return (block_id if len(block_id) <= MAX_BLOCK_ID_LENGTH else None), data
+
+
+def _new_block_id() -> str:
+    return uuid.uuid4().hex
+
+
+def rebalance_positions(db: Session, document_id: int) -> None:
+    """Rewrite every position of a document with short evenly spaced keys"""
+    rows = db.query(DocumentBlock).filter(
+        DocumentBlock.document_id == document_id
+    ).order_by(DocumentBlock.position).all()
+    for row, key in zip(rows, evenly_spaced_keys(len(rows))):
+        row.position = key
+    db.flush()
+
+
+def replace_blocks(db: Session, document_id: int, blocks: Optional[List[dict]]) -> None:
+    """
+    Make the stored blocks match the given list, writing only what changed.
+
+    Blocks are matched by their "id"; blocks without one (or with a
+    duplicate id) are stored as new blocks. Unchanged blocks are not
+    written, and existing positions are kept whenever the surviving blocks
+    keep their relative order.
+    """
+    blocks = blocks or []
+    existing: Dict[str, DocumentBlock] = {
+        row.block_id: row
+        for row in db.query(DocumentBlock).filter(DocumentBlock.document_id == document_id).all()
+    }
+
+    incoming = []
+    seen = set()
+    for block in blocks:
+        block_id, data = _split_block(block)
+        if block_id is None or block_id in seen:
+            block_id = _new_block_id()
+        seen.add(block_id)
+        incoming.append((block_id, data))
+
+    for block_id, row in existing.items():
+        if block_id not in seen:
+            db.delete(row)
+
+    kept_positions = [existing[block_id].position for block_id, _ in incoming if block_id in existing]
+    order_preserved = all(a < b for a, b in zip(kept_positions, kept_positions[1:]))
+
+    if order_preserved:
+        positions = []
+        upcoming = kept_positions + [None]
+        next_index = 0
+        previous = None
+        for block_id, _ in incoming:
+            if block_id in existing:
+                previous = existing[block_id].position
+                next_index += 1
+            else:
+                previous = key_between(previous, upcoming[next_index])
+            positions.append(previous)
+    else:
+        positions = evenly_spaced_keys(len(incoming))
+
+    needs_rebalance = False
+    for (block_id, data), position in zip(incoming, positions):
+        row = existing.get(block_id)
+        if row is None:
+            db.add(DocumentBlock(document_id=document_id, block_id=block_id, position=position, data=data))
+        else:
+            if row.data != data:
+                row.data = data
+            if row.position != position:
+                row.position = position
+        needs_rebalance = needs_rebalance or len(position) > MAX_KEY_LENGTH
+
+    db.flush()
+    if needs_rebalance:
+        rebalance_positions(db, document_id)
+
+
+def _neighbour_positions(db: Session, document_id: int, after_block_id: Optional[str]) -> tuple:
+    base = db.query(DocumentBlock.position).filter(DocumentBlock.document_id == document_id)
+    if after_block_id is None:
+        lower = None
+        upper = base.order_by(DocumentBlock.position).limit(1).scalar()
+        return lower, upper
+
+    lower = base.filter(DocumentBlock.block_id == after_block_id).scalar()
+    if lower is None:
+        raise ValueError(f"Block '{after_block_id}' not found")
+    upper = base.filter(DocumentBlock.position > lower).order_by(DocumentBlock.position).limit(1).scalar()
+    return lower, upper
+
+
+def insert_block(db: Session, document_id: int, block: dict, after_block_id: Optional[str] = None) -> dict:
+    """
+    Insert one block after another (or at the start) with a single row write.
+
+    Returns the stored block including its id.
+    """
+    block_id, data = _split_block(block)
+    if block_id is None:
+        block_id = _new_block_id()
+    elif db.query(DocumentBlock.id).filter(
+        DocumentBlock.document_id == document_id,
+        DocumentBlock.block_id == block_id
+    ).first():
+        raise ValueError(f"Block '{block_id}' already exists")
+
+    lower, upper = _neighbour_positions(db, document_id, after_block_id)
+    position = key_between(lower, upper)
+    db.add(DocumentBlock(document_id=document_id, block_id=block_id, position=position, data=data))
+    db.flush()
+    if len(position) > MAX_KEY_LENGTH:
+        rebalance_positions(db, document_id)
+    return {"id": block_id, **data}
+
+
+def update_block(db: Session, document_id: int, block_id: str, block: dict) -> Optional[dict]:
+    """Replace the body of one block in place; returns None if it does not exist"""
+    row = db.query(DocumentBlock).filter(
+        DocumentBlock.document_id == document_id,
+        DocumentBlock.block_id == block_id
+    ).first()
+    if row is None:
+        return None
+
+    _, data = _split_block(block)
+    row.data = data
+    db.flush()
+    return {"id": block_id, **data}
+
+
+def delete_block(db: Session, document_id: int, block_id: str) -> bool:
+    """Delete one block; returns False if it does not exist"""
+    deleted = db.query(DocumentBlock).filter(
+        DocumentBlock.document_id == document_id,
+        DocumentBlock.block_id == block_id
+    ).delete(synchronize_session=False)
+    return deleted > 0
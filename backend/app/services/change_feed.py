@@ -0,0 +1,260 @@
+"""
+Per-user feed of document list changes, streamed over Server-Sent Events.
+
+Every worker tails the document outbox (services/outbox.py) and turns the
+mutations that can change what a user's document list shows into events:
+
+    created    the owner created a document
+    updated    title, content or blocks changed (every collaborator)
+    deleted    the document is gone (every former collaborator)
+    shared     the user gained access or their role changed
+    unshared   the user lost access
+
+Each event carries just enough to patch a cached list entry (document_id,
+plus title, version, updated_at or role where known); clients fetch the
+document itself if they need more. Consecutive updates of a document that
+arrive in one outbox batch are sent as one event.
+
+Events are numbered by a per-worker sequence and retained in a ring buffer
+of change_feed_buffer_size entries shared by all users. SSE ids are
+"<epoch>-<seq>", where epoch changes whenever the worker restarts, so a
+Last-Event-ID from another worker or an earlier process is recognised as
+unresumable. When the events after a client's Last-Event-ID are no longer
+all retained, the stream starts with a "reset" event and the client should
+reload its list once. Since every worker reads the outbox, a client sees
+changes made through any worker.
+
+Subscribers are cheap: a cursor and an asyncio.Event, woken only when an
+event addresses their user, with payloads serialized once per event.
+Nothing is recorded while no one is or recently was subscribed
+(change_feed_resume_seconds); the sequence skips ahead so a late resume
+gets a reset instead of a silent gap.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import metrics
+from app.models.document import Document
+from app.models.document_collaborator import DocumentCollaborator
+from app.models.outbox import OutboxEvent
+from app.services.outbox import OutboxConsumer
+
+FEED_EVENTS = ("created", "updated", "deleted", "shared", "unshared")
+
+feed_events = metrics.counter("change_feed_events_total", "Change events recorded for subscribers", ["type"])
+feed_skipped = metrics.counter("change_feed_skipped_total", "Change events not recorded because no one was subscribed")
+feed_resets = metrics.counter("change_feed_resets_total", "Streams that could not resume from Last-Event-ID")
+feed_subscribers = metrics.gauge("change_feed_subscribers", "Open change feed streams")
+
+
+def _isoformat(value) -> str:
+    # Timestamps are rendered the way the REST responses render them
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+class _Event:
+    __slots__ = ("seq", "user_ids", "frame")
+
+    def __init__(self, seq: int, user_ids: FrozenSet[int], frame: str):
+        self.seq = seq
+        self.user_ids = user_ids
+        self.frame = frame
+
+
+class Subscriber:
+    __slots__ = ("user_id", "cursor", "wakeup", "loop")
+
+    def __init__(self, user_id: int, cursor: int):
+        self.user_id = user_id
+        # Sequence of the last event this stream has sent or skipped past
+        self.cursor = cursor
+        self.wakeup = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int, heartbeat_seconds: float, resume_seconds: float):
+        self.heartbeat_seconds = heartbeat_seconds
+        self.resume_seconds = resume_seconds
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events: deque = deque(maxlen=buffer_size)
+        self._seq = 0
+        # Streams resuming from a sequence below this may have missed events
+        self._floor = 0
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self._last_unsubscribed = float("-inf")
+        # publish() runs on request threads, streams on the event loop
+        self._lock = threading.Lock()
+
+    # -- Publishing -------------------------------------------------------------
+
+    @property
+    def active(self) -> bool:
+        """Whether anyone could receive or resume an event published now"""
+        return bool(self._subscribers) or time.monotonic() - self._last_unsubscribed < self.resume_seconds
+
+    def publish(self, event_type: str, document_id: int, user_ids: Iterable[int], **data) -> None:
+        """Record an event for the given users; call after the change is committed"""
+        with self._lock:
+            self._seq += 1
+            if not self.active:
+                self._events.clear()
+                self._floor = self._seq
+                feed_skipped.inc()
+                return
+            payload = json.dumps({"type": event_type, "document_id": document_id, **data}, default=_isoformat, separators=(",", ":"))
+            event = _Event(self._seq, frozenset(user_ids), f"id: {self.epoch}-{self._seq}\nevent: {event_type}\ndata: {payload}\n\n")
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0].seq
+            self._events.append(event)
+            woken = [
+                subscriber
+                for user_id in event.user_ids
+                for subscriber in self._subscribers.get(user_id, ())
+            ]
+        feed_events.inc(type=event_type)
+        for subscriber in woken:
+            subscriber.loop.call_soon_threadsafe(subscriber.wakeup.set)
+
+    # -- Subscribing ------------------------------------------------------------
+
+    def _resume_point(self, last_event_id: Optional[str]) -> Tuple[int, bool]:
+        """(cursor to stream from, whether the client must reload first)"""
+        if last_event_id is None:
+            return self._seq, False
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return self._seq, True
+        if int(seq) < self._floor:
+            return self._seq, True
+        return int(seq), False
+
+    def subscribe(self, user_id: int, last_event_id: Optional[str] = None) -> Tuple[Subscriber, bool]:
+        with self._lock:
+            cursor, reset = self._resume_point(last_event_id)
+            subscriber = Subscriber(user_id, cursor)
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            feed_subscribers.set(sum(len(streams) for streams in self._subscribers.values()))
+        return subscriber, reset
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            streams = self._subscribers.get(subscriber.user_id)
+            if streams is not None:
+                streams.discard(subscriber)
+                if not streams:
+                    del self._subscribers[subscriber.user_id]
+            self._last_unsubscribed = time.monotonic()
+            feed_subscribers.set(sum(len(streams) for streams in self._subscribers.values()))
+
+    def _read(self, subscriber: Subscriber) -> List[str]:
+        """Frames addressed to the subscriber since its cursor; advances the cursor"""
+        with self._lock:
+            if subscriber.cursor >= self._seq:
+                return []
+            if subscriber.cursor < self._floor:
+                # Fell behind by more than the buffer between two reads
+                feed_resets.inc()
+                subscriber.cursor = self._seq
+                return [self._reset_frame(self._seq)]
+            start = max(subscriber.cursor - self._events[0].seq + 1, 0)
+            frames = [
+                event.frame
+                for event in itertools.islice(self._events, start, None)
+                if subscriber.user_id in event.user_ids
+            ]
+            subscriber.cursor = self._seq
+            return frames
+
+    def _reset_frame(self, seq: int) -> str:
+        return f"id: {self.epoch}-{seq}\nevent: reset\ndata: {{}}\n\n"
+
+    async def stream(self, user_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE frames for one client until it disconnects"""
+        subscriber, reset = self.subscribe(user_id, last_event_id)
+        try:
+            # Sends the headers right away so the client knows it is connected
+            yield ": connected\n\n"
+            if reset:
+                feed_resets.inc()
+                yield self._reset_frame(subscriber.cursor)
+            while True:
+                subscriber.wakeup.clear()
+                frames = self._read(subscriber)
+                if frames:
+                    yield "".join(frames)
+                    continue
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+change_feed = ChangeFeed(
+    buffer_size=settings.change_feed_buffer_size,
+    heartbeat_seconds=settings.change_feed_heartbeat_seconds,
+    resume_seconds=settings.change_feed_resume_seconds
+)
+
+
+class ChangeFeedConsumer(OutboxConsumer):
+    """Tails the outbox into this worker's change feed"""
+
+    name = "change_feed"
+    durable = False
+
+    def __init__(self, feed: ChangeFeed):
+        super().__init__()
+        self.feed = feed
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        events = [event for event in events if event.event_type in FEED_EVENTS]
+        if not self.feed.active:
+            # Nobody to tell; publishing still moves the sequence on
+            for event in events:
+                self.feed.publish(event.event_type, event.document_id, ())
+            return
+
+        last_update = {event.document_id: event.id for event in events if event.event_type == "updated"}
+        events = [event for event in events if event.event_type != "updated" or last_update[event.document_id] == event.id]
+        listed = {event.document_id for event in events if event.event_type in ("created", "updated")}
+        details = {
+            row.id: row
+            for row in db.query(Document.id, Document.title, Document.version, Document.updated_at).filter(
+                Document.id.in_(listed)
+            )
+        } if listed else {}
+        collaborators = defaultdict(list)
+        if last_update:
+            for row in db.query(DocumentCollaborator.document_id, DocumentCollaborator.user_id).filter(
+                DocumentCollaborator.document_id.in_(last_update)
+            ):
+                collaborators[row.document_id].append(row.user_id)
+
+        for event in events:
+            data = dict(event.data or {})
+            user_ids = data.pop("user_ids", None)
+            if user_ids is None:
+                user_ids = collaborators[event.document_id]
+            if event.document_id in listed:
+                row = details.get(event.document_id)
+                if row is None:
+                    # Deleted since; its own event follows
+                    continue
+                data.update(title=row.title, version=row.version, updated_at=row.updated_at)
+            self.feed.publish(event.event_type, event.document_id, user_ids, **data)
+
+
+change_feed_consumer = ChangeFeedConsumer(change_feed)
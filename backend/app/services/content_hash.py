@@ -0,0 +1,63 @@
+"""
+Content fingerprint used to detect no-op document writes.
+
+documents.content_hash is three fixed-width digests concatenated, one each
+for content, content_blocks and styles. Keeping them separate lets a
+partial update compute the new fingerprint without reading the fields it
+does not touch. A segment of UNKNOWN_SEGMENT (or a NULL hash) means the
+field changed outside a full write and must not be trusted.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+HASHED_FIELDS = ("content", "content_blocks", "styles")
+SEGMENT_LENGTH = 32
+HASH_LENGTH = SEGMENT_LENGTH * len(HASHED_FIELDS)
+UNKNOWN_SEGMENT = "-" * SEGMENT_LENGTH
+
+
+def field_digest(field: str, value: Any) -> str:
+    """Digest of one hashed field in a canonical form"""
+    if field == "content_blocks":
+        # Stored documents without blocks read back as None
+        value = value or []
+    if value is None:
+        encoded = b"\x00null"
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+    else:
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=SEGMENT_LENGTH // 2).hexdigest()
+
+
+def split_hash(content_hash: Optional[str]) -> Dict[str, str]:
+    if not content_hash or len(content_hash) != HASH_LENGTH:
+        return {field: UNKNOWN_SEGMENT for field in HASHED_FIELDS}
+    return {
+        field: content_hash[index * SEGMENT_LENGTH:(index + 1) * SEGMENT_LENGTH]
+        for index, field in enumerate(HASHED_FIELDS)
+    }
+
+
+def compute_hash(values: Dict[str, Any], base: Optional[str] = None) -> str:
+    """
+    Fingerprint after writing values on top of the document hashed as base.
+
+    Fields missing from values keep their segment from base.
+    """
+    segments = split_hash(base)
+    for field in HASHED_FIELDS:
+        if field in values:
+            segments[field] = field_digest(field, values[field])
+    return "".join(segments[field] for field in HASHED_FIELDS)
+
+
+def unchanged_fields(values: Dict[str, Any], content_hash: Optional[str]) -> bool:
+    """True if every hashed field in values matches the stored fingerprint"""
+    segments = split_hash(content_hash)
+    return all(
+        segments[field] != UNKNOWN_SEGMENT and segments[field] == field_digest(field, values[field])
+        for field in HASHED_FIELDS
+        if field in values
+    )
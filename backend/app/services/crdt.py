@@ -0,0 +1,473 @@
+"""
+Sequence CRDT for concurrent block editing.
+
+A document is a replicated growable array (RGA) of blocks; each block holds
+an RGA of characters, per-character styles and last-writer-wins block
+attributes (type, styles, ...). Every element has an id "<lamport>@<site>",
+ids are totally ordered by (lamport, site), and an insert names the element
+it goes after. Replicas that apply the same operations in any causal order
+end up in the same state, so the server applies operations as they arrive
+and relays them unchanged; nothing is transformed.
+
+Operations (one JSON object per edit):
+
+    {"op": "block_insert", "id": "12@7", "after": "<block id>" | null, "attrs": {"type": "heading1"}}
+    {"op": "block_delete", "block": "<block id>"}
+    {"op": "block_set", "id": "13@7", "block": "<block id>", "key": "styles", "value": {...}}
+    {"op": "insert", "id": "14@7", "block": "<block id>", "after": "<char id>" | null, "text": "abc", "styles": {...}}
+    {"op": "delete", "block": "<block id>", "ids": ["14@7", "16@7"]}
+    {"op": "format", "id": "17@7", "block": "<block id>", "ids": ["14@7", "15@7"], "styles": {...}}
+
+A multi-character insert takes consecutive ids ("abc" above is 14@7, 15@7
+and 16@7). format replaces the styles of the given characters, later
+lamport wins. A new id must be greater than every id its author has seen,
+so clients keep a Lamport clock starting from the snapshot's "clock".
+
+Deleted elements stay behind as tombstones so concurrent operations can
+still refer to them. Persisted block lists only hold what is visible, so a
+state reloaded from the database is compacted: blocks keep their stored
+block_id and their characters are renumbered "1@", "2@", ... per block.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+from app.schemas.document import DocumentUpdate
+from app.services.block_store import load_blocks
+from app.services.document_service import update_document
+
+Order = Tuple[int, str]
+Mark = Tuple[Order, Dict[str, Any]]
+
+HEAD = ""  # Sentinel every sequence starts from; never a valid id
+RESERVED_ATTRS = ("id", "text", "content")
+MAX_LAMPORT = 2 ** 53
+MAX_ID_LENGTH = 64  # Block ids are stored in document_blocks.block_id, a String(64)
+OPERATIONS = ("insert", "delete", "format", "block_insert", "block_delete", "block_set")
+
+
+class InvalidOperation(ValueError):
+    """Raised for malformed operations and ones that refer to unknown elements"""
+
+
+def parse_id(value: Any) -> Order:
+    if not isinstance(value, str):
+        raise InvalidOperation(f"Invalid element id {value!r}")
+    if len(value) > MAX_ID_LENGTH:
+        raise InvalidOperation(f"Element id is longer than {MAX_ID_LENGTH} characters")
+    lamport, separator, site = value.partition("@")
+    if not separator or not site or not (lamport.isascii() and lamport.isdigit()) or not 1 <= int(lamport) <= MAX_LAMPORT:
+        raise InvalidOperation(f"Invalid element id {value!r}, expected '<lamport>@<site>'")
+    return int(lamport), site
+
+
+class Sequence:
+    """RGA as a linked list over element ids; elements are only ever marked deleted"""
+
+    __slots__ = ("next", "order", "deleted")
+
+    def __init__(self):
+        self.next: Dict[str, Optional[str]] = {HEAD: None}
+        self.order: Dict[str, Order] = {}
+        self.deleted: Set[str] = set()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __iter__(self) -> Iterator[str]:
+        next_map = self.next
+        key = next_map[HEAD]
+        while key is not None:
+            yield key
+            key = next_map[key]
+
+    def insert(self, keys: List[str], orders: List[Order], after: Optional[str]) -> None:
+        """
+        Insert a run of elements with consecutive ids after `after`.
+
+        Elements already following `after` with a greater id were inserted
+        concurrently (or after them) and stay in front; that is the whole
+        merge rule. The rest of the run links directly, since nothing can
+        sit between two elements inserted together.
+        """
+        next_map = self.next
+        previous = HEAD if after is None else after
+        if previous not in next_map:
+            raise InvalidOperation(f"Unknown element '{after}'")
+
+        order_map = self.order
+        first = orders[0]
+        following = next_map[previous]
+        while following is not None and order_map[following] > first:
+            previous = following
+            following = next_map[following]
+
+        for key, order in zip(keys, orders):
+            next_map[previous] = key
+            order_map[key] = order
+            previous = key
+        next_map[previous] = following
+
+    def append(self, key: str, order: Order, tail: str) -> str:
+        """Link an element after the current tail while loading; returns the new tail"""
+        self.next[tail] = key
+        self.next[key] = None
+        self.order[key] = order
+        return key
+
+    def check(self, keys: List[Any]) -> None:
+        for key in keys:
+            if key not in self.order:
+                raise InvalidOperation(f"Unknown element '{key}'")
+
+
+class Block:
+    __slots__ = ("attrs", "stamps", "text", "chars", "marks", "rich")
+
+    def __init__(self, attrs: Dict[str, Any], stamp: Optional[Order] = None):
+        self.attrs = attrs
+        self.stamps: Dict[str, Order] = {key: stamp for key in attrs} if stamp else {}
+        self.text = Sequence()
+        self.chars: Dict[str, str] = {}
+        self.marks: Dict[str, Mark] = {}
+        # Blocks with any character styling are stored as "content" spans
+        self.rich = False
+
+    def visible_chars(self) -> List[str]:
+        deleted = self.text.deleted
+        return [key for key in self.text if key not in deleted]
+
+    def body(self) -> Dict[str, Any]:
+        """The block's text in the content_blocks shape"""
+        chars = self.chars
+        keys = self.visible_chars()
+        if not self.rich:
+            return {"text": "".join(chars[key] for key in keys)}
+
+        spans: List[dict] = []
+        current: Optional[Dict[str, Any]] = None
+        run: List[str] = []
+        for key in keys:
+            mark = self.marks.get(key)
+            styles = mark[1] if mark else {}
+            if run and styles != current:
+                spans.append({"text": "".join(run), "styles": current})
+                run = []
+            current = styles
+            run.append(chars[key])
+        if run:
+            spans.append({"text": "".join(run), "styles": current})
+        return {"content": spans}
+
+
+class CRDTDocument:
+    """Replica of one document's blocks; the server keeps one per open room"""
+
+    def __init__(self):
+        self.blocks = Sequence()
+        self.block_data: Dict[str, Block] = {}
+        self.clock = 0
+
+    # -- Loading --------------------------------------------------------------
+
+    @classmethod
+    def from_blocks(cls, blocks: List[dict]) -> "CRDTDocument":
+        """Compacted state from a content_blocks list"""
+        document = cls()
+        tail = HEAD
+        for index, stored in enumerate(blocks, start=1):
+            attrs = dict(stored)
+            key = str(attrs.pop("id", None) or f"{index}@")
+            text = attrs.pop("text", None)
+            spans = attrs.pop("content", None)
+            try:
+                # Ids persisted by an earlier room: new ids must sort after them
+                document.clock = max(document.clock, parse_id(key)[0])
+            except InvalidOperation:
+                pass
+
+            block = Block(attrs)
+            tail = document.blocks.append(key, (index, ""), tail)
+            document.block_data[key] = block
+
+            char_tail = HEAD
+            position = 0
+            if spans is not None:
+                block.rich = True
+                for span in spans:
+                    styles = span.get("styles") or {}
+                    mark = ((0, ""), styles) if styles else None
+                    for char in span.get("text") or "":
+                        position += 1
+                        char_key = f"{position}@"
+                        char_tail = block.text.append(char_key, (position, ""), char_tail)
+                        block.chars[char_key] = char
+                        if mark:
+                            block.marks[char_key] = mark
+            else:
+                for char in text or "":
+                    position += 1
+                    char_key = f"{position}@"
+                    char_tail = block.text.append(char_key, (position, ""), char_tail)
+                    block.chars[char_key] = char
+            document.clock = max(document.clock, position, index)
+        return document
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "CRDTDocument":
+        """Replica of another replica's snapshot(), tombstones included"""
+        document = cls()
+        document.clock = snapshot["clock"]
+        tail = HEAD
+        for entry in snapshot["blocks"]:
+            key = entry["id"]
+            block = Block(dict(entry["attrs"]))
+            block.stamps = {name: tuple(stamp) for name, stamp in entry["stamps"].items()}
+            block.rich = entry["rich"]
+            tail = document.blocks.append(key, tuple(entry["order"]), tail)
+            document.block_data[key] = block
+            if entry["deleted"]:
+                document.blocks.deleted.add(key)
+
+            char_tail = HEAD
+            for lamport, site, text, mark in entry["runs"]:
+                mark = ((mark[0][0], mark[0][1]), mark[1]) if mark else None
+                deleted = isinstance(text, int)
+                for offset in range(text if deleted else len(text)):
+                    char_key = f"{lamport + offset}@{site}"
+                    char_tail = block.text.append(char_key, (lamport + offset, site), char_tail)
+                    block.chars[char_key] = "" if deleted else text[offset]
+                    if deleted:
+                        block.text.deleted.add(char_key)
+                    if mark:
+                        block.marks[char_key] = mark
+        return document
+
+    # -- Operations -----------------------------------------------------------
+
+    def _stamp(self, op: dict, site: Optional[str], count: int = 1) -> Order:
+        order = parse_id(op.get("id"))
+        if site is not None and order[1] != site:
+            raise InvalidOperation(f"Element ids from this connection must end in '@{site}'")
+        last = order[0] + count - 1
+        if last > MAX_LAMPORT:
+            raise InvalidOperation(f"Element ids must stay at or below {MAX_LAMPORT}")
+        if last > self.clock:
+            self.clock = last
+        return order
+
+    def _block(self, key: Any) -> Block:
+        block = self.block_data.get(key) if isinstance(key, str) else None
+        if block is None:
+            raise InvalidOperation(f"Unknown block {key!r}")
+        return block
+
+    def _ids(self, op: dict) -> List[str]:
+        ids = op.get("ids")
+        if not isinstance(ids, list) or not ids or not all(isinstance(key, str) for key in ids):
+            raise InvalidOperation("'ids' must be a non-empty list of element ids")
+        return ids
+
+    def apply(self, op: Any, site: Optional[str] = None) -> bool:
+        """
+        Apply one operation; returns False if it was already applied.
+
+        When site is given, new element ids must belong to it, so one
+        connection cannot write under another's ids. Raises
+        InvalidOperation without changing anything if the operation is
+        malformed or refers to something this replica has never seen.
+        """
+        if not isinstance(op, dict):
+            raise InvalidOperation("Each operation must be an object")
+        kind = op.get("op")
+
+        if kind == "insert":
+            block = self._block(op.get("block"))
+            text = op.get("text")
+            if not isinstance(text, str) or not text:
+                raise InvalidOperation("'text' must be a non-empty string")
+            styles = op.get("styles")
+            if styles is not None and not isinstance(styles, dict):
+                raise InvalidOperation("'styles' must be an object")
+            after = op.get("after")
+            if after is not None and after not in block.text:
+                raise InvalidOperation(f"Unknown element {after!r}")
+
+            lamport, author = self._stamp(op, site, len(text))
+            if f"{lamport}@{author}" in block.text:
+                return False
+            if len(text) == 1:
+                keys = [f"{lamport}@{author}"]
+                orders = [(lamport, author)]
+            else:
+                orders = [(lamport + offset, author) for offset in range(len(text))]
+                keys = [f"{clock}@{author}" for clock, _ in orders]
+            block.text.insert(keys, orders, after)
+            block.chars.update(zip(keys, text))
+            if styles:
+                mark = ((lamport, author), styles)
+                for key in keys:
+                    block.marks[key] = mark
+                block.rich = True
+            return True
+
+        if kind == "delete":
+            block = self._block(op.get("block"))
+            ids = self._ids(op)
+            block.text.check(ids)
+            deleted = block.text.deleted
+            changed = any(key not in deleted for key in ids)
+            deleted.update(ids)
+            return changed
+
+        if kind == "format":
+            block = self._block(op.get("block"))
+            ids = self._ids(op)
+            styles = op.get("styles")
+            if not isinstance(styles, dict):
+                raise InvalidOperation("'styles' must be an object")
+            block.text.check(ids)
+            order = self._stamp(op, site)
+            mark = (order, styles)
+            changed = False
+            marks = block.marks
+            for key in ids:
+                current = marks.get(key)
+                if current is None or current[0] < order:
+                    marks[key] = mark
+                    changed = True
+            block.rich = True
+            return changed
+
+        if kind == "block_insert":
+            attrs = op.get("attrs") or {}
+            if not isinstance(attrs, dict) or any(name in attrs for name in RESERVED_ATTRS):
+                raise InvalidOperation(f"'attrs' must be an object without {', '.join(RESERVED_ATTRS)}")
+            after = op.get("after")
+            if after is not None and after not in self.blocks:
+                raise InvalidOperation(f"Unknown block {after!r}")
+            order = self._stamp(op, site)
+            key = op["id"]
+            if key in self.blocks:
+                return False
+            self.blocks.insert([key], [order], after)
+            self.block_data[key] = Block(dict(attrs), order)
+            return True
+
+        if kind == "block_delete":
+            key = op.get("block")
+            self._block(key)
+            if key in self.blocks.deleted:
+                return False
+            self.blocks.deleted.add(key)
+            return True
+
+        if kind == "block_set":
+            block = self._block(op.get("block"))
+            name = op.get("key")
+            if not isinstance(name, str) or name in RESERVED_ATTRS:
+                raise InvalidOperation(f"'key' must be a block attribute other than {', '.join(RESERVED_ATTRS)}")
+            order = self._stamp(op, site)
+            current = block.stamps.get(name)
+            if current is not None and current >= order:
+                return False
+            block.stamps[name] = order
+            if op.get("value") is None:
+                block.attrs.pop(name, None)
+            else:
+                block.attrs[name] = op["value"]
+            return True
+
+        raise InvalidOperation(f"Unknown operation {kind!r}, expected one of {', '.join(OPERATIONS)}")
+
+    # -- Output ---------------------------------------------------------------
+
+    def to_blocks(self) -> List[dict]:
+        """Visible state as a content_blocks list"""
+        deleted = self.blocks.deleted
+        return [
+            {"id": key, **self.block_data[key].attrs, **self.block_data[key].body()}
+            for key in self.blocks
+            if key not in deleted
+        ]
+
+    def snapshot(self) -> dict:
+        """
+        Full replica state for a joining client, tombstones included.
+
+        Characters are sent as runs [lamport, site, text, mark] of
+        consecutive ids with the same mark; a deleted run carries its
+        length instead of its text.
+        """
+        blocks = []
+        for key in self.blocks:
+            block = self.block_data[key]
+            runs: List[list] = []
+            previous: Optional[Tuple[int, str, bool, Optional[Mark]]] = None
+            deleted_chars = block.text.deleted
+            for char_key in block.text:
+                lamport, site = block.text.order[char_key]
+                deleted = char_key in deleted_chars
+                mark = block.marks.get(char_key)
+                if (
+                    previous is not None
+                    and previous[0] + 1 == lamport
+                    and previous[1] == site
+                    and previous[2] == deleted
+                    and previous[3] == mark
+                ):
+                    run = runs[-1]
+                    if deleted:
+                        run[2] += 1
+                    else:
+                        run[2] += block.chars[char_key]
+                else:
+                    runs.append([
+                        lamport,
+                        site,
+                        1 if deleted else block.chars[char_key],
+                        [list(mark[0]), mark[1]] if mark else None
+                    ])
+                previous = (lamport, site, deleted, mark)
+
+            blocks.append({
+                "id": key,
+                "order": list(self.blocks.order[key]),
+                "deleted": key in self.blocks.deleted,
+                "attrs": block.attrs,
+                "stamps": {name: list(stamp) for name, stamp in block.stamps.items()},
+                "rich": block.rich,
+                "runs": runs
+            })
+        return {"clock": self.clock, "blocks": blocks}
+
+
+# -- Persistence ----------------------------------------------------------------
+
+def load_document(db: Session, document_id: int) -> Optional[Tuple[int, CRDTDocument]]:
+    """(version, compacted replica) of a stored document, or None if it does not exist"""
+    version = db.query(Document.version).filter(Document.id == document_id).scalar()
+    if version is None:
+        return None
+    return version, CRDTDocument.from_blocks(load_blocks(db, document_id))
+
+
+def save_document(db: Session, document_id: int, blocks: List[dict], author_id: Optional[int] = None) -> Optional[int]:
+    """
+    Write a replica's visible blocks back to the document; returns the new version.
+
+    The live room is authoritative while it is open, so this overwrites any
+    REST write made in the meantime (which stays in the revision history).
+    Unchanged state is not written, see update_document.
+    """
+    document = update_document(
+        db,
+        document_id,
+        DocumentUpdate.model_construct(content_blocks=blocks),
+        author_id=author_id
+    )
+    return document.version if document is not None else None
@@ -1,24 +1,53 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, or_, case, cast, select, update, String, Text
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
+from app.config import settings
+from app.core import metrics
 from app.models.document import Document
 from app.models.user import User
 from app.models.document_collaborator import DocumentCollaborator
 from app.models.share_link import ShareLink
-from app.schemas.document import DocumentCreate, DocumentUpdate
-from typing import List, Optional, Literal
+from app.schemas.document import DocumentCreate, DocumentUpdate, validate_content_block
+from app.services.cache import TTLCache
+from app.services.outbox import record_event
+from app.services.sync_service import next_change_seq, record_tombstones, clear_tombstones
+from app.services.json_patch import apply_patch
+from app.services import block_store
+from app.services.block_store import load_blocks, replace_blocks
+from app.services import content_hash
+from app.services.revision_service import record_revision, make_delta, block_delta
+from typing import List, Optional, Literal, Tuple
 from datetime import datetime, timedelta
 import secrets
 from io import BytesIO
-from bs4 import BeautifulSoup
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
-from docx import Document as DocxDocument
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from html import unescape
+import importlib
+
+
+# Per-user typeahead results, keyed by (user_id, normalized query, limit).
+# Any change to titles or document access bumps the generation, so stale
+# entries never outlive a rename/share on this worker; other workers are
+# bounded by the TTL.
+_typeahead_cache = TTLCache(
+    max_entries=settings.typeahead_cache_max_entries,
+    ttl_seconds=settings.typeahead_cache_ttl_seconds
+)
+
+noop_writes_avoided = metrics.counter(
+    "document_noop_writes_avoided_total",
+    "Document updates skipped because nothing would change"
+)
+
+# Compressed search candidates are decompressed and matched this many at a time
+SEARCH_BATCH_SIZE = 100
+
+# Trigram similarity is meaningless for very short inputs, so fuzzy matching
+# only kicks in from this many characters.
+TYPEAHEAD_FUZZY_MIN_LENGTH = 3
+
+
+def _collaborator_ids(db: Session, document_id: int) -> List[int]:
+    return [row.user_id for row in db.query(DocumentCollaborator.user_id).filter(
+        DocumentCollaborator.document_id == document_id
+    )]
 
 
 def create_document(db: Session, document_data: DocumentCreate, owner_id: int) -> Document:
@@ -42,79 +71,384 @@ def create_document(db: Session, document_data: DocumentCreate, owner_id: int) -
         title=title,
         content=document_data.content or "",
         content_type=document_data.content_type or "plain",
-        content_blocks=document_data.content_blocks,
         styles=document_data.styles,
-        owner_id=owner_id
+        owner_id=owner_id,
+        change_seq=next_change_seq(db)
     )
+    db_document.content_hash = content_hash.compute_hash({
+        "content": db_document.content,
+        "content_blocks": document_data.content_blocks,
+        "styles": db_document.styles
+    })
     db.add(db_document)
-    db.flush()  # Get the document ID before creating collaborator
+    db.flush()  # Get the document ID before creating collaborator and blocks
+    
+    if document_data.content_blocks:
+        replace_blocks(db, db_document.id, document_data.content_blocks)
+    record_revision(db, db_document.id, db_document.version, None, owner_id)
     
     # Add owner as collaborator with 'owner' role
     owner_collab = DocumentCollaborator(
         document_id=db_document.id,
         user_id=owner_id,
-        role="owner"
+        role="owner",
+        change_seq=next_change_seq(db)
     )
     db.add(owner_collab)
+    record_event(db, "created", db_document.id, user_ids=[owner_id])
     db.commit()
     db.refresh(db_document)
+    invalidate_typeahead_cache()
     return db_document
 
 
-def get_document_by_id(db: Session, document_id: int) -> Optional[Document]:
-    """Get a single document by ID"""
-    return db.query(Document).filter(Document.id == document_id).first()
+def get_document_by_id(db: Session, document_id: int, with_content: bool = False) -> Optional[Document]:
+    """
+    Get a single document by ID.
+    
+    content is deferred and loaded on first access; pass with_content=True
+    when the caller will serialize it anyway to save the extra round trip.
+    """
+    query = db.query(Document).filter(Document.id == document_id)
+    if with_content:
+        query = query.options(undefer(Document.content))
+    return query.first()
 
 
-def get_user_documents(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Document]:
-    """Get all documents accessible to a user (owned or shared)"""
+def get_document_version_info(db: Session, document_id: int, user_id: int) -> Optional[Tuple[int, Optional[str]]]:
+    """
+    Cheap validator lookup for conditional requests.
+    
+    Returns (version, user_role) in one query without loading content,
+    or None if the document does not exist. user_role is None when the
+    user is not a collaborator.
+    """
+    row = db.query(Document.version, DocumentCollaborator.role).outerjoin(
+        DocumentCollaborator,
+        (DocumentCollaborator.document_id == Document.id) & (DocumentCollaborator.user_id == user_id)
+    ).filter(Document.id == document_id).first()
+    
+    if row is None:
+        return None
+    return row.version, row.role
+
+
+def _user_documents_query(db: Session, user_id: int, skip: int, limit: int):
     return db.query(Document).join(DocumentCollaborator).filter(
         DocumentCollaborator.user_id == user_id
-    ).order_by(Document.updated_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Document.updated_at.desc(), Document.id.desc()).offset(skip).limit(limit)
+
+
+def _all_documents_query(db: Session, skip: int, limit: int):
+    return db.query(Document).order_by(Document.id).offset(skip).limit(limit)
+
+
+def get_user_documents(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Document]:
+    """Get all documents accessible to a user (owned or shared)"""
+    return _user_documents_query(db, user_id, skip, limit).options(
+        undefer(Document.content),
+        selectinload(Document.blocks)
+    ).all()
+
+
+def get_user_document_versions(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Tuple[int, int]]:
+    """(id, version) pairs for the same page get_user_documents would return"""
+    return _user_documents_query(db, user_id, skip, limit).with_entities(Document.id, Document.version).all()
 
 
 def get_all_documents(db: Session, skip: int = 0, limit: int = 100) -> List[Document]:
     """Get all documents (for admin or public view)"""
-    return db.query(Document).offset(skip).limit(limit).all()
+    return _all_documents_query(db, skip, limit).options(
+        undefer(Document.content),
+        selectinload(Document.blocks)
+    ).all()
 
 
-def update_document(db: Session, document_id: int, document_data: DocumentUpdate) -> Optional[Document]:
-    """Update a document"""
-    db_document = db.query(Document).filter(Document.id == document_id).first()
-    
-    if not db_document:
-        return None
-    
+def get_all_document_versions(db: Session, skip: int = 0, limit: int = 100) -> List[Tuple[int, int]]:
+    """(id, version) pairs for the same page get_all_documents would return"""
+    return _all_documents_query(db, skip, limit).with_entities(Document.id, Document.version).all()
+
+
+class DocumentVersionConflict(Exception):
+    """Raised when an If-Match precondition no longer holds for a document"""
+
+
+def update_document(
+    db: Session,
+    document_id: int,
+    document_data: DocumentUpdate,
+    expected_versions: Optional[List[int]] = None,
+    author_id: Optional[int] = None
+) -> Optional[Document]:
+    """
+    Update a document with a single compare-and-set statement.
+    
+    A narrow read of version, title, content_type and content_hash comes
+    first: if the payload would not change anything, nothing is written
+    and the current document is returned as-is (version and updated_at are
+    kept). Otherwise issues UPDATE ... WHERE id = ? [AND version IN (?)]
+    RETURNING, bumping version, with no refresh after commit. When
+    expected_versions is given and none of them is current, raises
+    DocumentVersionConflict. content_blocks are diffed into document_blocks
+    so only changed blocks are written, and the change is recorded as a
+    revision in the same transaction.
+    """
     # Update only provided fields
     update_data = document_data.model_dump(exclude_unset=True)
     
-    # Validate title if being updated
     if 'title' in update_data:
         title = update_data['title'].strip() if update_data['title'] else None
         
         if not title:
             raise ValueError("Title cannot be empty")
+        update_data['title'] = title
+    
+    current = db.query(
+        Document.version,
+        Document.title,
+        Document.content_type,
+        Document.content_hash
+    ).filter(Document.id == document_id).first()
+    
+    if current is None:
+        return None
+    
+    if expected_versions is not None and current.version not in expected_versions:
+        raise DocumentVersionConflict(f"Document {document_id} was modified by someone else")
+    
+    if (
+        update_data.get('title', current.title) == current.title
+        and update_data.get('content_type', current.content_type) == current.content_type
+        and content_hash.unchanged_fields(update_data, current.content_hash)
+    ):
+        noop_writes_avoided.inc()
+        return get_document_by_id(db, document_id, with_content=True)
+    
+    if any(field in update_data for field in content_hash.HASHED_FIELDS):
+        update_data['content_hash'] = content_hash.compute_hash(update_data, current.content_hash)
+    blocks_updated = 'content_blocks' in update_data
+    content_blocks = update_data.pop('content_blocks', None)
+    
+    # Validate title if being updated
+    if 'title' in update_data and update_data['title'] != current.title:
+        title = update_data['title']
         
         # Check for duplicate title for this user (excluding current document)
-        existing = db.query(Document).filter(
-            Document.owner_id == db_document.owner_id,
+        owner_id = select(Document.owner_id).where(Document.id == document_id).scalar_subquery()
+        existing = db.query(Document.id).filter(
+            Document.owner_id == owner_id,
             Document.title == title,
             Document.id != document_id
         ).first()
         
         if existing:
             raise ValueError(f"Document with title '{title}' already exists")
-        
-        update_data['title'] = title
     
-    for field, value in update_data.items():
-        setattr(db_document, field, value)
+    # Old values of the fields a revision delta diffs rather than replaces
+    previous = {}
+    if 'content' in update_data:
+        previous['content'] = db.query(Document.content).filter(Document.id == document_id).scalar()
+    if blocks_updated:
+        previous['content_blocks'] = load_blocks(db, document_id)
+    
+    stmt = update(Document).where(Document.id == document_id)
+    if expected_versions is not None:
+        stmt = stmt.where(Document.version.in_(expected_versions))
+    stmt = stmt.values(**update_data, version=Document.version + 1, change_seq=next_change_seq(db)).returning(Document).options(
+        undefer(Document.content)
+    )
     
+    db_document = db.execute(
+        stmt,
+        execution_options={"synchronize_session": False, "populate_existing": True}
+    ).scalar_one_or_none()
+    
+    if db_document is None:
+        if expected_versions is not None and db.query(Document.id).filter(Document.id == document_id).first():
+            raise DocumentVersionConflict(f"Document {document_id} was modified by someone else")
+        return None
+    
+    if blocks_updated:
+        replace_blocks(db, document_id, content_blocks)
+    # Load blocks for the response, then detach so commit does not expire
+    # the RETURNING values we already hold
+    db.expire(db_document, ['blocks'])
+    db_document.blocks  # noqa: B018 - triggers the lazy load while attached
+    
+    changed = {field: update_data[field] for field in ('title', 'content', 'content_type', 'styles') if field in update_data}
+    if blocks_updated:
+        changed['content_blocks'] = db_document.content_blocks or []
+    # Someone else wrote in between our read and the UPDATE: previous is stale
+    delta = make_delta(previous, changed) if db_document.version == current.version + 1 else None
+    record_revision(db, document_id, db_document.version, delta, author_id)
+    record_event(db, "updated", document_id, version=db_document.version)
+    
+    db.expunge(db_document)
     db.commit()
-    db.refresh(db_document)
+    if 'title' in update_data:
+        invalidate_typeahead_cache()
     return db_document
 
 
+def patch_document_blocks(
+    db: Session,
+    document_id: int,
+    operations: List[dict],
+    expected_versions: Optional[List[int]] = None,
+    max_attempts: int = 3,
+    author_id: Optional[int] = None
+) -> Optional[Document]:
+    """
+    Apply JSON Patch operations to a document's content_blocks server-side.
+    
+    Only version and the blocks are read, and only the blocks the patch
+    adds or modifies are validated and written. The write goes through the
+    same compare-and-set as update_document; without an If-Match
+    precondition a lost race is retried against the fresh state, with one
+    it raises DocumentVersionConflict.
+    """
+    for _ in range(max_attempts):
+        version = db.query(Document.version).filter(Document.id == document_id).scalar()
+        
+        if version is None:
+            return None
+        
+        if expected_versions is not None and version not in expected_versions:
+            raise DocumentVersionConflict(f"Document {document_id} was modified by someone else")
+        
+        patched_blocks, touched_blocks = apply_patch(load_blocks(db, document_id), operations)
+        for block in touched_blocks:
+            validate_content_block(block)
+        
+        try:
+            # Touched blocks are validated above; skip re-validating the rest
+            return update_document(
+                db,
+                document_id,
+                DocumentUpdate.model_construct(content_blocks=patched_blocks),
+                [version],
+                author_id
+            )
+        except DocumentVersionConflict:
+            if expected_versions is not None:
+                raise
+    
+    raise DocumentVersionConflict(f"Document {document_id} is being modified concurrently")
+
+
+def touch_document(db: Session, document_id: int, expected_versions: Optional[List[int]] = None) -> Optional[int]:
+    """
+    Bump a document's version after a block-granular write in the same transaction.
+    
+    Returns the new version, None if the document does not exist, and raises
+    DocumentVersionConflict if expected_versions no longer holds. The caller
+    commits.
+    """
+    stmt = update(Document).where(Document.id == document_id)
+    if expected_versions is not None:
+        stmt = stmt.where(Document.version.in_(expected_versions))
+    # Block-level writes do not know the full block list, so mark that part
+    # of the fingerprint unknown; the next full write recomputes it
+    segment = content_hash.SEGMENT_LENGTH
+    blocks_hash = (
+        func.substr(Document.content_hash, 1, segment, type_=String)
+        + content_hash.UNKNOWN_SEGMENT
+        + func.substr(Document.content_hash, 2 * segment + 1, type_=String)
+    )
+    stmt = stmt.values(
+        version=Document.version + 1,
+        content_hash=blocks_hash,
+        change_seq=next_change_seq(db)
+    ).returning(Document.version)
+    
+    version = db.execute(stmt, execution_options={"synchronize_session": False}).scalar_one_or_none()
+    if version is None and expected_versions is not None:
+        if db.query(Document.id).filter(Document.id == document_id).first():
+            raise DocumentVersionConflict(f"Document {document_id} was modified by someone else")
+    return version
+
+
+def get_document_blocks(db: Session, document_id: int, offset: int = 0, limit: Optional[int] = None) -> Tuple[int, List[dict]]:
+    """Return (total block count, blocks in [offset, offset + limit)) by position"""
+    return block_store.count_blocks(db, document_id), load_blocks(db, document_id, offset, limit)
+
+
+def insert_document_block(
+    db: Session,
+    document_id: int,
+    block: dict,
+    after_block_id: Optional[str] = None,
+    expected_versions: Optional[List[int]] = None,
+    author_id: Optional[int] = None
+) -> Optional[Tuple[dict, int]]:
+    """Insert a single block; returns (block, new version) or None if the document is missing"""
+    validate_content_block(block)
+    version = touch_document(db, document_id, expected_versions)
+    if version is None:
+        return None
+    
+    try:
+        stored = block_store.insert_block(db, document_id, block, after_block_id)
+    except ValueError:
+        db.rollback()
+        raise
+    index = block_store.block_index(db, document_id, stored["id"])
+    total = block_store.count_blocks(db, document_id)
+    record_revision(db, document_id, version, block_delta(index, total - index - 1, inserted=[stored]), author_id)
+    record_event(db, "updated", document_id, version=version)
+    db.commit()
+    return stored, version
+
+
+def update_document_block(
+    db: Session,
+    document_id: int,
+    block_id: str,
+    block: dict,
+    expected_versions: Optional[List[int]] = None,
+    author_id: Optional[int] = None
+) -> Optional[Tuple[dict, int]]:
+    """Replace a single block; returns (block, new version) or None if the document or block is missing"""
+    validate_content_block(block)
+    version = touch_document(db, document_id, expected_versions)
+    if version is None:
+        return None
+    
+    stored = block_store.update_block(db, document_id, block_id, block)
+    if stored is None:
+        db.rollback()
+        return None
+    index = block_store.block_index(db, document_id, block_id)
+    total = block_store.count_blocks(db, document_id)
+    record_revision(db, document_id, version, block_delta(index, total - index - 1, removed=1, inserted=[stored]), author_id)
+    record_event(db, "updated", document_id, version=version)
+    db.commit()
+    return stored, version
+
+
+def delete_document_block(
+    db: Session,
+    document_id: int,
+    block_id: str,
+    expected_versions: Optional[List[int]] = None,
+    author_id: Optional[int] = None
+) -> Optional[int]:
+    """Delete a single block; returns the new version or None if the document or block is missing"""
+    version = touch_document(db, document_id, expected_versions)
+    if version is None:
+        return None
+    
+    index = block_store.block_index(db, document_id, block_id)
+    if index is None or not block_store.delete_block(db, document_id, block_id):
+        db.rollback()
+        return None
+    total = block_store.count_blocks(db, document_id)
+    record_revision(db, document_id, version, block_delta(index, total - index, removed=1), author_id)
+    record_event(db, "updated", document_id, version=version)
+    db.commit()
+    return version
+
+
 def delete_document(db: Session, document_id: int) -> bool:
     """Delete a document"""
     db_document = db.query(Document).filter(Document.id == document_id).first()
@@ -122,21 +456,138 @@ def delete_document(db: Session, document_id: int) -> bool:
     if not db_document:
         return False
     
+    user_ids = _collaborator_ids(db, document_id)
+    record_tombstones(db, document_id, user_ids, "deleted")
+    record_event(db, "deleted", document_id, user_ids=user_ids)
     db.delete(db_document)
     db.commit()
+    invalidate_typeahead_cache()
     return True
 
 
 def search_documents(db: Session, query: str, user_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[Document]:
-    """Search documents by title or content"""
-    search_query = db.query(Document).filter(
-        (Document.title.ilike(f"%{query}%")) | (Document.content.ilike(f"%{query}%"))
+    """
+    Search documents by title or content.
+    
+    Plain (uncompressed) content is matched in SQL. Compressed bodies cannot
+    be, so those rows are fetched in batches, decompressed and matched here;
+    only rows whose title did not already match pay that cost.
+    """
+    pattern = f"%{_escape_like(query)}%"
+    compressed = func.substr(Document.content, 1, 1) == b"\x00"
+    if db.bind.dialect.name == "postgresql":
+        plain_text = func.convert_from(Document.content, "UTF8")
+    else:
+        plain_text = cast(Document.content, Text)
+    sql_match = or_(
+        Document.title.ilike(pattern, escape="\\"),
+        case((compressed, None), else_=plain_text).ilike(pattern, escape="\\")
     )
     
+    candidates = db.query(Document.id, sql_match.label("matched")).filter(or_(sql_match, compressed))
     if user_id:
-        search_query = search_query.filter(Document.owner_id == user_id)
+        candidates = candidates.filter(Document.owner_id == user_id)
+    
+    needle = query.lower()
+    wanted = skip + limit
+    matched_ids: List[int] = []
+    pending: List[int] = []
+    
+    def check_pending():
+        rows = db.query(Document.id, Document.content).filter(Document.id.in_(pending)).all()
+        found = {document_id for document_id, content in rows if content and needle in content.lower()}
+        matched_ids.extend(document_id for document_id in pending if document_id in found)
+        pending.clear()
+    
+    for document_id, matched in candidates.order_by(Document.id).yield_per(SEARCH_BATCH_SIZE):
+        if len(matched_ids) >= wanted:
+            break
+        if matched:
+            # Keep id order: resolve earlier compressed candidates first
+            if pending:
+                check_pending()
+            matched_ids.append(document_id)
+        else:
+            pending.append(document_id)
+            if len(pending) >= SEARCH_BATCH_SIZE:
+                check_pending()
+    if pending and len(matched_ids) < wanted:
+        check_pending()
+    
+    page_ids = matched_ids[skip:wanted]
+    if not page_ids:
+        return []
+    documents = db.query(Document).filter(Document.id.in_(page_ids)).options(
+        undefer(Document.content),
+        selectinload(Document.blocks)
+    ).all()
+    order = {document_id: index for index, document_id in enumerate(page_ids)}
+    documents.sort(key=lambda document: order[document.id])
+    return documents
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input only ever matches literally"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def invalidate_typeahead_cache() -> None:
+    """Drop cached typeahead results after a title or access change"""
+    _typeahead_cache.bump_generation()
+
+
+def typeahead_documents(db: Session, query: str, user_id: int, limit: int = 10) -> List[dict]:
+    """
+    As-you-type title lookup over the documents a user can access.
+    
+    Only id, title and updated_at are selected so content is never read.
+    Titles starting with the query (or with a word starting with it) rank
+    first; on PostgreSQL, trigram similarity adds fuzzy matches and is
+    served by the ix_documents_title_trgm GIN index.
+    """
+    normalized = " ".join(query.lower().split())
+    if not normalized:
+        return []
     
-    return search_query.offset(skip).limit(limit).all()
+    cache_key = (user_id, normalized, limit)
+    cached = _typeahead_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    escaped = _escape_like(normalized)
+    prefix_match = or_(
+        Document.title.ilike(f"{escaped}%", escape="\\"),
+        Document.title.ilike(f"% {escaped}%", escape="\\")
+    )
+    
+    use_trigram = db.bind.dialect.name == "postgresql" and len(normalized) >= TYPEAHEAD_FUZZY_MIN_LENGTH
+    if use_trigram:
+        match_filter = or_(prefix_match, Document.title.op("%")(normalized))
+        ordering = [
+            case((prefix_match, 0), else_=1),
+            func.similarity(Document.title, normalized).desc(),
+            Document.updated_at.desc()
+        ]
+    else:
+        match_filter = prefix_match
+        ordering = [
+            case((Document.title.ilike(f"{escaped}%", escape="\\"), 0), else_=1),
+            Document.updated_at.desc()
+        ]
+    
+    rows = db.query(Document.id, Document.title, Document.updated_at).join(
+        DocumentCollaborator, DocumentCollaborator.document_id == Document.id
+    ).filter(
+        DocumentCollaborator.user_id == user_id,
+        match_filter
+    ).order_by(*ordering).limit(limit).all()
+    
+    results = [
+        {"id": row.id, "title": row.title, "updated_at": row.updated_at}
+        for row in rows
+    ]
+    _typeahead_cache.set(cache_key, results)
+    return results
 
 
 def get_user_role_for_document(db: Session, document_id: int, user_id: int) -> Optional[str]:
@@ -167,11 +618,15 @@ def add_collaborator(db: Session, document_id: int, user_id: int, role: Literal[
     collaborator = DocumentCollaborator(
         document_id=document_id,
         user_id=user_id,
-        role=role
+        role=role,
+        change_seq=next_change_seq(db)
     )
     db.add(collaborator)
+    clear_tombstones(db, document_id, [user_id])
+    record_event(db, "shared", document_id, user_ids=[user_id], role=role)
     db.commit()
     db.refresh(collaborator)
+    invalidate_typeahead_cache()
     return collaborator
 
 
@@ -187,7 +642,10 @@ def remove_collaborator(db: Session, document_id: int, user_id: int) -> bool:
         return False
     
     db.delete(collaborator)
+    record_tombstones(db, document_id, [user_id], "revoked")
+    record_event(db, "unshared", document_id, user_ids=[user_id])
     db.commit()
+    invalidate_typeahead_cache()
     return True
 
 
@@ -216,6 +674,7 @@ def create_share_link(db: Session, document_id: int, role: str, created_by: int,
         expires_at=expires_at
     )
     db.add(share_link)
+    record_event(db, "share_link_created", document_id, role=role)
     db.commit()
     db.refresh(share_link)
     return share_link
@@ -259,6 +718,8 @@ def accept_share_link(db: Session, token: str, user_id: int) -> Optional[Documen
         # If the new role is different, update it
         if existing.role != share_link.role:
             existing.role = share_link.role
+            existing.change_seq = next_change_seq(db)
+            record_event(db, "shared", existing.document_id, user_ids=[user_id], role=share_link.role)
             db.commit()
             db.refresh(existing)
             return existing
@@ -270,11 +731,15 @@ def accept_share_link(db: Session, token: str, user_id: int) -> Optional[Documen
     collaborator = DocumentCollaborator(
         document_id=share_link.document_id,
         user_id=user_id,
-        role=share_link.role
+        role=share_link.role,
+        change_seq=next_change_seq(db)
     )
     db.add(collaborator)
+    clear_tombstones(db, share_link.document_id, [user_id])
+    record_event(db, "shared", share_link.document_id, user_ids=[user_id], role=share_link.role)
     db.commit()
     db.refresh(collaborator)
+    invalidate_typeahead_cache()
     return collaborator
 
 
@@ -289,6 +754,7 @@ def revoke_share_link(db: Session, document_id: int, token: str) -> bool:
         return False
     
     share_link.is_active = 0
+    record_event(db, "share_link_revoked", document_id)
     db.commit()
     return True
 
@@ -312,6 +778,8 @@ def update_collaborator_role(db: Session, document_id: int, user_id: int, new_ro
         raise ValueError("Role must be 'editor' or 'reader'")
     
     collaborator.role = new_role
+    collaborator.change_seq = next_change_seq(db)
+    record_event(db, "shared", document_id, user_ids=[user_id], role=new_role)
     db.commit()
     db.refresh(collaborator)
     return collaborator
@@ -325,194 +793,15 @@ def get_document_share_links(db: Session, document_id: int) -> List[ShareLink]:
     ).all()
 
 
-def parse_html_content(html_content: str) -> List[dict]:
-    """Parse HTML content and extract text with formatting"""
-    if not html_content:
-        return []
-        
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        elements = []
-        seen_texts_with_context = set()  # Track text with type to allow duplicates in different contexts
-        
-        def process_element(element, is_list_item=False):
-            """Recursively process an element"""
-            # Handle direct text nodes
-            if isinstance(element, str):
-                text = element.strip()
-                if text:
-                    context_key = f"text_{text}"
-                    if context_key not in seen_texts_with_context:
-                        seen_texts_with_context.add(context_key)
-                        elements.append({
-                            'type': 'li' if is_list_item else 'p',
-                            'text': unescape(text),
-                            'align': 'left',
-                            'bold': False,
-                            'italic': False,
-                            'underline': False,
-                            'is_list_item': is_list_item
-                        })
-                return
-            
-            # Handle tags
-            if not hasattr(element, 'name'):
-                return
-            
-            if element.name == 'br':
-                elements.append({'type': 'break', 'text': ''})
-                return
-            
-            # Handle lists specially - process each li separately
-            if element.name in ['ul', 'ol']:
-                list_items = element.find_all('li', recursive=False)
-                for idx, li in enumerate(list_items, 1):
-                    text = li.get_text(strip=True)
-                    if not text:
-                        continue
-                    
-                    # Create context key to allow same text in different contexts
-                    context_key = f"li_{element.name}_{text}"
-                    if context_key in seen_texts_with_context:
-                        continue
-                    
-                    seen_texts_with_context.add(context_key)
-                    
-                    # Check for formatting
-                    style = li.get('style', '') or ''
-                    is_bold = bool(li.find(['strong', 'b'])) or 'font-weight: bold' in style or 'font-weight:bold' in style
-                    is_italic = bool(li.find(['em', 'i'])) or 'font-style: italic' in style or 'font-style:italic' in style
-                    # Check if text is underlined - check if wrapped in <u> or has style
-                    u_elem = li.find('u')
-                    is_underline = (li.name == 'u' or 
-                                  (hasattr(li.parent, 'name') and li.parent.name == 'u') or 
-                                  (u_elem and text in u_elem.get_text(strip=True)) or
-                                  'text-decoration: underline' in style or 
-                                  'text-decoration:underline' in style)
-                    
-                    # Extract font size for list items
-                    import re
-                    font_size = None
-                    for descendant in li.descendants:
-                        if hasattr(descendant, 'get'):
-                            desc_style = descendant.get('style', '')
-                            if desc_style and ('font-size:' in desc_style or 'font-size :' in desc_style):
-                                match = re.search(r'font-size\s*:\s*(\d+)px', desc_style)
-                                if match:
-                                    font_size = int(match.group(1))
-                                    break
-                    
-                    list_elem = {
-                        'type': 'li',
-                        'text': unescape(text),
-                        'align': 'left',
-                        'bold': is_bold,
-                        'italic': is_italic,
-                        'underline': is_underline,
-                        'is_list_item': True,
-                        'list_type': element.name,  # 'ul' or 'ol'
-                        'list_index': idx  # For ordered lists
-                    }
-                    if font_size:
-                        list_elem['font_size'] = font_size
-                    
-                    elements.append(list_elem)
-                return
-            
-            # Check if this element contains lists - process children separately
-            child_lists = element.find_all(['ul', 'ol'], recursive=False)
-            if child_lists:
-                # Process children in order
-                for child in element.children:
-                    process_element(child)
-                return
-            
-            # Get text content for other elements (no lists inside)
-            text = element.get_text(strip=True)
-            if not text:
-                return
-            
-            # Skip underline tags that only contain breaks or whitespace
-            if element.name == 'u' and (not text or text.isspace()):
-                return
-            
-            # Create context key to allow same text in different contexts
-            context_key = f"{element.name}_{text}"
-            if context_key in seen_texts_with_context:
-                return
-            
-            seen_texts_with_context.add(context_key)
-            
-            # Determine alignment from style
-            style = element.get('style', '') or ''
-            align = 'left'
-            if 'text-align: center' in style or 'text-align:center' in style:
-                align = 'center'
-            elif 'text-align: right' in style or 'text-align:right' in style:
-                align = 'right'
-            elif 'text-align: justify' in style or 'text-align:justify' in style:
-                align = 'justify'
-            
-            # Check for formatting
-            is_bold = bool(element.find(['strong', 'b'])) or 'font-weight: bold' in style or 'font-weight:bold' in style
-            is_italic = bool(element.find(['em', 'i'])) or 'font-style: italic' in style or 'font-style:italic' in style
-            # Check if text is underlined - check if wrapped in <u> or has style
-            u_elem = element.find('u')
-            is_underline = (element.name == 'u' or 
-                          (hasattr(element.parent, 'name') and element.parent.name == 'u') or 
-                          (u_elem and text in u_elem.get_text(strip=True)) or
-                          'text-decoration: underline' in style or 
-                          'text-decoration:underline' in style)
-            
-            # Extract font size - check element itself and all descendants
-            import re
-            font_size = None
-            
-            # Check current element's style
-            if 'font-size:' in style or 'font-size :' in style:
-                match = re.search(r'font-size\s*:\s*(\d+)px', style)
-                if match:
-                    font_size = int(match.group(1))
-            
-            # Check all descendants for font-size
-            if not font_size:
-                for descendant in element.descendants:
-                    if hasattr(descendant, 'get'):
-                        desc_style = descendant.get('style', '')
-                        if desc_style and ('font-size:' in desc_style or 'font-size :' in desc_style):
-                            match = re.search(r'font-size\s*:\s*(\d+)px', desc_style)
-                            if match:
-                                font_size = int(match.group(1))
-                                break
-            
-            elem_type = 'p' if element.name in ['div', 'span'] else element.name
-            
-            elem_data = {
-                'type': elem_type,
-                'text': unescape(text),
-                'align': align,
-                'bold': is_bold,
-                'italic': is_italic,
-                'underline': is_underline
-            }
-            if font_size:
-                elem_data['font_size'] = font_size
-            
-            elements.append(elem_data)
-        
-        # Process all children of the root
-        for child in soup.children:
-            process_element(child)
-        
-        return elements
-    except Exception as e:
-        # Return at least something to avoid complete failure
-        return [{'type': 'p', 'text': 'Error parsing document content', 'align': 'left', 'bold': False, 'italic': False, 'underline': False}]
+# The exporters pull in BeautifulSoup, ReportLab and python-docx, so they are
+# imported on first export rather than with this module
+EXPORT_MODULES = ("app.services.export_pdf", "app.services.export_docx")
+
+
+def preload_export_modules() -> None:
+    """Import the exporters up front, on workers that serve exports (settings.export_preload)"""
+    for name in EXPORT_MODULES:
+        importlib.import_module(name)
 
 
 def export_document_to_pdf(db: Session, document_id: int, user_id: int) -> BytesIO:
@@ -540,116 +829,8 @@ def export_document_to_pdf(db: Session, document_id: int, user_id: int) -> Bytes
     if not user_role:
         raise ValueError("Access denied")
     
-    # Create PDF buffer
-    buffer = BytesIO()
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    
-    # Build story (content)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Add custom styles
-    styles.add(ParagraphStyle(
-        name='CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER
-    ))
-    
-    styles.add(ParagraphStyle(
-        name='CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        spaceBefore=12
-    ))
-    
-    styles.add(ParagraphStyle(name='CustomBody', parent=styles['BodyText'], fontSize=11, alignment=TA_LEFT, spaceAfter=12))
-    styles.add(ParagraphStyle(name='CustomBodyCenter', parent=styles['BodyText'], fontSize=11, alignment=TA_CENTER, spaceAfter=12))
-    styles.add(ParagraphStyle(name='CustomBodyRight', parent=styles['BodyText'], fontSize=11, alignment=TA_RIGHT, spaceAfter=12))
-    styles.add(ParagraphStyle(name='CustomBodyJustify', parent=styles['BodyText'], fontSize=11, alignment=TA_JUSTIFY, spaceAfter=12))
-    
-    styles.add(ParagraphStyle(
-        name='Blockquote',
-        parent=styles['BodyText'],
-        fontSize=11,
-        leftIndent=20,
-        rightIndent=20,
-        textColor=colors.HexColor('#666666'),
-        spaceAfter=12
-    ))
-    
-    # Parse and add content
-    if document.content:
-        elements = parse_html_content(document.content)
-        
-        for elem in elements:
-            if elem['type'] == 'break':
-                story.append(Spacer(1, 0.1 * inch))
-                continue
-            
-            text = elem['text']
-            
-            # Add bullet for list items
-            if elem.get('is_list_item'):
-                if elem.get('list_type') == 'ol':
-                    text = f"{elem.get('list_index', 1)}. {text}"
-                else:
-                    text = f"• {text}"
-            
-            # Apply inline formatting
-            if elem.get('bold'):
-                text = f"<b>{text}</b>"
-            if elem.get('italic'):
-                text = f"<i>{text}</i>"
-            if elem.get('underline'):
-                text = f"<u>{text}</u>"
-            
-            # Choose style based on element type and alignment
-            if elem['type'] in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                style = styles['CustomHeading']
-            elif elem['type'] == 'blockquote':
-                style = styles['Blockquote']
-            else:
-                if elem['align'] == 'center':
-                    style = styles['CustomBodyCenter']
-                elif elem['align'] == 'right':
-                    style = styles['CustomBodyRight']
-                elif elem['align'] == 'justify':
-                    style = styles['CustomBodyJustify']
-                else:
-                    style = styles['CustomBody']
-                
-                # Create custom style with font size if specified (including list items)
-                if elem.get('font_size'):
-                    font_size = elem.get('font_size')
-                    style_name = f"Custom_{font_size}_{elem['align']}_{elem.get('type', 'p')}"
-                    custom_style = ParagraphStyle(
-                        name=style_name,
-                        parent=style,
-                        fontSize=font_size,
-                        leading=font_size * 1.2,  # Line height = 120% of font size
-                        spaceAfter=font_size * 0.5  # Space after = 50% of font size
-                    )
-                    style = custom_style
-            
-            story.append(Paragraph(text, style))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    return buffer
+    from app.services.export_pdf import render_pdf
+    return render_pdf(document)
 
 
 def export_document_to_docx(db: Session, document_id: int, user_id: int) -> BytesIO:
@@ -677,86 +858,5 @@ def export_document_to_docx(db: Session, document_id: int, user_id: int) -> Byte
     if not user_role:
         raise ValueError("Access denied")
     
-    # Create Word document
-    doc = DocxDocument()
-    
-    # Set document margins
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Parse and add content
-    if document.content:
-        elements = parse_html_content(document.content)
-        
-        for elem in elements:
-            if elem['type'] == 'break':
-                doc.add_paragraph()
-                continue
-            
-            # Determine paragraph type
-            if elem['type'] in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                level = int(elem['type'][1])
-                para = doc.add_heading(elem['text'], level=level)
-            elif elem.get('is_list_item'):
-                # Add as bullet or numbered point
-                list_style = 'List Number' if elem.get('list_type') == 'ol' else 'List Bullet'
-                para = doc.add_paragraph(elem['text'], style=list_style)
-                run = para.runs[0] if para.runs else para.add_run(elem['text'])
-                
-                # Apply formatting to the run
-                if elem.get('bold'):
-                    run.bold = True
-                if elem.get('italic'):
-                    run.italic = True
-                if elem.get('underline'):
-                    run.underline = True
-                
-                # Apply font size
-                if elem.get('font_size'):
-                    run.font.size = Pt(elem['font_size'])
-                else:
-                    run.font.size = Pt(11)
-            else:
-                para = doc.add_paragraph()
-                run = para.add_run(elem['text'])
-                
-                # Apply formatting
-                if elem.get('bold'):
-                    run.bold = True
-                if elem.get('italic'):
-                    run.italic = True
-                if elem.get('underline'):
-                    run.underline = True
-                
-                # Apply font size
-                if elem.get('font_size'):
-                    run.font.size = Pt(elem['font_size'])
-                else:
-                    run.font.size = Pt(11)
-                
-                # Apply blockquote styling
-                if elem['type'] == 'blockquote':
-                    para.paragraph_format.left_indent = Inches(0.5)
-                    para.paragraph_format.right_indent = Inches(0.5)
-                    run.font.color.rgb = RGBColor(102, 102, 102)
-            
-            # Set alignment
-            if elem['align'] == 'center':
-                para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            elif elem['align'] == 'right':
-                para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            elif elem['align'] == 'justify':
-                para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-            else:
-                para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    
-    # Save to buffer
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    
-    return buffer
+    from app.services.export_docx import render_docx
+    return render_docx(document)
@@ -0,0 +1,100 @@
+"""
+Word (DOCX) rendering for document exports.
+
+Imported on first use by document_service.export_document_to_docx (or at
+startup with settings.export_preload), so python-docx stays out of workers
+and scripts that never export.
+"""
+from io import BytesIO
+from docx import Document as DocxDocument
+from docx.shared import Inches, Pt, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from app.models.document import Document
+from app.services.export_html import parse_html_content
+
+
+def render_docx(document: Document) -> BytesIO:
+    """Render a document's HTML content as a Word document"""
+    # Create Word document
+    doc = DocxDocument()
+    
+    # Set document margins
+    sections = doc.sections
+    for section in sections:
+        section.top_margin = Inches(1)
+        section.bottom_margin = Inches(1)
+        section.left_margin = Inches(1)
+        section.right_margin = Inches(1)
+    
+    # Parse and add content
+    if document.content:
+        elements = parse_html_content(document.content)
+        
+        for elem in elements:
+            if elem['type'] == 'break':
+                doc.add_paragraph()
+                continue
+            
+            # Determine paragraph type
+            if elem['type'] in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+                level = int(elem['type'][1])
+                para = doc.add_heading(elem['text'], level=level)
+            elif elem.get('is_list_item'):
+                # Add as bullet or numbered point
+                list_style = 'List Number' if elem.get('list_type') == 'ol' else 'List Bullet'
+                para = doc.add_paragraph(elem['text'], style=list_style)
+                run = para.runs[0] if para.runs else para.add_run(elem['text'])
+                
+                # Apply formatting to the run
+                if elem.get('bold'):
+                    run.bold = True
+                if elem.get('italic'):
+                    run.italic = True
+                if elem.get('underline'):
+                    run.underline = True
+                
+                # Apply font size
+                if elem.get('font_size'):
+                    run.font.size = Pt(elem['font_size'])
+                else:
+                    run.font.size = Pt(11)
+            else:
+                para = doc.add_paragraph()
+                run = para.add_run(elem['text'])
+                
+                # Apply formatting
+                if elem.get('bold'):
+                    run.bold = True
+                if elem.get('italic'):
+                    run.italic = True
+                if elem.get('underline'):
+                    run.underline = True
+                
+                # Apply font size
+                if elem.get('font_size'):
+                    run.font.size = Pt(elem['font_size'])
+                else:
+                    run.font.size = Pt(11)
+                
+                # Apply blockquote styling
+                if elem['type'] == 'blockquote':
+                    para.paragraph_format.left_indent = Inches(0.5)
+                    para.paragraph_format.right_indent = Inches(0.5)
+                    run.font.color.rgb = RGBColor(102, 102, 102)
+            
+            # Set alignment
+            if elem['align'] == 'center':
+                para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            elif elem['align'] == 'right':
+                para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            elif elem['align'] == 'justify':
+                para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+            else:
+                para.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    
+    # Save to buffer
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    
+    return buffer
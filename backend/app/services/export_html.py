@@ -0,0 +1,199 @@
+"""
+HTML to export elements, shared by the PDF and DOCX exporters.
+
+Imported only when a document is exported (see document_service), so
+BeautifulSoup is not loaded by workers and scripts that never export.
+"""
+from typing import List
+from bs4 import BeautifulSoup
+from html import unescape
+
+
+def parse_html_content(html_content: str) -> List[dict]:
+    """Parse HTML content and extract text with formatting"""
+    if not html_content:
+        return []
+        
+    try:
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+        
+        elements = []
+        seen_texts_with_context = set()  # Track text with type to allow duplicates in different contexts
+        
+        def process_element(element, is_list_item=False):
+            """Recursively process an element"""
+            # Handle direct text nodes
+            if isinstance(element, str):
+                text = element.strip()
+                if text:
+                    context_key = f"text_{text}"
+                    if context_key not in seen_texts_with_context:
+                        seen_texts_with_context.add(context_key)
+                        elements.append({
+                            'type': 'li' if is_list_item else 'p',
+                            'text': unescape(text),
+                            'align': 'left',
+                            'bold': False,
+                            'italic': False,
+                            'underline': False,
+                            'is_list_item': is_list_item
+                        })
+                return
+            
+            # Handle tags
+            if not hasattr(element, 'name'):
+                return
+            
+            if element.name == 'br':
+                elements.append({'type': 'break', 'text': ''})
+                return
+            
+            # Handle lists specially - process each li separately
+            if element.name in ['ul', 'ol']:
+                list_items = element.find_all('li', recursive=False)
+                for idx, li in enumerate(list_items, 1):
+                    text = li.get_text(strip=True)
+                    if not text:
+                        continue
+                    
+                    # Create context key to allow same text in different contexts
+                    context_key = f"li_{element.name}_{text}"
+                    if context_key in seen_texts_with_context:
+                        continue
+                    
+                    seen_texts_with_context.add(context_key)
+                    
+                    # Check for formatting
+                    style = li.get('style', '') or ''
+                    is_bold = bool(li.find(['strong', 'b'])) or 'font-weight: bold' in style or 'font-weight:bold' in style
+                    is_italic = bool(li.find(['em', 'i'])) or 'font-style: italic' in style or 'font-style:italic' in style
+                    # Check if text is underlined - check if wrapped in <u> or has style
+                    u_elem = li.find('u')
+                    is_underline = (li.name == 'u' or 
+                                  (hasattr(li.parent, 'name') and li.parent.name == 'u') or 
+                                  (u_elem and text in u_elem.get_text(strip=True)) or
+                                  'text-decoration: underline' in style or 
+                                  'text-decoration:underline' in style)
+                    
+                    # Extract font size for list items
+                    import re
+                    font_size = None
+                    for descendant in li.descendants:
+                        if hasattr(descendant, 'get'):
+                            desc_style = descendant.get('style', '')
+                            if desc_style and ('font-size:' in desc_style or 'font-size :' in desc_style):
+                                match = re.search(r'font-size\s*:\s*(\d+)px', desc_style)
+                                if match:
+                                    font_size = int(match.group(1))
+                                    break
+                    
+                    list_elem = {
+                        'type': 'li',
+                        'text': unescape(text),
+                        'align': 'left',
+                        'bold': is_bold,
+                        'italic': is_italic,
+                        'underline': is_underline,
+                        'is_list_item': True,
+                        'list_type': element.name,  # 'ul' or 'ol'
+                        'list_index': idx  # For ordered lists
+                    }
+                    if font_size:
+                        list_elem['font_size'] = font_size
+                    
+                    elements.append(list_elem)
+                return
+            
+            # Check if this element contains lists - process children separately
+            child_lists = element.find_all(['ul', 'ol'], recursive=False)
+            if child_lists:
+                # Process children in order
+                for child in element.children:
+                    process_element(child)
+                return
+            
+            # Get text content for other elements (no lists inside)
+            text = element.get_text(strip=True)
+            if not text:
+                return
+            
+            # Skip underline tags that only contain breaks or whitespace
+            if element.name == 'u' and (not text or text.isspace()):
+                return
+            
+            # Create context key to allow same text in different contexts
+            context_key = f"{element.name}_{text}"
+            if context_key in seen_texts_with_context:
+                return
+            
+            seen_texts_with_context.add(context_key)
+            
+            # Determine alignment from style
+            style = element.get('style', '') or ''
+            align = 'left'
+            if 'text-align: center' in style or 'text-align:center' in style:
+                align = 'center'
+            elif 'text-align: right' in style or 'text-align:right' in style:
+                align = 'right'
+            elif 'text-align: justify' in style or 'text-align:justify' in style:
+                align = 'justify'
+            
+            # Check for formatting
+            is_bold = bool(element.find(['strong', 'b'])) or 'font-weight: bold' in style or 'font-weight:bold' in style
+            is_italic = bool(element.find(['em', 'i'])) or 'font-style: italic' in style or 'font-style:italic' in style
+            # Check if text is underlined - check if wrapped in <u> or has style
+            u_elem = element.find('u')
+            is_underline = (element.name == 'u' or 
+                          (hasattr(element.parent, 'name') and element.parent.name == 'u') or 
+                          (u_elem and text in u_elem.get_text(strip=True)) or
+                          'text-decoration: underline' in style or 
+                          'text-decoration:underline' in style)
+            
+            # Extract font size - check element itself and all descendants
+            import re
+            font_size = None
+            
+            # Check current element's style
+            if 'font-size:' in style or 'font-size :' in style:
+                match = re.search(r'font-size\s*:\s*(\d+)px', style)
+                if match:
+                    font_size = int(match.group(1))
+            
+            # Check all descendants for font-size
+            if not font_size:
+                for descendant in element.descendants:
+                    if hasattr(descendant, 'get'):
+                        desc_style = descendant.get('style', '')
+                        if desc_style and ('font-size:' in desc_style or 'font-size :' in desc_style):
+                            match = re.search(r'font-size\s*:\s*(\d+)px', desc_style)
+                            if match:
+                                font_size = int(match.group(1))
+                                break
+            
+            elem_type = 'p' if element.name in ['div', 'span'] else element.name
+            
+            elem_data = {
+                'type': elem_type,
+                'text': unescape(text),
+                'align': align,
+                'bold': is_bold,
+                'italic': is_italic,
+                'underline': is_underline
+            }
+            if font_size:
+                elem_data['font_size'] = font_size
+            
+            elements.append(elem_data)
+        
+        # Process all children of the root
+        for child in soup.children:
+            process_element(child)
+        
+        return elements
+    except Exception as e:
+        # Return at least something to avoid complete failure
+        return [{'type': 'p', 'text': 'Error parsing document content', 'align': 'left', 'bold': False, 'italic': False, 'underline': False}]
@@ -0,0 +1,130 @@
+"""
+PDF rendering for document exports.
+
+Imported on first use by document_service.export_document_to_pdf (or at
+startup with settings.export_preload), so ReportLab stays out of workers
+and scripts that never export.
+"""
+from io import BytesIO
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
+from app.models.document import Document
+from app.services.export_html import parse_html_content
+
+
+def render_pdf(document: Document) -> BytesIO:
+    """Render a document's HTML content as a PDF"""
+    # Create PDF buffer
+    buffer = BytesIO()
+    
+    # Create PDF document
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+    
+    # Build story (content)
+    story = []
+    styles = getSampleStyleSheet()
+    
+    # Add custom styles
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=TA_CENTER
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        spaceBefore=12
+    ))
+    
+    styles.add(ParagraphStyle(name='CustomBody', parent=styles['BodyText'], fontSize=11, alignment=TA_LEFT, spaceAfter=12))
+    styles.add(ParagraphStyle(name='CustomBodyCenter', parent=styles['BodyText'], fontSize=11, alignment=TA_CENTER, spaceAfter=12))
+    styles.add(ParagraphStyle(name='CustomBodyRight', parent=styles['BodyText'], fontSize=11, alignment=TA_RIGHT, spaceAfter=12))
+    styles.add(ParagraphStyle(name='CustomBodyJustify', parent=styles['BodyText'], fontSize=11, alignment=TA_JUSTIFY, spaceAfter=12))
+    
+    styles.add(ParagraphStyle(
+        name='Blockquote',
+        parent=styles['BodyText'],
+        fontSize=11,
+        leftIndent=20,
+        rightIndent=20,
+        textColor=colors.HexColor('#666666'),
+        spaceAfter=12
+    ))
+    
+    # Parse and add content
+    if document.content:
+        elements = parse_html_content(document.content)
+        
+        for elem in elements:
+            if elem['type'] == 'break':
+                story.append(Spacer(1, 0.1 * inch))
+                continue
+            
+            text = elem['text']
+            
+            # Add bullet for list items
+            if elem.get('is_list_item'):
+                if elem.get('list_type') == 'ol':
+                    text = f"{elem.get('list_index', 1)}. {text}"
+                else:
+                    text = f"• {text}"
+            
+            # Apply inline formatting
+            if elem.get('bold'):
+                text = f"<b>{text}</b>"
+            if elem.get('italic'):
+                text = f"<i>{text}</i>"
+            if elem.get('underline'):
+                text = f"<u>{text}</u>"
+            
+            # Choose style based on element type and alignment
+            if elem['type'] in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+                style = styles['CustomHeading']
+            elif elem['type'] == 'blockquote':
+                style = styles['Blockquote']
+            else:
+                if elem['align'] == 'center':
+                    style = styles['CustomBodyCenter']
+                elif elem['align'] == 'right':
+                    style = styles['CustomBodyRight']
+                elif elem['align'] == 'justify':
+                    style = styles['CustomBodyJustify']
+                else:
+                    style = styles['CustomBody']
+                
+                # Create custom style with font size if specified (including list items)
+                if elem.get('font_size'):
+                    font_size = elem.get('font_size')
+                    style_name = f"Custom_{font_size}_{elem['align']}_{elem.get('type', 'p')}"
+                    custom_style = ParagraphStyle(
+                        name=style_name,
+                        parent=style,
+                        fontSize=font_size,
+                        leading=font_size * 1.2,  # Line height = 120% of font size
+                        spaceAfter=font_size * 0.5  # Space after = 50% of font size
+                    )
+                    style = custom_style
+            
+            story.append(Paragraph(text, style))
+    
+    # Build PDF
+    doc.build(story)
+    buffer.seek(0)
+    
+    return buffer
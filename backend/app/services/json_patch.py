@@ -0,0 +1,170 @@
+"""
+RFC 6902 JSON Patch applied to a document's content_blocks.
+
+Patches are evaluated against {"content_blocks": [...]}, so every path must
+start with /content_blocks. Blocks are copied on first write only, which
+keeps the cost proportional to the blocks an edit touches rather than to the
+document size, and lets callers validate just those blocks.
+"""
+import copy
+from typing import Any, List, Optional, Set, Tuple
+
+ROOT_FIELD = "content_blocks"
+
+
+class JsonPatchError(ValueError):
+    """Raised when a patch is malformed or cannot be applied"""
+
+
+class JsonPatchTestFailed(Exception):
+    """Raised when a "test" operation does not match the current value"""
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON Pointer '{pointer}'")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index '{token}'")
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise JsonPatchError(f"Array index {index} out of range")
+    return index
+
+
+class _BlockPatcher:
+    def __init__(self, blocks: List[dict]):
+        self.root = {ROOT_FIELD: list(blocks)}
+        # Top-level blocks that were copied, added or replaced by this patch
+        self.touched: Set[int] = set()
+        self.whole_list_touched = False
+
+    @property
+    def blocks(self) -> List[dict]:
+        return self.root[ROOT_FIELD]
+
+    def _own_block(self, index: int) -> Any:
+        block = self.blocks[index]
+        if id(block) not in self.touched:
+            block = copy.deepcopy(block)
+            self.blocks[index] = block
+            self.touched.add(id(block))
+        return block
+
+    def _resolve_parent(self, tokens: List[str], for_write: bool) -> Tuple[Any, str]:
+        """Walk to the container holding the last token, copying blocks on write"""
+        if not tokens or tokens[0] != ROOT_FIELD:
+            raise JsonPatchError(f"Only /{ROOT_FIELD} paths can be patched")
+
+        container: Any = self.root
+        for depth, token in enumerate(tokens[:-1]):
+            if isinstance(container, list):
+                index = _list_index(container, token, allow_end=False)
+                if depth == 1 and for_write:
+                    container = self._own_block(index)
+                else:
+                    container = container[index]
+            elif isinstance(container, dict):
+                if token not in container:
+                    raise JsonPatchError(f"Path segment '{token}' does not exist")
+                container = container[token]
+            else:
+                raise JsonPatchError(f"Cannot traverse into a scalar at '{token}'")
+        return container, tokens[-1]
+
+    def _mark(self, tokens: List[str], value: Any = None) -> None:
+        if len(tokens) == 1:
+            self.whole_list_touched = True
+        elif len(tokens) == 2:
+            self.touched.add(id(value))
+
+    def get(self, tokens: List[str]) -> Any:
+        container, token = self._resolve_parent(tokens, for_write=False)
+        if isinstance(container, list):
+            return container[_list_index(container, token, allow_end=False)]
+        if isinstance(container, dict) and token in container:
+            return container[token]
+        raise JsonPatchError(f"Path '/{'/'.join(tokens)}' does not exist")
+
+    def add(self, tokens: List[str], value: Any) -> None:
+        container, token = self._resolve_parent(tokens, for_write=True)
+        if isinstance(container, list):
+            container.insert(_list_index(container, token, allow_end=True), value)
+        elif isinstance(container, dict):
+            if len(tokens) == 1 and not isinstance(value, list):
+                raise JsonPatchError(f"/{ROOT_FIELD} must be a list")
+            container[token] = value
+        else:
+            raise JsonPatchError("Cannot add a member to a scalar")
+        self._mark(tokens, value)
+
+    def remove(self, tokens: List[str]) -> Any:
+        if len(tokens) == 1:
+            raise JsonPatchError(f"/{ROOT_FIELD} cannot be removed")
+        container, token = self._resolve_parent(tokens, for_write=True)
+        if isinstance(container, list):
+            return container.pop(_list_index(container, token, allow_end=False))
+        if isinstance(container, dict) and token in container:
+            return container.pop(token)
+        raise JsonPatchError(f"Path '/{'/'.join(tokens)}' does not exist")
+
+    def replace(self, tokens: List[str], value: Any) -> None:
+        # The target must exist; the root list always does
+        if len(tokens) > 1:
+            self.remove(tokens)
+        self.add(tokens, value)
+
+
+def apply_patch(blocks: Optional[List[dict]], operations: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Apply JSON Patch operations to content blocks.
+
+    The input list and its blocks are never mutated. Returns the patched
+    block list together with the blocks that were added or modified.
+    Raises JsonPatchError for invalid patches and JsonPatchTestFailed when
+    a "test" operation does not hold.
+    """
+    patcher = _BlockPatcher(blocks or [])
+
+    for operation in operations:
+        op = operation.get("op")
+        tokens = _parse_pointer(operation.get("path", ""))
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"'{op}' requires a 'value' member")
+
+        if op == "add":
+            patcher.add(tokens, copy.deepcopy(operation.get("value")))
+        elif op == "remove":
+            patcher.remove(tokens)
+        elif op == "replace":
+            patcher.replace(tokens, copy.deepcopy(operation.get("value")))
+        elif op in ("move", "copy"):
+            if operation.get("from") is None:
+                raise JsonPatchError(f"'{op}' requires a 'from' pointer")
+            from_tokens = _parse_pointer(operation["from"])
+            if op == "move":
+                if tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                    raise JsonPatchError("Cannot move a value into one of its children")
+                # Copy so a moved original block can never be mutated later
+                value = copy.deepcopy(patcher.remove(from_tokens))
+            else:
+                value = copy.deepcopy(patcher.get(from_tokens))
+            patcher.add(tokens, value)
+        elif op == "test":
+            if patcher.get(tokens) != operation.get("value"):
+                raise JsonPatchTestFailed(f"Test failed at '{operation.get('path')}'")
+        else:
+            raise JsonPatchError(f"Unsupported operation '{op}'")
+
+    patched = patcher.blocks
+    if patcher.whole_list_touched:
+        return patched, list(patched)
+    return patched, [block for block in patched if id(block) in patcher.touched]
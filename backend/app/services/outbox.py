@@ -0,0 +1,248 @@
+"""
+Transactional outbox for document mutations.
+
+document_service calls record_event() before committing each mutation, so
+an event exists exactly when its change does. Consumers read the outbox in
+batches and keep their own position:
+
+- durable consumers (durable = True) store their position in
+  outbox_checkpoints, committed in the same transaction as whatever their
+  handle() wrote, so database-derived state is updated exactly once and
+  external side effects at least once. Only one worker processes a
+  durable consumer at a time; a new one starts at the current end.
+- tailing consumers (durable = False) keep their position in memory and
+  start at the end of the outbox when the worker starts; every worker runs
+  its own (e.g. the change feed, which fans out to that worker's streams).
+
+Events are ordered by (txid, id). On PostgreSQL txid is the writing
+transaction's id and consumers only read events of transactions older
+than the oldest one still running (txid_snapshot_xmin), so an event that
+commits late is never skipped past; a long-running transaction anywhere
+delays delivery until it ends. Other databases serialize writers and
+order by id alone.
+
+OutboxRunner polls every outbox_poll_interval_seconds and is woken right
+away when a session on this worker commits outbox events.
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, event, func, literal, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import metrics
+from app.database import SessionLocal
+from app.models.outbox import OutboxCheckpoint, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+Position = Tuple[int, int]
+
+outbox_written = metrics.counter("outbox_events_written_total", "Outbox events recorded", ["type"])
+outbox_consumed = metrics.counter("outbox_events_consumed_total", "Outbox events handled", ["consumer"])
+outbox_failures = metrics.counter("outbox_consumer_failures_total", "Batches that failed and will be retried", ["consumer"])
+outbox_lag = metrics.gauge(
+    "outbox_consumer_lag_seconds",
+    "Age of the last event a consumer handled, when it handled it",
+    ["consumer"]
+)
+
+
+def record_event(db: Session, event_type: str, document_id: int, **data) -> None:
+    """Add an event to the current transaction; the caller commits"""
+    db.add(OutboxEvent(
+        txid=_transaction_id(db),
+        event_type=event_type,
+        document_id=document_id,
+        data=data or None
+    ))
+    db.info["outbox_pending"] = True
+    outbox_written.inc(type=event_type)
+
+
+def _transaction_id(db: Session):
+    if db.bind.dialect.name == "postgresql":
+        return func.txid_current()
+    return literal(0)
+
+
+def _horizon(db: Session) -> Optional[int]:
+    """Events of transactions at or past this txid may still commit"""
+    if db.bind.dialect.name == "postgresql":
+        return db.scalar(select(func.txid_snapshot_xmin(func.txid_current_snapshot())))
+    return None
+
+
+def read_events(db: Session, after: Position, limit: int) -> List[OutboxEvent]:
+    """Committed events after a position, in order, that can no longer be preceded by others"""
+    query = db.query(OutboxEvent).filter(or_(
+        OutboxEvent.txid > after[0],
+        and_(OutboxEvent.txid == after[0], OutboxEvent.id > after[1])
+    ))
+    horizon = _horizon(db)
+    if horizon is not None:
+        query = query.filter(OutboxEvent.txid < horizon)
+    return query.order_by(OutboxEvent.txid, OutboxEvent.id).limit(limit).all()
+
+
+def end_position(db: Session) -> Position:
+    """Position from which only events not yet readable will follow"""
+    horizon = _horizon(db)
+    if horizon is not None:
+        return horizon, 0
+    return 0, db.scalar(select(func.coalesce(func.max(OutboxEvent.id), 0)))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_runner(session: Session) -> None:
+    if session.info.pop("outbox_pending", False):
+        outbox_runner.wakeup()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_pending(session: Session) -> None:
+    session.info.pop("outbox_pending", None)
+
+
+class OutboxConsumer(ABC):
+    """Subclasses set name and implement handle()"""
+
+    name: str = ""
+    durable = True
+    batch_size = 500
+
+    def __init__(self):
+        self.position: Optional[Position] = None
+
+    @abstractmethod
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        """Process one batch; anything written to db commits with the checkpoint"""
+
+    def run_batch(self, db: Session) -> int:
+        """Handle the next batch; returns how many events it held"""
+        if self.durable:
+            return self._run_durable(db)
+        if self.position is None:
+            self.position = end_position(db)
+        events = read_events(db, self.position, self.batch_size)
+        if events:
+            self.handle(db, events)
+            db.commit()
+            self.position = (events[-1].txid, events[-1].id)
+            self._handled(events)
+        return len(events)
+
+    def _run_durable(self, db: Session) -> int:
+        checkpoint = db.query(OutboxCheckpoint).filter(OutboxCheckpoint.consumer == self.name).with_for_update(
+            skip_locked=True
+        ).first()
+        if checkpoint is None:
+            if db.query(OutboxCheckpoint.consumer).filter(OutboxCheckpoint.consumer == self.name).first():
+                # Another worker holds it
+                db.rollback()
+                return 0
+            txid, event_id = end_position(db)
+            try:
+                db.add(OutboxCheckpoint(consumer=self.name, txid=txid, event_id=event_id))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+            return 0
+
+        events = read_events(db, (checkpoint.txid, checkpoint.event_id), self.batch_size)
+        if not events:
+            db.rollback()
+            return 0
+        self.handle(db, events)
+        checkpoint.txid, checkpoint.event_id = events[-1].txid, events[-1].id
+        db.commit()
+        self._handled(events)
+        return len(events)
+
+    def _handled(self, events: List[OutboxEvent]) -> None:
+        outbox_consumed.inc(len(events), consumer=self.name)
+        if events[-1].created_at is not None:
+            outbox_lag.set(max((datetime.utcnow() - events[-1].created_at).total_seconds(), 0.0), consumer=self.name)
+
+
+class OutboxRunner:
+    """Background thread that feeds the registered consumers"""
+
+    def __init__(self, session_factory: Callable, poll_interval: float):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.consumers: List[OutboxConsumer] = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, consumer: OutboxConsumer) -> None:
+        self.consumers.append(consumer)
+
+    def wakeup(self) -> None:
+        self._wakeup.set()
+
+    def run_once(self, consumers: Optional[Sequence[OutboxConsumer]] = None) -> int:
+        """Drain every consumer; returns the number of events handled"""
+        handled = 0
+        for consumer in self.consumers if consumers is None else consumers:
+            while True:
+                db = self.session_factory()
+                try:
+                    count = consumer.run_batch(db)
+                except Exception:
+                    db.rollback()
+                    outbox_failures.inc(consumer=consumer.name)
+                    logger.exception("Outbox consumer %s failed; will retry", consumer.name)
+                    break
+                finally:
+                    db.close()
+                handled += count
+                if count < consumer.batch_size:
+                    break
+        return handled
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if not self._stop.is_set():
+                self.run_once()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        # Tailing consumers start from where the outbox ends now
+        self.run_once([consumer for consumer in self.consumers if not consumer.durable])
+        self._thread = threading.Thread(target=self._run, name="outbox-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def prune_events(db: Session, older_than: timedelta) -> int:
+    """Delete events older than the retention that every durable consumer has passed"""
+    query = db.query(OutboxEvent).filter(OutboxEvent.created_at < datetime.utcnow() - older_than)
+    slowest = db.query(OutboxCheckpoint).order_by(OutboxCheckpoint.txid, OutboxCheckpoint.event_id).first()
+    if slowest is not None:
+        query = query.filter(or_(
+            OutboxEvent.txid < slowest.txid,
+            and_(OutboxEvent.txid == slowest.txid, OutboxEvent.id <= slowest.event_id)
+        ))
+    removed = query.delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+outbox_runner = OutboxRunner(SessionLocal, poll_interval=settings.outbox_poll_interval_seconds)
@@ -0,0 +1,341 @@
+"""
+Document revision history stored as periodic snapshots plus deltas.
+
+Every committed write records a revision numbered by the document version
+it produced. Most revisions are deltas against the revision before them;
+a full snapshot is stored every settings.revision_snapshot_interval
+revisions, and whenever the previous revision is missing (documents that
+predate history, writers that raced), so rebuilding any revision applies at
+most interval - 1 deltas.
+
+A delta is {"set": {field: value}, "diff": {field: ops}}. title,
+content_type and styles are replaced outright; content (split into lines
+and tags) and content_blocks are stored as edit scripts over the previous
+sequence:
+
+    ["=", n]      keep the next n items
+    ["-", n]      drop the next n items
+    ["+", items]  insert items
+
+Compaction thins out old history: within each time bucket only the last
+revision survives, and the deltas in between are merged into it. Snapshots
+and the newest compacted revision are always kept, so every delta still
+applies to the revision stored immediately before it.
+"""
+import difflib
+import json
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.document import Document
+from app.models.document_revision import DocumentRevision
+from app.services.block_store import load_blocks
+
+STATE_FIELDS = ("title", "content", "content_type", "content_blocks", "styles")
+
+# Lines, or HTML up to and including the end of a tag
+_CONTENT_CHUNK = re.compile(r"[^\n>]*[\n>]|[^\n>]+")
+
+_MISSING = object()
+
+
+class RevisionChainBroken(Exception):
+    """Raised when stored deltas do not line up with the revision they apply to"""
+
+
+# -- Deltas -------------------------------------------------------------------
+
+def _content_items(content: Optional[str]) -> List[str]:
+    return _CONTENT_CHUNK.findall(content or "")
+
+
+def _block_key(block: dict) -> str:
+    return json.dumps(block, sort_keys=True, separators=(",", ":"))
+
+
+def diff_sequence(old: List[Any], new: List[Any], key: Optional[Callable[[Any], Any]] = None) -> List[list]:
+    """Edit script turning old into new"""
+    old_keys = [key(item) for item in old] if key else old
+    new_keys = [key(item) for item in new] if key else new
+    ops: List[list] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_keys, new_keys).get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i2 - i1])
+            continue
+        if i2 > i1:
+            ops.append(["-", i2 - i1])
+        if j2 > j1:
+            ops.append(["+", new[j1:j2]])
+    return ops
+
+
+def apply_sequence(old: List[Any], ops: List[list]) -> List[Any]:
+    result: List[Any] = []
+    index = 0
+    for op, argument in ops:
+        if op == "=":
+            result.extend(old[index:index + argument])
+            index += argument
+        elif op == "-":
+            index += argument
+        elif op == "+":
+            result.extend(argument)
+        else:
+            raise RevisionChainBroken(f"Unknown delta operation '{op}'")
+    if index != len(old):
+        raise RevisionChainBroken("Delta does not match the revision it applies to")
+    return result
+
+
+def make_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> dict:
+    """
+    Delta for the fields in current.
+
+    previous must hold the old content / content_blocks whenever those are
+    in current; other fields are simply replaced.
+    """
+    delta: dict = {"set": {}, "diff": {}}
+    for field, value in current.items():
+        old = previous.get(field, _MISSING)
+        if field == "content" and isinstance(old, str) and isinstance(value, str):
+            delta["diff"][field] = diff_sequence(_content_items(old), _content_items(value))
+        elif field == "content_blocks" and old is not _MISSING:
+            delta["diff"][field] = diff_sequence(old or [], value or [], key=_block_key)
+        else:
+            delta["set"][field] = value
+    return delta
+
+
+def block_delta(index: int, remaining: int, removed: int = 0, inserted: Optional[List[dict]] = None) -> dict:
+    """
+    Delta for a block-granular write without loading the whole block list.
+
+    index is the position of the edit, remaining the number of blocks after
+    the removed ones in the previous revision.
+    """
+    ops: List[list] = []
+    if index:
+        ops.append(["=", index])
+    if removed:
+        ops.append(["-", removed])
+    if inserted:
+        ops.append(["+", inserted])
+    if remaining:
+        ops.append(["=", remaining])
+    return {"set": {}, "diff": {"content_blocks": ops}}
+
+
+def apply_delta(state: Dict[str, Any], delta: dict) -> Dict[str, Any]:
+    state = dict(state)
+    state.update(delta.get("set", {}))
+    diff = delta.get("diff", {})
+    if "content" in diff:
+        state["content"] = "".join(apply_sequence(_content_items(state.get("content")), diff["content"]))
+    if "content_blocks" in diff:
+        state["content_blocks"] = apply_sequence(state.get("content_blocks") or [], diff["content_blocks"])
+    return state
+
+
+# -- Recording ------------------------------------------------------------------
+
+def current_state(db: Session, document_id: int) -> Dict[str, Any]:
+    """Full state of a document as stored in this transaction"""
+    row = db.query(
+        Document.title,
+        Document.content,
+        Document.content_type,
+        Document.styles
+    ).filter(Document.id == document_id).one()
+    return {
+        "title": row.title,
+        "content": row.content,
+        "content_type": row.content_type,
+        "content_blocks": load_blocks(db, document_id),
+        "styles": row.styles
+    }
+
+
+def record_revision(
+    db: Session,
+    document_id: int,
+    version: int,
+    delta: Optional[dict],
+    author_id: Optional[int] = None
+) -> DocumentRevision:
+    """
+    Store revision `version` in the current transaction.
+
+    delta is relative to revision version - 1; pass None when it cannot be
+    computed. A snapshot is stored instead when delta is None, the previous
+    revision is missing, or the delta chain has reached the snapshot
+    interval. The caller commits.
+    """
+    interval = max(settings.revision_snapshot_interval, 1)
+    snapshot = delta is None
+    if not snapshot:
+        recent = db.query(DocumentRevision.revision, DocumentRevision.kind).filter(
+            DocumentRevision.document_id == document_id,
+            DocumentRevision.revision < version
+        ).order_by(DocumentRevision.revision.desc()).limit(interval).all()
+
+        chain = 0
+        snapshot = True
+        if recent and recent[0].revision == version - 1:
+            for row in recent:
+                chain += 1
+                if row.kind == "snapshot":
+                    snapshot = chain >= interval
+                    break
+
+    if snapshot:
+        revision = DocumentRevision(
+            document_id=document_id,
+            revision=version,
+            kind="snapshot",
+            data=current_state(db, document_id),
+            author_id=author_id
+        )
+    else:
+        revision = DocumentRevision(
+            document_id=document_id,
+            revision=version,
+            kind="delta",
+            base_revision=version - 1,
+            data=delta,
+            author_id=author_id
+        )
+    db.add(revision)
+    db.flush()
+    return revision
+
+
+# -- Reading ----------------------------------------------------------------------
+
+def list_revisions(db: Session, document_id: int, skip: int = 0, limit: int = 50) -> list:
+    """Revision metadata, newest first; the stored data is not loaded"""
+    return db.query(
+        DocumentRevision.revision,
+        DocumentRevision.kind,
+        DocumentRevision.author_id,
+        DocumentRevision.created_at
+    ).filter(
+        DocumentRevision.document_id == document_id
+    ).order_by(DocumentRevision.revision.desc()).offset(skip).limit(limit).all()
+
+
+def _rebuild(rows: List[DocumentRevision]) -> Dict[str, Any]:
+    """Replay a snapshot followed by the deltas stored after it"""
+    if not rows or rows[0].kind != "snapshot":
+        raise RevisionChainBroken("Revision chain does not start with a snapshot")
+
+    state = dict(rows[0].data)
+    for previous, row in zip(rows, rows[1:]):
+        if row.base_revision != previous.revision:
+            raise RevisionChainBroken(
+                f"Revision {row.revision} applies to {row.base_revision}, found {previous.revision}"
+            )
+        state = apply_delta(state, row.data)
+    return state
+
+
+def get_revision(db: Session, document_id: int, revision: int) -> Optional[dict]:
+    """
+    Rebuild one revision; returns None if it is not stored.
+
+    Reads the nearest snapshot at or before it and the deltas in between,
+    which is bounded by the snapshot interval.
+    """
+    target = db.query(DocumentRevision.revision).filter(
+        DocumentRevision.document_id == document_id,
+        DocumentRevision.revision == revision
+    ).first()
+    if target is None:
+        return None
+
+    snapshot_revision = db.query(DocumentRevision.revision).filter(
+        DocumentRevision.document_id == document_id,
+        DocumentRevision.kind == "snapshot",
+        DocumentRevision.revision <= revision
+    ).order_by(DocumentRevision.revision.desc()).limit(1).scalar()
+    if snapshot_revision is None:
+        raise RevisionChainBroken(f"No snapshot at or before revision {revision}")
+
+    rows = db.query(DocumentRevision).filter(
+        DocumentRevision.document_id == document_id,
+        DocumentRevision.revision >= snapshot_revision,
+        DocumentRevision.revision <= revision
+    ).order_by(DocumentRevision.revision).all()
+
+    last = rows[-1]
+    return {
+        "document_id": document_id,
+        "revision": last.revision,
+        "kind": last.kind,
+        "author_id": last.author_id,
+        "created_at": last.created_at,
+        **_rebuild(rows)
+    }
+
+
+# -- Compaction -------------------------------------------------------------------
+
+def _full_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> dict:
+    changed = {
+        field: current.get(field)
+        for field in STATE_FIELDS
+        if current.get(field) != previous.get(field)
+    }
+    return make_delta(previous, changed)
+
+
+def compact_revisions(db: Session, document_id: int, cutoff: datetime, bucket_seconds: int) -> int:
+    """
+    Merge deltas created before cutoff so one revision per time bucket remains.
+
+    Returns the number of revisions removed. The caller commits.
+    """
+    rows = db.query(DocumentRevision).filter(
+        DocumentRevision.document_id == document_id,
+        DocumentRevision.created_at < cutoff
+    ).order_by(DocumentRevision.revision).all()
+    if len(rows) < 2:
+        return 0
+
+    # The newest old revision stays: the first newer delta applies to it
+    keep = {rows[-1].revision}
+    last_in_bucket: Dict[int, int] = {}
+    for row in rows:
+        if row.kind == "snapshot":
+            keep.add(row.revision)
+        last_in_bucket[int(row.created_at.timestamp()) // bucket_seconds] = row.revision
+    keep.update(last_in_bucket.values())
+    if len(keep) == len(rows):
+        return 0
+
+    # A document's first revision is always a snapshot and is never removed
+    if rows[0].kind != "snapshot":
+        raise RevisionChainBroken(f"Document {document_id} history does not start with a snapshot")
+
+    state: Dict[str, Any] = {}
+    kept_state: Dict[str, Any] = {}
+    kept_revision: Optional[int] = None
+    removed = 0
+    for row in rows:
+        state = dict(row.data) if row.kind == "snapshot" else apply_delta(state, row.data)
+
+        if row.revision not in keep:
+            db.delete(row)
+            removed += 1
+            continue
+
+        if row.kind == "delta" and row.base_revision != kept_revision:
+            row.data = _full_delta(kept_state, state)
+            row.base_revision = kept_revision
+        kept_state, kept_revision = state, row.revision
+
+    db.flush()
+    return removed
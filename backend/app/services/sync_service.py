@@ -0,0 +1,175 @@
+"""
+Incremental sync: what changed in a user's document list since a cursor.
+
+Every write stamps a change sequence on the rows it touches:
+
+- documents.change_seq on any change to the document (content, title,
+  blocks), so modified documents are found by sequence
+- document_collaborators.change_seq when access is granted or the role
+  changes, so documents newly shared with a user are found even if the
+  document itself has not changed in a long time
+- document_tombstones rows, one per user, when a document is deleted or a
+  user's access is revoked; regaining access removes the tombstone
+
+On PostgreSQL the sequence is the writing transaction's id
+(txid_current()). A reader's cursor is the oldest transaction still running
+when it read (txid_snapshot_xmin), and the next sync returns everything
+stamped at or after it. A write that commits after a sync with an older
+transaction id than what that sync returned is still picked up, at the
+cost of occasionally repeating a document; clients apply results as
+upserts and deletes, so repeats are harmless. Other databases serialize
+writers, and the sequence is simply one past the highest stamp.
+
+Cursors are opaque to clients. Results come in pages ordered by
+(sequence, document id); a cursor for a partial result carries the page
+position as well as where the following sync starts.
+"""
+import base64
+import binascii
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import String, and_, case, cast, func, null, or_, select, union_all
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from app.models.document import Document
+from app.models.document_collaborator import DocumentCollaborator
+from app.models.document_tombstone import DocumentTombstone
+
+
+class InvalidSyncCursor(ValueError):
+    """Raised for cursors this server did not issue"""
+
+
+def next_change_seq(db: Session):
+    """SQL expression for the change sequence of the current write"""
+    if db.bind.dialect.name == "postgresql":
+        return func.txid_current()
+    stamps = union_all(
+        select(func.max(Document.change_seq).label("seq")),
+        select(func.max(DocumentCollaborator.change_seq)),
+        select(func.max(DocumentTombstone.change_seq))
+    ).subquery()
+    return select(func.coalesce(func.max(stamps.c.seq), 0) + 1).scalar_subquery()
+
+
+def _sync_low_water_mark(db: Session) -> int:
+    """Sequence from which the next sync must start to miss nothing committed later"""
+    if db.bind.dialect.name == "postgresql":
+        return db.scalar(select(func.txid_snapshot_xmin(func.txid_current_snapshot())))
+    return db.scalar(select(next_change_seq(db)))
+
+
+def record_tombstones(db: Session, document_id: int, user_ids: Iterable[int], reason: str) -> None:
+    """Report a document as gone for these users; the caller commits"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    clear_tombstones(db, document_id, user_ids)
+    seq = next_change_seq(db)
+    db.add_all([
+        DocumentTombstone(user_id=user_id, document_id=document_id, reason=reason, change_seq=seq)
+        for user_id in user_ids
+    ])
+
+
+def clear_tombstones(db: Session, document_id: int, user_ids: Iterable[int]) -> None:
+    """Forget earlier removals once users can see the document again; the caller commits"""
+    db.query(DocumentTombstone).filter(
+        DocumentTombstone.document_id == document_id,
+        DocumentTombstone.user_id.in_(list(user_ids))
+    ).delete(synchronize_session=False)
+
+
+# -- Cursors ---------------------------------------------------------------------
+
+def encode_cursor(since: int, page: Optional[Tuple[int, int, int]] = None) -> str:
+    """A cursor for a new sync from since, or for the page after page=(next_since, seq, document_id)"""
+    parts = [since, *(page or ())]
+    return base64.urlsafe_b64encode(".".join(str(part) for part in parts).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, Optional[Tuple[int, int, int]]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        parts = [int(part) for part in raw.split(".")]
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidSyncCursor("Invalid sync cursor")
+    if len(parts) == 1:
+        return parts[0], None
+    if len(parts) == 4:
+        return parts[0], (parts[1], parts[2], parts[3])
+    raise InvalidSyncCursor("Invalid sync cursor")
+
+
+# -- Reading ---------------------------------------------------------------------
+
+def get_changes(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 100) -> dict:
+    """
+    Documents the user can access that changed since the cursor, plus removals.
+
+    Without a cursor every accessible document is returned (and no
+    removals). Returns {"documents", "removed", "cursor", "has_more"};
+    pass the returned cursor to the next call, right away while has_more
+    is set, later to pick up new changes.
+    """
+    since, page = decode_cursor(cursor) if cursor is not None else (0, None)
+    if page is None:
+        # Taken before reading, so the next sync covers anything committed meanwhile
+        next_since, after = _sync_low_water_mark(db), None
+    else:
+        next_since, after = page[0], page[1:]
+
+    document_seq = case(
+        (Document.change_seq > DocumentCollaborator.change_seq, Document.change_seq),
+        else_=DocumentCollaborator.change_seq
+    )
+    visible = select(
+        document_seq.label("seq"),
+        Document.id.label("document_id"),
+        cast(null(), String(10)).label("reason")
+    ).join_from(DocumentCollaborator, Document, DocumentCollaborator.document_id == Document.id).where(
+        DocumentCollaborator.user_id == user_id,
+        or_(Document.change_seq >= since, DocumentCollaborator.change_seq >= since)
+    )
+    parts = [visible]
+    if since > 0:
+        parts.append(select(
+            DocumentTombstone.change_seq,
+            DocumentTombstone.document_id,
+            DocumentTombstone.reason
+        ).where(
+            DocumentTombstone.user_id == user_id,
+            DocumentTombstone.change_seq >= since
+        ))
+    changes = union_all(*parts).subquery()
+
+    query = select(changes.c.seq, changes.c.document_id, changes.c.reason)
+    if after is not None:
+        query = query.where(or_(
+            changes.c.seq > after[0],
+            and_(changes.c.seq == after[0], changes.c.document_id > after[1])
+        ))
+    rows = db.execute(query.order_by(changes.c.seq, changes.c.document_id).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    document_ids = [row.document_id for row in rows if row.reason is None]
+    documents = {
+        document.id: document
+        for document in db.query(Document).filter(Document.id.in_(document_ids)).options(
+            undefer(Document.content),
+            selectinload(Document.blocks)
+        )
+    } if document_ids else {}
+
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(since, (next_since, last.seq, last.document_id))
+    else:
+        next_cursor = encode_cursor(next_since)
+    return {
+        "documents": [documents[document_id] for document_id in document_ids if document_id in documents],
+        "removed": [{"document_id": row.document_id, "reason": row.reason} for row in rows if row.reason is not None],
+        "cursor": next_cursor,
+        "has_more": has_more
+    }
@@ -0,0 +1,2 @@
+from .hub import collaboration_access_consumer, hub
+from .routes import router as websocket_router
@@ -0,0 +1,438 @@
+"""
+Pub/sub backplane that carries collaboration events between workers.
+
+A room only reaches the sockets of its own worker, so every worker with a
+room open for a document subscribes to that document's channel and
+publishes what it relays locally; the other workers replay those events to
+their own members. Events are JSON objects; the backplane stamps them with
+the publishing worker and never hands a worker its own events back.
+
+InMemoryBackplane connects the hubs of one process (tests, single-worker
+deployments). PostgresBackplane uses LISTEN/NOTIFY on database_url:
+
+- a channel per document (collab_doc_<id>), LISTENed to only while this
+  worker has a room open for it
+- events published within collab_backplane_flush_seconds are batched into
+  one notification per channel and sent in a single round trip
+- NOTIFY payloads are limited (8000 bytes by default), so larger batches
+  are split into numbered chunks and reassembled on the receiving side;
+  notifications from one connection arrive in order, and incomplete
+  messages are dropped after a minute
+- a lost connection is reopened: the listener with a backoff, re-LISTENing
+  every subscribed channel, the publisher on the next flush, with the
+  unsent batch put back in the queue. Notifications sent while the
+  listener is away are missed.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.engine import make_url
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[int, dict], Awaitable[None]]
+
+CHANNEL_PREFIX = "collab_doc_"
+CHUNK_TIMEOUT_SECONDS = 60.0
+
+backplane_published = metrics.counter("collab_backplane_events_published_total", "Events published to other workers")
+backplane_received = metrics.counter("collab_backplane_events_received_total", "Events received from other workers")
+backplane_notifications = metrics.counter(
+    "collab_backplane_notifications_total",
+    "Notifications sent, after batching and chunking"
+)
+backplane_dropped = metrics.counter(
+    "collab_backplane_dropped_total",
+    "Incoming notifications that could not be used",
+    ["reason"]
+)
+backplane_reconnects = metrics.counter(
+    "collab_backplane_reconnects_total",
+    "Backplane connections reopened after being lost",
+    ["connection"]
+)
+backplane_channels = metrics.gauge("collab_backplane_channels", "Document channels this worker is subscribed to")
+
+
+class Backplane(ABC):
+    """Interface the collaboration hub talks to"""
+
+    # Whether other workers may hold rooms for the same document
+    distributed = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._handler: Optional[Handler] = None
+        self._subscriptions: Dict[int, int] = defaultdict(int)
+        self._inbox: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler) -> None:
+        self._handler = handler
+        self._inbox = asyncio.Queue()
+        self._consumer = asyncio.ensure_future(self._consume())
+
+    async def stop(self) -> None:
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        self._handler = None
+
+    async def subscribe(self, document_id: int) -> None:
+        """Start receiving a document's events; calls are counted, one per room"""
+        self._subscriptions[document_id] += 1
+        if self._subscriptions[document_id] == 1:
+            await self._listen(document_id)
+        backplane_channels.set(len(self._subscriptions))
+
+    async def unsubscribe(self, document_id: int) -> None:
+        if self._subscriptions.get(document_id, 0) == 0:
+            return
+        self._subscriptions[document_id] -= 1
+        if self._subscriptions[document_id] == 0:
+            del self._subscriptions[document_id]
+            await self._unlisten(document_id)
+        backplane_channels.set(len(self._subscriptions))
+
+    @abstractmethod
+    def publish(self, document_id: int, event: dict) -> None:
+        """Queue an event for the other workers; never blocks"""
+
+    async def _listen(self, document_id: int) -> None:
+        pass
+
+    async def _unlisten(self, document_id: int) -> None:
+        pass
+
+    def _deliver(self, document_id: int, events: List[dict]) -> None:
+        """Hand received events to the hub, one at a time and in arrival order"""
+        if self._inbox is not None and document_id in self._subscriptions:
+            self._inbox.put_nowait((document_id, events))
+
+    async def _consume(self) -> None:
+        while True:
+            document_id, events = await self._inbox.get()
+            for event in events:
+                backplane_received.inc()
+                try:
+                    await self._handler(document_id, event)
+                except Exception:
+                    logger.exception("Failed to handle collaboration event for document %s", document_id)
+
+
+class InMemoryBus:
+    """Connects InMemoryBackplanes of the same process"""
+
+    def __init__(self):
+        self.members: Set["InMemoryBackplane"] = set()
+
+
+class InMemoryBackplane(Backplane):
+    """
+    Delivers to the other backplanes on the same bus.
+
+    Events are round-tripped through JSON like they would be on the wire.
+    With a private bus (the default) there is nobody to deliver to.
+    """
+
+    def __init__(self, bus: Optional[InMemoryBus] = None):
+        super().__init__()
+        self.bus = bus if bus is not None else InMemoryBus()
+        self.distributed = bus is not None
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self.bus.members.add(self)
+
+    async def stop(self) -> None:
+        self.bus.members.discard(self)
+        await super().stop()
+
+    def publish(self, document_id: int, event: dict) -> None:
+        payload = json.dumps({**event, "origin": self.worker_id})
+        backplane_published.inc()
+        for member in self.bus.members:
+            if member is not self and document_id in member._subscriptions:
+                member._deliver(document_id, [json.loads(payload)])
+
+
+class PostgresBackplane(Backplane):
+    """LISTEN/NOTIFY on the application database"""
+
+    distributed = True
+
+    def __init__(self, database_url: str, payload_limit: int, flush_interval: float, max_batch: int):
+        super().__init__()
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.payload_limit = payload_limit
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._listener = None
+        self._listener_fd: Optional[int] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._publisher = None
+        self._queue: List[Tuple[int, dict]] = []
+        self._wakeup = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._message_ids = itertools.count(1)
+        # (origin, message id) -> (first seen, parts received so far)
+        self._partial: Dict[Tuple[str, int], Tuple[float, Dict[int, str]]] = {}
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        connection = psycopg2.connect(self.dsn)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self._attach_listener(await run_in_threadpool(self._connect))
+        self._publisher = await run_in_threadpool(self._connect)
+        self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        try:
+            await self._flush()
+        except Exception:
+            logger.exception("Failed to publish collaboration events on shutdown")
+        self._detach_listener()
+        if self._publisher is not None:
+            self._publisher.close()
+            self._publisher = None
+        await super().stop()
+
+    @staticmethod
+    def channel(document_id: int) -> str:
+        return f"{CHANNEL_PREFIX}{int(document_id)}"
+
+    async def _listen(self, document_id: int) -> None:
+        # Without a listener, a reconnect is under way and LISTENs every subscribed channel
+        listener = self._listener
+        if listener is not None:
+            try:
+                await run_in_threadpool(listener.cursor().execute, f"LISTEN {self.channel(document_id)}")
+            except Exception:
+                self._listener_lost(listener)
+                return
+            # Notifications read while executing do not make the socket readable again
+            self._on_readable()
+
+    async def _unlisten(self, document_id: int) -> None:
+        listener = self._listener
+        if listener is not None:
+            try:
+                await run_in_threadpool(listener.cursor().execute, f"UNLISTEN {self.channel(document_id)}")
+            except Exception:
+                self._listener_lost(listener)
+
+    # -- Listener connection ----------------------------------------------------
+
+    def _attach_listener(self, listener) -> None:
+        self._listener = listener
+        self._listener_fd = listener.fileno()
+        asyncio.get_running_loop().add_reader(self._listener_fd, self._on_readable)
+
+    def _detach_listener(self) -> None:
+        if self._listener_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._listener_fd)
+            self._listener_fd = None
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+
+    def _listener_lost(self, listener) -> None:
+        if listener is not self._listener:
+            return
+        logger.warning("Lost the collaboration backplane listener connection; reconnecting", exc_info=True)
+        self._detach_listener()
+        self._reconnect_task = asyncio.ensure_future(self._reconnect_listener())
+
+    async def _reconnect_listener(self) -> None:
+        delay = 0.5
+        while True:
+            listener = None
+            try:
+                listener = await run_in_threadpool(self._connect)
+                listened: Set[int] = set()
+                # Rooms opened meanwhile are subscribed too; nothing else runs between the last check and attaching
+                while set(self._subscriptions) - listened:
+                    pending = set(self._subscriptions) - listened
+                    await run_in_threadpool(
+                        listener.cursor().execute,
+                        "; ".join(f"LISTEN {self.channel(document_id)}" for document_id in sorted(pending))
+                    )
+                    listened |= pending
+            except Exception:
+                logger.warning("Could not reconnect the collaboration backplane listener", exc_info=True)
+                if listener is not None:
+                    listener.close()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            break
+        self._reconnect_task = None
+        self._attach_listener(listener)
+        backplane_reconnects.inc(connection="listener")
+        logger.info("Collaboration backplane listener reconnected, %d channels", len(listened))
+        self._on_readable()
+
+    # -- Publishing -------------------------------------------------------------
+
+    def publish(self, document_id: int, event: dict) -> None:
+        self._queue.append((document_id, event))
+        backplane_published.inc()
+        if len(self._queue) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                failures = 0
+            except Exception:
+                logger.exception("Failed to publish collaboration events")
+                # Back off while the database is unreachable
+                failures += 1
+                await asyncio.sleep(min(self.flush_interval * 2 ** failures, 30.0))
+
+    def _chunks(self, body: str) -> List[str]:
+        """Notification payloads for one message, each within the payload limit"""
+        message_id = next(self._message_ids)
+        size = len(body)
+        while True:
+            parts = [body[start:start + size] for start in range(0, len(body), size)] or [""]
+            payloads = [
+                json.dumps({"o": self.worker_id, "m": message_id, "i": index, "n": len(parts), "d": part})
+                for index, part in enumerate(parts)
+            ]
+            if all(len(payload.encode("utf-8")) <= self.payload_limit for payload in payloads):
+                return payloads
+            size = max(size // 2, 1)
+
+    async def _flush(self) -> None:
+        if not self._queue or self._publisher is None:
+            return
+        queue, self._queue = self._queue, []
+
+        batches: Dict[int, List[dict]] = defaultdict(list)
+        for document_id, event in queue:
+            batches[document_id].append(event)
+        notifications = [
+            (self.channel(document_id), payload)
+            for document_id, events in batches.items()
+            for payload in self._chunks(json.dumps(events, separators=(",", ":")))
+        ]
+
+        def send():
+            with self._publisher.cursor() as cursor:
+                # One round trip; all notifications go out in one transaction, in order
+                cursor.execute(
+                    "SELECT " + ", ".join("pg_notify(%s, %s)" for _ in notifications),
+                    [value for notification in notifications for value in notification]
+                )
+
+        try:
+            if self._publisher.closed:
+                self._publisher = await run_in_threadpool(self._connect)
+                backplane_reconnects.inc(connection="publisher")
+            await run_in_threadpool(send)
+        except Exception:
+            # Sent again on the next flush, ahead of anything published since; a
+            # closed connection is reopened then
+            self._queue[:0] = queue
+            try:
+                self._publisher.close()
+            except Exception:
+                pass
+            raise
+        backplane_notifications.inc(len(notifications))
+
+    # -- Receiving --------------------------------------------------------------
+
+    def _on_readable(self) -> None:
+        listener = self._listener
+        if listener is None:
+            return
+        try:
+            listener.poll()
+        except Exception:
+            self._listener_lost(listener)
+            return
+        while listener.notifies:
+            notification = listener.notifies.pop(0)
+            self._receive(notification.channel, notification.payload)
+
+    def _receive(self, channel: str, payload: str) -> None:
+        try:
+            envelope = json.loads(payload)
+            document_id = int(channel[len(CHANNEL_PREFIX):])
+        except (ValueError, TypeError):
+            backplane_dropped.inc(reason="malformed")
+            return
+        if envelope.get("o") == self.worker_id:
+            return
+
+        total = envelope.get("n", 1)
+        if total == 1:
+            body = envelope.get("d", "")
+        else:
+            key = (envelope.get("o"), envelope.get("m"))
+            now = time.monotonic()
+            started, parts = self._partial.setdefault(key, (now, {}))
+            parts[envelope.get("i")] = envelope.get("d", "")
+            for stale in [k for k, (first, _) in self._partial.items() if now - first > CHUNK_TIMEOUT_SECONDS]:
+                del self._partial[stale]
+                backplane_dropped.inc(reason="incomplete")
+            if len(parts) < total:
+                return
+            self._partial.pop(key, None)
+            body = "".join(parts[index] for index in range(total))
+
+        try:
+            events = json.loads(body)
+        except ValueError:
+            backplane_dropped.inc(reason="malformed")
+            return
+        origin = envelope.get("o")
+        self._deliver(document_id, [{**event, "origin": origin} for event in events])
+
+
+def create_backplane() -> Backplane:
+    if settings.collab_backplane == "memory":
+        return InMemoryBackplane()
+    if settings.collab_backplane == "postgres":
+        return PostgresBackplane(
+            settings.database_url,
+            payload_limit=settings.collab_backplane_payload_bytes,
+            flush_interval=settings.collab_backplane_flush_seconds,
+            max_batch=settings.collab_backplane_max_batch
+        )
+    raise ValueError(f"Unknown collab_backplane '{settings.collab_backplane}', expected memory or postgres")
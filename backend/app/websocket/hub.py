@@ -0,0 +1,598 @@
+"""
+In-memory collaboration rooms, one per open document.
+
+Each room numbers the operations it relays with a per-room sequence and
+keeps the most recent collab_history_size of them, so a client that
+reconnects with the room epoch and last sequence it saw can be caught up
+without a reload. Rooms live only in this worker and are dropped when their
+last member leaves, which starts a new epoch; a client whose sequence is
+older than the retained history, or from another epoch, gets a full state
+snapshot instead.
+
+Each room holds a CRDT replica of the document (services/crdt.py) loaded
+when the first member joins. Operations are applied to it before they are
+relayed, and the visible state is written back to content_blocks at most
+every collab_persist_interval_seconds and when the room closes. Presence
+is batched per room, see presence.py.
+
+Workers share rooms through a backplane (backplane.py): everything a room
+relays is also published to the other workers with a room for the same
+document, which apply remote operations to their own replica and relay the
+messages to their members under their own sequence. A worker opening a
+room while others have it open takes over their replica's snapshot, so
+element ids line up; until then remote events are held back.
+
+Roles are checked when a socket joins and then follow the document outbox
+(services/outbox.py), which every worker tails: a member who loses access,
+or whose document is deleted, is disconnected, and a changed role applies
+to the open connection from the next message on.
+"""
+import asyncio
+import itertools
+import logging
+import secrets
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import WebSocket, status
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core import metrics
+from app.database import SessionLocal
+from app.models.outbox import OutboxEvent
+from app.services.crdt import CRDTDocument, InvalidOperation, load_document, save_document
+from app.services.outbox import OutboxConsumer
+from app.websocket.backplane import Backplane, create_backplane
+from app.websocket.presence import RoomPresence
+
+logger = logging.getLogger(__name__)
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+collab_rooms = metrics.gauge("collab_rooms_active", "Documents with at least one connected collaborator")
+collab_connections = metrics.gauge("collab_connections_active", "Open collaboration sockets")
+collab_messages_received = metrics.counter("collab_messages_received_total", "Messages received from collaboration sockets", ["type"])
+collab_messages_sent = metrics.counter("collab_messages_sent_total", "Messages delivered to collaboration sockets")
+collab_catchups = metrics.counter("collab_catchups_total", "Reconnects served from room history or told to resync", ["result"])
+collab_room_members = metrics.histogram(
+    "collab_room_members",
+    "Members in a room, observed whenever someone joins",
+    buckets=(1, 2, 3, 5, 10, 25, 50, 100)
+)
+collab_ops_applied = metrics.counter("collab_ops_applied_total", "CRDT operations applied by rooms")
+collab_ops_rejected = metrics.counter("collab_ops_rejected_total", "Operation messages rejected as invalid")
+collab_persists = metrics.counter("collab_persists_total", "Room state written back to the database", ["result"])
+collab_send_queue_depth = metrics.histogram(
+    "collab_send_queue_depth",
+    "Messages waiting in a connection's send queue, observed at every write",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+collab_send_batches = metrics.counter("collab_send_batches_total", "Frames that carried several queued messages")
+collab_send_overflows = metrics.counter("collab_send_overflows_total", "Send queues that overflowed", ["policy"])
+collab_send_dropped = metrics.counter("collab_send_dropped_total", "Queued messages dropped on overflow")
+collab_send_resyncs = metrics.counter("collab_send_resyncs_total", "State messages sent in place of dropped ones")
+collab_slow_disconnects = metrics.counter("collab_slow_disconnects_total", "Sockets closed for not reading fast enough")
+collab_remote_rejected = metrics.counter(
+    "collab_remote_ops_rejected_total",
+    "Operations from other workers this worker's replica could not apply"
+)
+collab_replica_handoffs = metrics.counter(
+    "collab_replica_handoffs_total",
+    "Rooms that started from another worker's replica instead of the database"
+)
+collab_access_changes = metrics.counter(
+    "collab_access_changes_total",
+    "Open connections whose access to the document changed",
+    ["result"]
+)
+
+# Connection ids double as CRDT sites and presence keys, so they must not
+# collide across workers: each worker counts up from a random offset
+_connection_ids = itertools.count((secrets.randbits(32) << 20) + 1)
+
+
+class Connection:
+    """
+    One authenticated socket in a room.
+
+    Messages are queued and written by the connection's own writer task,
+    so a slow reader never holds up the room. When several are waiting
+    they go out as one {"type": "batch", "messages": [...]} frame. The
+    queue is bounded by collab_send_queue_size; when it overflows, the
+    "resync" policy drops everything queued and sends the current state
+    instead once the client catches up, "disconnect" closes the socket.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, role: str):
+        self.id = next(_connection_ids)
+        self.websocket = websocket
+        self.user_id = user_id
+        self.role = role
+        self.last_received_at = time.monotonic()
+        self.max_queue = settings.collab_send_queue_size
+        self.batch_size = settings.collab_send_batch_size
+        self.policy = settings.collab_slow_consumer_policy
+        # Builds the state message sent after a "resync" overflow
+        self.resync_message: Optional[Callable[[], dict]] = None
+        self.outbox: Deque[dict] = deque()
+        self.needs_resync = False
+        self.closing = False
+        # (code, reason) when the server closes the socket for a reason other than lag
+        self.close_reason: Optional[Tuple[int, str]] = None
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def can_edit(self) -> bool:
+        return self.role in ("owner", "editor")
+
+    def start(self) -> None:
+        self._writer = asyncio.ensure_future(self._write())
+
+    async def stop(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def close(self, code: int, reason: str) -> None:
+        """Close the socket from the writer task; anything still queued is dropped"""
+        self.close_reason = (code, reason)
+        self.closing = True
+        self.outbox.clear()
+        self._wakeup.set()
+
+    def send(self, message: dict) -> bool:
+        """Queue a message; returns False if it was dropped"""
+        if self.closing:
+            return False
+        if len(self.outbox) >= self.max_queue:
+            collab_send_overflows.inc(policy=self.policy)
+            collab_send_dropped.inc(len(self.outbox) + 1)
+            self.outbox.clear()
+            if self.policy == "resync" and self.resync_message is not None:
+                self.needs_resync = True
+            else:
+                self.closing = True
+            self._wakeup.set()
+            return False
+        self.outbox.append(message)
+        self._wakeup.set()
+        return True
+
+    async def _write(self) -> None:
+        websocket = self.websocket
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while True:
+                    if self.closing:
+                        if self.close_reason is not None:
+                            code, reason = self.close_reason
+                        else:
+                            collab_slow_disconnects.inc()
+                            code, reason = status.WS_1013_TRY_AGAIN_LATER, "Client is not reading fast enough"
+                        await websocket.close(code=code, reason=reason)
+                        return
+                    if self.needs_resync:
+                        # Replaces every message dropped so far, and any queued after it that it covers
+                        self.needs_resync = False
+                        collab_send_resyncs.inc()
+                        await websocket.send_json(self.resync_message())
+                        collab_messages_sent.inc()
+                        continue
+                    if not self.outbox:
+                        break
+                    collab_send_queue_depth.observe(len(self.outbox))
+                    if len(self.outbox) == 1:
+                        frame = self.outbox.popleft()
+                        sent = 1
+                    else:
+                        messages = [self.outbox.popleft() for _ in range(min(len(self.outbox), self.batch_size))]
+                        frame = {"type": "batch", "messages": messages}
+                        sent = len(messages)
+                        collab_send_batches.inc()
+                    await websocket.send_json(frame)
+                    collab_messages_sent.inc(sent)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The receive loop notices the broken socket and leaves the room
+            logger.debug("Writer for connection %s stopped: %s", self.id, e)
+            self.closing = True
+            self.outbox.clear()
+
+
+class Room:
+    def __init__(self, document_id: int, history_size: int):
+        self.document_id = document_id
+        self.epoch = uuid.uuid4().hex[:12]
+        self.members: Dict[int, Connection] = {}
+        self.seq = 0
+        self.history: Deque[Tuple[int, dict]] = deque(maxlen=history_size)
+        self.created_at = time.time()
+        self.messages_in = 0
+        self.messages_out = 0
+        self.document: Optional[CRDTDocument] = None
+        self.version: Optional[int] = None
+        self.dirty = False
+        self.last_author_id: Optional[int] = None
+        self.lock = asyncio.Lock()
+        self.persist_task: Optional[asyncio.Task] = None
+        self.presence = RoomPresence()
+        self.presence_task: Optional[asyncio.Task] = None
+        # Remote events that arrived before the replica was settled
+        self.backlog: List[dict] = []
+        self.handoff: Optional[asyncio.Future] = None
+        self.subscribed = False
+
+    def next_message(self, message: dict) -> dict:
+        """Stamp a relayed message with the next sequence and keep it for catch-up"""
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.history.append((self.seq, message))
+        return message
+
+    def since(self, seq: int) -> Optional[List[dict]]:
+        """Messages after seq, or None if some of them are no longer retained"""
+        if seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.history or self.history[0][0] > seq + 1:
+            return None
+        return [message for message_seq, message in self.history if message_seq > seq]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "document_id": self.document_id,
+            "epoch": self.epoch,
+            "members": len(self.members),
+            "users": sorted({connection.user_id for connection in self.members.values()}),
+            "seq": self.seq,
+            "history": len(self.history),
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "version": self.version,
+            "dirty": self.dirty,
+            "presence": len(self.presence.entries),
+            "age_seconds": round(time.time() - self.created_at, 1)
+        }
+
+
+class CollaborationHub:
+    def __init__(
+        self,
+        history_size: int,
+        persist_interval: float,
+        presence_interval: float,
+        presence_ttl: float,
+        backplane: Backplane,
+        handoff_timeout: float
+    ):
+        self.history_size = history_size
+        self.persist_interval = persist_interval
+        self.presence_interval = presence_interval
+        self.presence_ttl = presence_ttl
+        self.backplane = backplane
+        self.handoff_timeout = handoff_timeout
+        self.rooms: Dict[int, Room] = {}
+        # Final writes of rooms that just closed; a new room waits for them before loading
+        self.closing: Dict[int, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _update_gauges(self) -> None:
+        collab_rooms.set(len(self.rooms))
+        collab_connections.set(sum(len(room.members) for room in self.rooms.values()))
+
+    def join(self, document_id: int, connection: Connection) -> Room:
+        room = self.rooms.get(document_id)
+        if room is None:
+            room = self.rooms[document_id] = Room(document_id, self.history_size)
+        room.members[connection.id] = connection
+        collab_room_members.observe(len(room.members))
+        self._update_gauges()
+        return room
+
+    def leave(self, document_id: int, connection: Connection) -> Optional[Room]:
+        """Remove a member; returns the room if that closed it, so the caller can close() it"""
+        room = self.rooms.get(document_id)
+        if room is None:
+            return None
+        room.members.pop(connection.id, None)
+        room.presence.remove(connection.id)
+        closed = None
+        if not room.members:
+            closed = self.rooms.pop(document_id)
+        self._update_gauges()
+        return closed
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await self.backplane.start(self._on_remote)
+
+    async def stop(self) -> None:
+        """Write back every open room and disconnect from the other workers"""
+        await self.persist_all()
+        await self.backplane.stop()
+        self._loop = None
+
+    def access_changed(self, document_id: int, user_ids: Iterable[int], role: Optional[str], reason: str = "revoked") -> None:
+        """
+        Apply a role change to the users' open connections; role None
+        means their access is gone (reason "revoked" or "deleted"), which
+        disconnects them. Safe to call from any thread.
+        """
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._apply_access, document_id, frozenset(user_ids), role, reason)
+
+    def _apply_access(self, document_id: int, user_ids: frozenset, role: Optional[str], reason: str) -> None:
+        room = self.rooms.get(document_id)
+        if room is None:
+            return
+        for connection in list(room.members.values()):
+            if connection.user_id not in user_ids or connection.role == role:
+                continue
+            if role is None:
+                collab_access_changes.inc(result=reason)
+                if reason == "deleted":
+                    connection.close(CLOSE_NOT_FOUND, "Document was deleted")
+                else:
+                    connection.close(CLOSE_FORBIDDEN, "Access to this document was revoked")
+            else:
+                collab_access_changes.inc(result="role_changed")
+                connection.role = role
+                connection.send({"type": "role", "role": role})
+
+    async def load(self, room: Room) -> bool:
+        """
+        Load the room's replica if it has none yet; False if the document is gone.
+
+        The replica comes from the database, unless another worker answers
+        the handoff request with its own within handoff_timeout.
+        """
+        async with room.lock:
+            if room.document is not None:
+                return True
+            pending = self.closing.get(room.document_id)
+            if pending is not None:
+                await asyncio.shield(pending)
+            await self.backplane.subscribe(room.document_id)
+            room.subscribed = True
+            loaded = await run_in_threadpool(_load, room.document_id)
+            if loaded is None:
+                return False
+            version, document = loaded
+
+            if self.backplane.distributed:
+                room.handoff = asyncio.get_running_loop().create_future()
+                self.backplane.publish(room.document_id, {"kind": "handoff_request"})
+                try:
+                    snapshot = await asyncio.wait_for(asyncio.shield(room.handoff), self.handoff_timeout)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    document = CRDTDocument.from_snapshot(snapshot)
+                    collab_replica_handoffs.inc()
+                room.handoff = None
+
+            room.version, room.document = version, document
+            backlog, room.backlog = room.backlog, []
+            for event in backlog:
+                await self._on_remote(room.document_id, event)
+            return True
+
+    def _mark_dirty(self, room: Room, user_id: Optional[int]) -> None:
+        room.dirty = True
+        if user_id is not None:
+            room.last_author_id = user_id
+        if room.persist_task is None:
+            room.persist_task = asyncio.ensure_future(self._persist_later(room))
+
+    def apply(self, room: Room, ops: List[Any], site: str, user_id: int, applied: List[Any]) -> None:
+        """
+        Apply a message's operations to the room's replica.
+
+        The ones that changed it are appended to applied. Raises
+        InvalidOperation at the first bad operation; the ones before it stay
+        applied and the caller still relays them.
+        """
+        try:
+            for op in ops:
+                if room.document.apply(op, site):
+                    applied.append(op)
+        finally:
+            if applied:
+                collab_ops_applied.inc(len(applied))
+                self._mark_dirty(room, user_id)
+
+    def relay(self, room: Room, message: dict, exclude: Optional[Connection] = None) -> None:
+        """Send a message to the room's members and to the other workers' rooms"""
+        self.backplane.publish(room.document_id, {"kind": "message", "message": message})
+        self.broadcast(room.document_id, message, exclude)
+
+    async def _on_remote(self, document_id: int, event: dict) -> None:
+        """An event published by another worker's room for this document"""
+        room = self.rooms.get(document_id)
+        if room is None:
+            return
+        kind = event.get("kind")
+
+        if kind == "handoff_request":
+            if room.document is not None and room.handoff is None:
+                self.backplane.publish(document_id, {
+                    "kind": "handoff",
+                    "to": event.get("origin"),
+                    "snapshot": room.document.snapshot()
+                })
+            return
+        if kind == "handoff":
+            if room.handoff is not None and not room.handoff.done() and event.get("to") == self.backplane.worker_id:
+                room.handoff.set_result(event["snapshot"])
+            return
+        if kind != "message":
+            return
+        if room.document is None or room.handoff is not None:
+            room.backlog.append(event)
+            return
+
+        message = dict(event["message"])
+        message.pop("seq", None)
+        if message.get("type") == "op":
+            applied = []
+            try:
+                for op in message.get("ops") or []:
+                    if room.document.apply(op):
+                        applied.append(op)
+            except InvalidOperation as e:
+                collab_remote_rejected.inc()
+                logger.warning("Operation from another worker does not apply to document %s: %s", document_id, e)
+            if not applied:
+                return
+            collab_ops_applied.inc(len(applied))
+            self._mark_dirty(room, message.get("user_id"))
+            message = room.next_message({**message, "ops": applied})
+        self.broadcast(document_id, message)
+
+    async def _persist_later(self, room: Room) -> None:
+        await asyncio.sleep(self.persist_interval)
+        room.persist_task = None
+        # Shielded so close() cancelling the timer never abandons a write in flight
+        await asyncio.shield(self.persist(room))
+
+    async def persist(self, room: Room) -> None:
+        """Write the room's visible state back to the document if it changed"""
+        async with room.lock:
+            if not room.dirty or room.document is None:
+                return
+            blocks = room.document.to_blocks()
+            room.dirty = False
+            try:
+                version = await run_in_threadpool(_save, room.document_id, blocks, room.last_author_id)
+            except Exception:
+                room.dirty = True
+                collab_persists.inc(result="error")
+                logger.exception("Failed to persist collaboration state of document %s", room.document_id)
+                return
+            if version is None:
+                collab_persists.inc(result="missing")
+                return
+            room.version = version
+            collab_persists.inc(result="ok")
+
+    def update_presence(self, room: Room, connection: Connection, message: dict) -> None:
+        """Record a member's presence; it goes out with the room's next batch"""
+        room.presence.update(connection.id, connection.user_id, message)
+        if room.presence_task is None:
+            room.presence_task = asyncio.ensure_future(self._presence_loop(room))
+
+    async def _presence_loop(self, room: Room) -> None:
+        """One batched presence message per interval while the room has any presence"""
+        try:
+            while self.rooms.get(room.document_id) is room:
+                await asyncio.sleep(self.presence_interval)
+                room.presence.expire(self.presence_ttl)
+                message = room.presence.drain()
+                if message is not None:
+                    self.relay(room, message)
+                if not room.presence.active:
+                    break
+        finally:
+            room.presence_task = None
+
+    async def close(self, room: Room) -> None:
+        """Final write of a room that lost its last member"""
+        if room.presence_task is not None:
+            room.presence_task.cancel()
+        if room.persist_task is not None:
+            room.persist_task.cancel()
+            room.persist_task = None
+        future = self.closing[room.document_id] = asyncio.ensure_future(self.persist(room))
+        try:
+            await future
+        finally:
+            if self.closing.get(room.document_id) is future:
+                del self.closing[room.document_id]
+            if room.subscribed:
+                room.subscribed = False
+                await self.backplane.unsubscribe(room.document_id)
+
+    async def persist_all(self) -> None:
+        """Write back every open room, e.g. on shutdown"""
+        await asyncio.gather(*(self.persist(room) for room in list(self.rooms.values())))
+
+    def catch_up(self, document_id: int, epoch: Optional[str], last_seq: int) -> Optional[List[dict]]:
+        """Messages a reconnecting client missed, or None if it has to resync"""
+        room = self.rooms.get(document_id)
+        missed = room.since(last_seq) if room is not None and room.epoch == epoch else None
+        collab_catchups.inc(result="resync" if missed is None else "replayed")
+        return missed
+
+    def broadcast(self, document_id: int, message: dict, exclude: Optional[Connection] = None) -> None:
+        """Queue a message for every member of a room except `exclude`"""
+        room = self.rooms.get(document_id)
+        if room is None:
+            return
+        for connection in room.members.values():
+            if connection is not exclude and connection.send(message):
+                room.messages_out += 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [room.stats() for room in self.rooms.values()]
+
+
+def _load(document_id: int):
+    db = SessionLocal()
+    try:
+        return load_document(db, document_id)
+    finally:
+        db.close()
+
+
+def _save(document_id: int, blocks: List[dict], author_id: Optional[int]) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        return save_document(db, document_id, blocks, author_id)
+    finally:
+        db.close()
+
+
+class CollaborationAccessConsumer(OutboxConsumer):
+    """Tails the outbox for access changes that affect open collaboration sockets"""
+
+    name = "collaboration_access"
+    durable = False
+
+    def __init__(self, hub: CollaborationHub):
+        super().__init__()
+        self.hub = hub
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        for event in events:
+            data = event.data or {}
+            user_ids = data.get("user_ids") or ()
+            if event.event_type == "shared":
+                self.hub.access_changed(event.document_id, user_ids, data.get("role"))
+            elif event.event_type == "unshared":
+                self.hub.access_changed(event.document_id, user_ids, None)
+            elif event.event_type == "deleted":
+                self.hub.access_changed(event.document_id, user_ids, None, reason="deleted")
+
+
+hub = CollaborationHub(
+    history_size=settings.collab_history_size,
+    persist_interval=settings.collab_persist_interval_seconds,
+    presence_interval=settings.collab_presence_interval_seconds,
+    presence_ttl=settings.collab_presence_ttl_seconds,
+    backplane=create_backplane(),
+    handoff_timeout=settings.collab_backplane_handoff_seconds
+)
+
+collaboration_access_consumer = CollaborationAccessConsumer(hub)
@@ -0,0 +1,106 @@
+"""
+Ephemeral presence (who is here, where their cursor is) for collaboration rooms.
+
+Clients send {"type": "presence", "cursor": ..., "selection": ...} as often
+as they like. Each connection keeps only its latest state; once per
+collab_presence_interval_seconds the room sends everyone a single batched
+message with whatever changed since the last one:
+
+    {"type": "presence", "updates": [{"connection_id": 7, "user_id": 1, "cursor": ..., "selection": ...}],
+     "left": [8]}
+
+so a burst of cursor moves costs one fan-out per tick rather than one per
+move. Entries that have not been updated for collab_presence_ttl_seconds
+are dropped and reported in "left", as are members who disconnect.
+Presence lives in the room only and is never written to the database.
+"""
+import time
+from typing import Any, Dict, Optional, Set
+
+from app.core import metrics
+
+PRESENCE_FIELDS = ("cursor", "selection")
+
+presence_updates = metrics.counter("collab_presence_updates_total", "Presence updates received")
+presence_coalesced = metrics.counter(
+    "collab_presence_coalesced_total",
+    "Presence updates replaced by a newer one before they were sent"
+)
+presence_batches = metrics.counter("collab_presence_batches_total", "Batched presence messages sent to rooms")
+presence_expired = metrics.counter("collab_presence_expired_total", "Presence entries dropped after the TTL")
+
+
+class PresenceEntry:
+    __slots__ = ("connection_id", "user_id", "state", "updated_at")
+
+    def __init__(self, connection_id: int, user_id: int, state: Dict[str, Any], updated_at: float):
+        self.connection_id = connection_id
+        self.user_id = user_id
+        self.state = state
+        self.updated_at = updated_at
+
+    def to_dict(self) -> dict:
+        return {"connection_id": self.connection_id, "user_id": self.user_id, **self.state}
+
+
+class RoomPresence:
+    """Latest presence per connection in one room, plus what changed since the last batch"""
+
+    def __init__(self):
+        self.entries: Dict[int, PresenceEntry] = {}
+        self.pending: Set[int] = set()
+        self.left: Set[int] = set()
+
+    def update(self, connection_id: int, user_id: int, message: dict) -> None:
+        state = {field: message.get(field) for field in PRESENCE_FIELDS}
+        now = time.monotonic()
+        entry = self.entries.get(connection_id)
+        if entry is None:
+            self.entries[connection_id] = PresenceEntry(connection_id, user_id, state, now)
+        else:
+            entry.state = state
+            entry.updated_at = now
+        if connection_id in self.pending:
+            presence_coalesced.inc()
+        self.pending.add(connection_id)
+        self.left.discard(connection_id)
+        presence_updates.inc()
+
+    def remove(self, connection_id: int) -> None:
+        if self.entries.pop(connection_id, None) is not None:
+            self.pending.discard(connection_id)
+            self.left.add(connection_id)
+
+    def expire(self, ttl: float) -> None:
+        cutoff = time.monotonic() - ttl
+        stale = [connection_id for connection_id, entry in self.entries.items() if entry.updated_at < cutoff]
+        for connection_id in stale:
+            self.remove(connection_id)
+        if stale:
+            presence_expired.inc(len(stale))
+
+    def drain(self) -> Optional[dict]:
+        """The batched message for everything since the last call, or None if nothing changed"""
+        if not self.pending and not self.left:
+            return None
+        message = {
+            "type": "presence",
+            "updates": [self.entries[connection_id].to_dict() for connection_id in sorted(self.pending)],
+            "left": sorted(self.left)
+        }
+        self.pending.clear()
+        self.left.clear()
+        presence_batches.inc()
+        return message
+
+    def snapshot(self) -> dict:
+        """Everyone's current presence, for a member who just joined"""
+        return {
+            "type": "presence",
+            "updates": [entry.to_dict() for entry in self.entries.values()],
+            "left": []
+        }
+
+    @property
+    def active(self) -> bool:
+        return bool(self.entries or self.pending or self.left)
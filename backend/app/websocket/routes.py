@@ -0,0 +1,234 @@
+"""
+Collaboration socket: WS /ws/documents/{document_id}
+
+Protocol (JSON text frames):
+
+    client -> {"type": "join", "token": "<access token>", "epoch": "...", "last_seq": 42}
+    server <- {"type": "joined", "epoch": "...", "seq": 57, "role": "editor", "connection_id": 7, "site": "7", "members": [...]}
+              then the missed "op" messages if last_seq could be caught up,
+              otherwise {"type": "state", "seq": 57, "state": <CRDT snapshot>}
+    client -> {"type": "op", "client_seq": 3, "ops": [...]}          owner/editor only
+    server <- {"type": "ack", "client_seq": 3, "seq": 58}            to the sender
+              {"type": "op", "seq": 58, "user_id": 1, "connection_id": 7, "ops": [...]}  to everyone else
+    client -> {"type": "sync"}                                         server answers with "state"
+    client -> {"type": "presence", "cursor": ..., "selection": ...}  any member, see presence.py
+    server <- {"type": "presence", "updates": [...], "left": [...]}    batched, current presence after joining
+    both   -> {"type": "ping"} / {"type": "pong"}
+    server <- {"type": "member_joined" | "member_left", "user_id": 1, "connection_id": 7}
+              {"type": "role", "role": "reader"}      the member's role changed; applies from now on
+              {"type": "error", "detail": "...", "client_seq": 3}
+              {"type": "batch", "messages": [...]}   several of the above, sent when the client lags
+
+ops are CRDT operations (see services/crdt.py) whose new element ids must
+end in "@<site>". The server applies them before relaying, and relays only
+those that changed the document; if one is invalid the ones before it are
+still applied and relayed, the sender gets an error and should "sync".
+
+A client that falls collab_send_queue_size messages behind either gets a
+fresh "state" in place of everything it missed (collab_slow_consumer_policy
+"resync") or is closed with 1013 ("disconnect").
+
+The token is sent once in the join message rather than in the URL so it
+does not end up in access logs. Sockets are closed with 4401 (bad token),
+4403 (no access, also when it is revoked while connected) or 4404 (no such
+document, also when it is deleted while connected); the server pings a silent
+socket every collab_heartbeat_seconds and closes it after
+collab_idle_timeout_seconds without any message.
+"""
+import asyncio
+import json
+import time
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core.security import get_user_from_token
+from app.database import SessionLocal
+from app.services.crdt import InvalidOperation
+from app.services.document_service import get_document_by_id, get_user_role_for_document
+from app.websocket.hub import (
+    hub,
+    Connection,
+    Room,
+    CLOSE_FORBIDDEN,
+    CLOSE_NOT_FOUND,
+    CLOSE_UNAUTHORIZED,
+    collab_messages_received,
+    collab_ops_rejected
+)
+
+router = APIRouter(tags=["Collaboration"])
+
+MESSAGE_TYPES = ("ping", "pong", "op", "sync", "presence")
+
+
+def _authorize(document_id: int, token: str) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """Returns (close code or None, user id, role); runs in the threadpool"""
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(db, token)
+        if user is None:
+            return CLOSE_UNAUTHORIZED, None, None
+        if get_document_by_id(db, document_id) is None:
+            return CLOSE_NOT_FOUND, user.id, None
+        role = get_user_role_for_document(db, document_id, user.id)
+        if role is None:
+            return CLOSE_FORBIDDEN, user.id, None
+        return None, user.id, role
+    finally:
+        db.close()
+
+
+async def _receive(websocket: WebSocket) -> dict:
+    raw = await websocket.receive_text()
+    if len(raw) > settings.collab_max_message_bytes:
+        raise ValueError(f"Message exceeds {settings.collab_max_message_bytes} bytes")
+    try:
+        message = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("Message is not valid JSON")
+    if not isinstance(message, dict):
+        raise ValueError("Message must be a JSON object")
+    return message
+
+
+def _state_message(room: Room) -> dict:
+    return {"type": "state", "seq": room.seq, "state": room.document.snapshot()}
+
+
+@router.websocket("/ws/documents/{document_id}")
+async def collaborate(websocket: WebSocket, document_id: int):
+    """Join a document's collaboration room"""
+    await websocket.accept()
+
+    try:
+        join = await asyncio.wait_for(_receive(websocket), settings.collab_auth_timeout_seconds)
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, ValueError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Expected a join message")
+        return
+
+    if join.get("type") != "join" or not isinstance(join.get("token"), str):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Expected a join message")
+        return
+
+    close_code, user_id, role = await run_in_threadpool(_authorize, document_id, join["token"])
+    if close_code is not None:
+        reasons = {
+            CLOSE_UNAUTHORIZED: "Could not validate credentials",
+            CLOSE_FORBIDDEN: "Not authorized to access this document",
+            CLOSE_NOT_FOUND: "Document not found"
+        }
+        await websocket.close(code=close_code, reason=reasons[close_code])
+        return
+
+    connection = Connection(websocket, user_id, role)
+    site = str(connection.id)
+    room = hub.join(document_id, connection)
+    if not await hub.load(room):
+        closed = hub.leave(document_id, connection)
+        if closed is not None:
+            await hub.close(closed)
+        await websocket.close(code=CLOSE_NOT_FOUND, reason="Document not found")
+        return
+    connection.resync_message = lambda: _state_message(room)
+    connection.start()
+    last_seq = join.get("last_seq")
+    missed = hub.catch_up(document_id, join.get("epoch"), last_seq) if isinstance(last_seq, int) else None
+
+    try:
+        connection.send({
+            "type": "joined",
+            "epoch": room.epoch,
+            "seq": room.seq,
+            "role": role,
+            "connection_id": connection.id,
+            "site": site,
+            "members": [
+                {"user_id": member.user_id, "connection_id": member.id}
+                for member in room.members.values()
+            ]
+        })
+        if missed is None:
+            connection.send(_state_message(room))
+        for message in missed or []:
+            connection.send(message)
+        if room.presence.entries:
+            connection.send(room.presence.snapshot())
+        hub.relay(
+            room,
+            {"type": "member_joined", "user_id": user_id, "connection_id": connection.id},
+            exclude=connection
+        )
+
+        while not connection.closing:
+            try:
+                message = await asyncio.wait_for(_receive(websocket), settings.collab_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if time.monotonic() - connection.last_received_at >= settings.collab_idle_timeout_seconds:
+                    await websocket.close(code=status.WS_1001_GOING_AWAY, reason="Idle timeout")
+                    break
+                connection.send({"type": "ping"})
+                continue
+            except ValueError as e:
+                connection.send({"type": "error", "detail": str(e)})
+                continue
+
+            connection.last_received_at = time.monotonic()
+            message_type = message.get("type")
+            collab_messages_received.inc(type=message_type if message_type in MESSAGE_TYPES else "other")
+
+            if message_type == "ping":
+                connection.send({"type": "pong"})
+            elif message_type == "pong":
+                continue
+            elif message_type == "presence":
+                hub.update_presence(room, connection, message)
+            elif message_type == "sync":
+                connection.send(_state_message(room))
+            elif message_type == "op":
+                if not connection.can_edit:
+                    connection.send({"type": "error", "detail": "Readers cannot edit documents"})
+                    continue
+                if not isinstance(message.get("ops"), list):
+                    connection.send({"type": "error", "detail": "'ops' must be a list"})
+                    continue
+
+                room.messages_in += 1
+                applied = []
+                error = None
+                try:
+                    hub.apply(room, message["ops"], site, user_id, applied)
+                except InvalidOperation as e:
+                    collab_ops_rejected.inc()
+                    error = str(e)
+
+                relayed = None
+                if applied:
+                    relayed = room.next_message({
+                        "type": "op",
+                        "user_id": user_id,
+                        "connection_id": connection.id,
+                        "ops": applied
+                    })
+                if error is not None:
+                    connection.send({"type": "error", "detail": error, "client_seq": message.get("client_seq")})
+                else:
+                    connection.send({"type": "ack", "client_seq": message.get("client_seq"), "seq": room.seq})
+                if relayed is not None:
+                    hub.relay(room, relayed, exclude=connection)
+            else:
+                connection.send({"type": "error", "detail": f"Unknown message type '{message_type}'"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await connection.stop()
+        closed = hub.leave(document_id, connection)
+        if closed is not None:
+            # Shielded: the handler may be cancelled on shutdown, the last write must still land
+            await asyncio.shield(hub.close(closed))
+        else:
+            hub.relay(room, {"type": "member_left", "user_id": user_id, "connection_id": connection.id})
@@ -0,0 +1,107 @@
+"""
+Compress existing document bodies in place.
+
+Rows written before compression was enabled (or converted by the
+e4a8c3d1b659 migration) are plain UTF-8, which the compressed column types
+read as-is. This rewrites the ones at or above
+settings.compression_threshold_bytes in id-ordered batches, committing
+after each batch, so it can be stopped and resumed with --start-id.
+
+Run from the backend directory against a migrated database:
+
+    python scripts/backfill_compression.py --dry-run
+    python scripts/backfill_compression.py --batch-size 500
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sqlalchemy as sa  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models.types import compress_bytes, is_compressed  # noqa: E402
+
+# Raw views of the compressed columns, bypassing the type decorators
+TARGETS = {
+    "documents": sa.table("documents", sa.column("id", sa.Integer), sa.column("content", sa.LargeBinary)),
+    "document_blocks": sa.table("document_blocks", sa.column("id", sa.Integer), sa.column("data", sa.LargeBinary)),
+}
+COLUMNS = {"documents": "content", "document_blocks": "data"}
+
+
+def backfill_table(db, name: str, batch_size: int, start_id: int, dry_run: bool) -> None:
+    table = TARGETS[name]
+    column = table.c[COLUMNS[name]]
+    scanned = rewritten = bytes_before = bytes_after = 0
+    last_id = start_id - 1
+    started = time.perf_counter()
+
+    while True:
+        rows = db.execute(
+            sa.select(table.c.id, column)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        for row_id, value in rows:
+            last_id = row_id
+            scanned += 1
+            if value is None or is_compressed(value):
+                continue
+            raw = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+            if len(raw) < settings.compression_threshold_bytes:
+                continue
+            stored = compress_bytes(raw)
+            if stored is raw:
+                continue  # Did not compress smaller
+            rewritten += 1
+            bytes_before += len(raw)
+            bytes_after += len(stored)
+            if not dry_run:
+                db.execute(table.update().where(table.c.id == row_id).values({column.name: stored}))
+
+        if not dry_run:
+            db.commit()
+        print(f"  {name}: scanned {scanned}, up to id {last_id} ({time.perf_counter() - started:.0f}s)", end="\r")
+
+    print()
+    saved = bytes_before - bytes_after
+    ratio = bytes_before / bytes_after if bytes_after else 0.0
+    verb = "would compress" if dry_run else "compressed"
+    print(
+        f"{name}: {verb} {rewritten} of {scanned} rows, "
+        f"{bytes_before / 1e6:.2f} MB -> {bytes_after / 1e6:.2f} MB "
+        f"(saved {saved / 1e6:.2f} MB, ratio {ratio:.2f}x)"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", choices=sorted(TARGETS), action="append", help="default: all tables")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--start-id", type=int, default=1, help="resume from this row id")
+    parser.add_argument("--dry-run", action="store_true", help="report savings without writing")
+    args = parser.parse_args()
+
+    print(
+        f"Threshold {settings.compression_threshold_bytes} bytes, "
+        f"{settings.compression_algorithm} level {settings.compression_level}"
+    )
+    db = SessionLocal()
+    try:
+        for name in args.table or sorted(TARGETS, reverse=True):
+            backfill_table(db, name, args.batch_size, args.start_id, args.dry_run)
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Slow-reader load test for collaboration socket broadcasts.
+
+Runs one room in-process with fast readers and slow readers (each frame
+takes --slow-ms to write) while a producer broadcasts operations at --rate
+messages per second, once per slow consumer policy. Reports how far the
+fast readers lag behind the producer, how much the slow readers' queues
+held at most, and the drops, resyncs, batches and disconnects the policy
+caused. Bounded queues should keep fast-reader latency flat and memory
+bounded no matter how slow the slow readers are.
+
+    python scripts/bench_backpressure.py
+    python scripts/bench_backpressure.py --slow 20 --slow-ms 500 --rate 2000 --queue-size 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core import metrics  # noqa: E402
+from app.services.crdt import CRDTDocument  # noqa: E402
+from app.websocket.hub import Connection  # noqa: E402
+
+COUNTERS = (
+    "collab_send_dropped_total",
+    "collab_send_resyncs_total",
+    "collab_send_batches_total",
+    "collab_slow_disconnects_total",
+)
+
+
+class Reader:
+    """Stands in for a WebSocket; write_seconds is how long each frame takes to go out"""
+
+    def __init__(self, write_seconds: float):
+        self.write_seconds = write_seconds
+        self.frames = 0
+        self.messages = 0
+        self.latencies = []
+        self.closed_with = None
+
+    async def send_json(self, frame: dict) -> None:
+        await asyncio.sleep(self.write_seconds)
+        self.frames += 1
+        messages = frame["messages"] if frame.get("type") == "batch" else [frame]
+        now = time.perf_counter()
+        for message in messages:
+            self.messages += 1
+            if "sent_at" in message:
+                self.latencies.append(now - message["sent_at"])
+
+    async def close(self, code: int, reason: str) -> None:
+        self.closed_with = code
+
+
+def counter_totals() -> dict:
+    instruments = {metric.name: metric for metric in metrics.registered_metrics()}
+    return {name: sum(value for _, value in instruments[name].samples()) for name in COUNTERS}
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def run(policy: str, args) -> None:
+    document = CRDTDocument.from_blocks([{"id": "b1", "text": "x" * 2000}])
+    fast = [Reader(0.0) for _ in range(args.fast)]
+    slow = [Reader(args.slow_ms / 1000) for _ in range(args.slow)]
+    connections = []
+    for reader in fast + slow:
+        connection = Connection(reader, user_id=1, role="editor")
+        connection.max_queue = args.queue_size
+        connection.policy = policy
+        connection.resync_message = lambda: {"type": "state", "state": document.snapshot()}
+        connection.start()
+        connections.append(connection)
+
+    before = counter_totals()
+    max_depth = 0
+    interval = 1 / args.rate
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < args.seconds:
+        message = {"type": "op", "seq": sent, "ops": [{"op": "insert", "id": f"{sent + 1}@1"}], "sent_at": time.perf_counter()}
+        for connection in connections:
+            connection.send(message)
+        sent += 1
+        max_depth = max(max_depth, max(len(connection.outbox) for connection in connections))
+        await asyncio.sleep(max(0.0, started + sent * interval - time.perf_counter()))
+    await asyncio.sleep(0.2)
+
+    after = counter_totals()
+    for connection in connections:
+        await connection.stop()
+
+    fast_latency = [latency for reader in fast for latency in reader.latencies]
+    print(f"policy={policy}: {sent} messages in {args.seconds}s")
+    print(
+        f"  fast readers: {statistics.mean(reader.messages for reader in fast):.0f} messages each, "
+        f"latency p50 {percentile(fast_latency, 0.5) * 1000:.2f}ms p99 {percentile(fast_latency, 0.99) * 1000:.2f}ms"
+    )
+    if slow:
+        print(
+            f"  slow readers: {statistics.mean(reader.messages for reader in slow):.0f} messages in "
+            f"{statistics.mean(reader.frames for reader in slow):.0f} frames each, "
+            f"{sum(1 for reader in slow if reader.closed_with)} disconnected"
+        )
+    print(f"  max queue depth {max_depth} (limit {args.queue_size})")
+    print("  " + ", ".join(f"{name} +{after[name] - before[name]:.0f}" for name in COUNTERS))
+
+
+async def main_async(args) -> None:
+    for policy in args.policy or ("resync", "disconnect"):
+        tracemalloc.start()
+        await run(policy, args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  peak traced memory {peak / 1e6:.1f} MB")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fast", type=int, default=20, help="readers that keep up")
+    parser.add_argument("--slow", type=int, default=5, help="readers that fall behind")
+    parser.add_argument("--slow-ms", type=float, default=200.0, help="time a slow reader takes per frame")
+    parser.add_argument("--rate", type=int, default=1000, help="messages broadcast per second")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--policy", choices=("resync", "disconnect"), action="append", help="default: both")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
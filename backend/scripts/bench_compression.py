@@ -0,0 +1,133 @@
+"""
+Storage and CPU trade-off of document body compression.
+
+Compresses a corpus of document bodies with each available codec and level
+and reports the compression ratio and compress/decompress throughput, plus
+the per-document latency the API pays on a write and a read. The corpus is
+either sampled from the database (--from-db) or generated: HTML-ish
+paragraphs from 1 KB up to the 1 MB content limit.
+
+    python scripts/bench_compression.py
+    python scripts/bench_compression.py --from-db 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sqlalchemy as sa  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.models.types import decompress_bytes  # noqa: E402
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WORDS = (
+    "the a of to and in for on with team project plan release customer "
+    "feedback design review quarterly budget roadmap milestone draft notes "
+    "meeting action item owner deadline risk dependency summary analysis"
+).split()
+SIZES = (1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000)
+
+
+def generated_corpus(rng: random.Random, per_size: int):
+    corpus = []
+    for size in SIZES:
+        for _ in range(per_size):
+            parts = []
+            length = 0
+            while length < size:
+                sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize()
+                tag = rng.choice(("p", "p", "p", "li", "h2"))
+                part = f"<{tag}>{sentence}.</{tag}>"
+                parts.append(part)
+                length += len(part)
+            corpus.append("".join(parts)[:size].encode("utf-8"))
+    return corpus
+
+
+def database_corpus(limit: int):
+    from app.database import engine
+
+    documents = sa.table("documents", sa.column("id", sa.Integer), sa.column("content", sa.LargeBinary))
+    with engine.connect() as connection:
+        rows = connection.execute(
+            sa.select(documents.c.content).where(documents.c.content.isnot(None)).limit(limit)
+        ).scalars().all()
+    return [decompress_bytes(value) for value in rows if value]
+
+
+def codecs():
+    for level in (1, 6, 9):
+        yield f"zlib-{level}", (lambda data, level=level: zlib.compress(data, level)), zlib.decompress
+    if zstandard is not None:
+        for level in (1, 3, 9):
+            compressor = zstandard.ZstdCompressor(level=level)
+            yield f"zstd-{level}", compressor.compress, zstandard.ZstdDecompressor().decompress
+
+
+def bench(corpus, threshold: int, repeat: int) -> None:
+    eligible = [data for data in corpus if len(data) >= threshold]
+    total = sum(len(data) for data in corpus)
+    eligible_total = sum(len(data) for data in eligible)
+    print(
+        f"{len(corpus)} bodies, {total / 1e6:.2f} MB; {len(eligible)} at or above the "
+        f"{threshold} byte threshold ({eligible_total / 1e6:.2f} MB)"
+    )
+    if not eligible:
+        return
+
+    print(f"{'codec':<8} {'ratio':>6} {'stored MB':>10} {'comp MB/s':>10} {'decomp MB/s':>12} {'write/doc':>10} {'read/doc':>9}")
+    for name, compress, decompress in codecs():
+        compressed = [compress(data) for data in eligible]
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for data in eligible:
+                compress(data)
+        compress_seconds = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for data in compressed:
+                decompress(data)
+        decompress_seconds = (time.perf_counter() - started) / repeat
+
+        stored = total - eligible_total + sum(len(data) + 2 for data in compressed)
+        print(
+            f"{name:<8} {total / stored:6.2f} {stored / 1e6:10.2f} "
+            f"{eligible_total / 1e6 / compress_seconds:10.1f} "
+            f"{eligible_total / 1e6 / decompress_seconds:12.1f} "
+            f"{compress_seconds / len(eligible) * 1000:8.3f}ms "
+            f"{decompress_seconds / len(eligible) * 1000:7.3f}ms"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-db", type=int, metavar="N", help="sample N document bodies from the database")
+    parser.add_argument("--per-size", type=int, default=20, help="generated bodies per size bucket")
+    parser.add_argument("--threshold", type=int, default=settings.compression_threshold_bytes)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.from_db:
+        corpus = database_corpus(args.from_db)
+    else:
+        corpus = generated_corpus(random.Random(args.seed), args.per_size)
+    if zstandard is None:
+        print("zstandard is not installed; reporting zlib only")
+    bench(corpus, args.threshold, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
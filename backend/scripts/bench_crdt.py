@@ -0,0 +1,216 @@
+"""
+Convergence fuzzing and throughput of the collaboration CRDT.
+
+fuzz: simulated clients edit their own replicas concurrently and exchange
+operations through a server replica the way the collaboration socket does
+(each client's messages arrive in order, the server relays in the order it
+applied them, deliveries are randomly delayed). Clients also join midway
+from a snapshot and retransmit messages the server already has. After
+every round all replicas must hold identical state, tombstones included.
+
+throughput: operations per second one server replica applies to a single
+document, for a typing-heavy mix of inserts, deletes, formatting and block
+edits. Exits non-zero below --target (the 10k ops/s budget per document).
+
+    python scripts/bench_crdt.py
+    python scripts/bench_crdt.py --rounds 500 --clients 5 --ops 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.crdt import CRDTDocument  # noqa: E402
+
+SEED_BLOCKS = [
+    {"id": "intro", "type": "heading1", "text": "Quarterly plan"},
+    {"id": "body", "type": "paragraph", "content": [
+        {"text": "Draft ", "styles": {}},
+        {"text": "notes", "styles": {"fontWeight": "bold"}}
+    ]},
+]
+STYLES = ({}, {"fontWeight": "bold"}, {"fontStyle": "italic"}, {"color": "#FF0000"})
+
+
+class Client:
+    """A replica that generates operations against its own state"""
+
+    def __init__(self, site: str, document: CRDTDocument, rng: random.Random):
+        self.site = site
+        self.document = document
+        self.rng = rng
+        self.outbox = []
+        # Position in the server's relay log up to which this client is caught up
+        self.received = 0
+
+    def _next_id(self, count: int = 1) -> str:
+        lamport = self.document.clock + 1
+        self.document.clock += count
+        return f"{lamport}@{self.site}"
+
+    def edit(self) -> dict:
+        document = self.document
+        rng = self.rng
+        blocks = list(document.blocks)
+        visible = [key for key in blocks if key not in document.blocks.deleted]
+        roll = rng.random()
+
+        if not visible or roll < 0.05:
+            after = rng.choice(blocks + [None]) if blocks else None
+            op = {"op": "block_insert", "id": self._next_id(), "after": after,
+                  "attrs": {"type": rng.choice(("paragraph", "heading2", "quote"))}}
+        elif roll < 0.07 and len(visible) > 1:
+            op = {"op": "block_delete", "block": rng.choice(visible)}
+        elif roll < 0.10:
+            op = {"op": "block_set", "id": self._next_id(), "block": rng.choice(blocks),
+                  "key": "styles", "value": {"textAlign": rng.choice(("left", "center", "right"))}}
+        else:
+            key = rng.choice(visible)
+            text = document.block_data[key].text
+            chars = list(text)
+            if roll < 0.70 or not chars:
+                word = rng.choice(("a", "b", "xy", "hello "))
+                op = {"op": "insert", "id": self._next_id(len(word)), "block": key,
+                      "after": rng.choice(chars + [None]) if chars else None, "text": word}
+                if rng.random() < 0.1:
+                    op["styles"] = rng.choice(STYLES[1:])
+            elif roll < 0.90:
+                start = rng.randrange(len(chars))
+                op = {"op": "delete", "block": key, "ids": chars[start:start + rng.randint(1, 4)]}
+            else:
+                start = rng.randrange(len(chars))
+                op = {"op": "format", "id": self._next_id(), "block": key,
+                      "ids": chars[start:start + rng.randint(1, 6)], "styles": rng.choice(STYLES)}
+
+        document.apply(op, self.site)
+        return op
+
+
+def fuzz(rounds: int, clients: int, steps: int, seed: int) -> None:
+    for round_number in range(rounds):
+        rng = random.Random(seed + round_number)
+        server = CRDTDocument.from_blocks(SEED_BLOCKS)
+        log = []  # Relayed messages: (sender site, ops)
+        replicas = [
+            Client(str(site), CRDTDocument.from_blocks(SEED_BLOCKS), random.Random(rng.random()))
+            for site in range(1, clients + 1)
+        ]
+        next_site = clients + 1
+
+        for _ in range(steps):
+            client = rng.choice(replicas)
+            action = rng.random()
+            if action < 0.5:
+                client.outbox.append([client.edit() for _ in range(rng.randint(1, 3))])
+            elif action < 0.75 and client.outbox:
+                # Deliver the client's oldest message to the server
+                ops = client.outbox.pop(0)
+                applied = [op for op in ops if server.apply(op, client.site)]
+                if rng.random() < 0.05:
+                    # A retransmission after a reconnect changes nothing
+                    assert not any(server.apply(op, client.site) for op in ops)
+                if applied:
+                    log.append((client.site, applied))
+            elif action < 0.97:
+                # Deliver some relayed messages to the client, skipping its own
+                until = rng.randint(client.received, len(log))
+                for site, ops in log[client.received:until]:
+                    if site != client.site:
+                        for op in ops:
+                            client.document.apply(op)
+                client.received = until
+            elif not client.outbox:
+                # A client joins from the server's snapshot
+                snapshot = server.snapshot()
+                joined = Client(str(next_site), CRDTDocument.from_snapshot(snapshot), random.Random(rng.random()))
+                joined.received = len(log)
+                replicas.append(joined)
+                next_site += 1
+
+        for client in replicas:
+            for ops in client.outbox:
+                log.append((client.site, [op for op in ops if server.apply(op, client.site)]))
+            client.outbox = []
+        expected = server.snapshot()
+        for client in replicas:
+            for site, ops in log[client.received:]:
+                if site != client.site:
+                    for op in ops:
+                        client.document.apply(op)
+            client.received = len(log)
+            if client.document.snapshot() != expected:
+                raise SystemExit(f"round {round_number}: replica {client.site} diverged from the server")
+            if client.document.to_blocks() != server.to_blocks():
+                raise SystemExit(f"round {round_number}: replica {client.site} renders differently")
+
+        blocks = server.to_blocks()
+        reloaded = CRDTDocument.from_blocks(blocks)
+        if reloaded.to_blocks() != blocks:
+            raise SystemExit(f"round {round_number}: persisted blocks do not reload to the same state")
+
+    print(f"fuzz: {rounds} rounds x {steps} steps with {clients} clients converged")
+
+
+def throughput(count: int, seed: int, target: float) -> bool:
+    rng = random.Random(seed)
+    writer = Client("1", CRDTDocument.from_blocks(SEED_BLOCKS), rng)
+    document = writer.document
+    blocks = list(document.blocks)
+    ops = []
+    cursor = {}
+    for _ in range(count):
+        # Mostly typing at a cursor, like a real session
+        key = rng.choice(blocks)
+        roll = rng.random()
+        if roll < 0.80:
+            op = {"op": "insert", "id": writer._next_id(), "block": key, "after": cursor.get(key), "text": rng.choice("etaoin shrdlu")}
+            cursor[key] = op["id"]
+        elif roll < 0.95 and cursor.get(key):
+            op = {"op": "delete", "block": key, "ids": [cursor[key]]}
+            cursor[key] = None
+        elif roll < 0.98 and cursor.get(key):
+            op = {"op": "format", "id": writer._next_id(), "block": key, "ids": [cursor[key]], "styles": {"fontWeight": "bold"}}
+        else:
+            op = {"op": "block_insert", "id": writer._next_id(), "after": key, "attrs": {"type": "paragraph"}}
+            blocks.append(op["id"])
+        document.apply(op, "1")
+        ops.append(op)
+
+    server = CRDTDocument.from_blocks(SEED_BLOCKS)
+    started = time.perf_counter()
+    for op in ops:
+        server.apply(op, "1")
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    stored = server.to_blocks()
+    persist_elapsed = time.perf_counter() - started
+
+    rate = count / elapsed
+    characters = sum(len(block.get("text") or "".join(span["text"] for span in block.get("content", []))) for block in stored)
+    print(
+        f"throughput: {count} ops in {elapsed:.3f}s = {rate:,.0f} ops/s "
+        f"(target {target:,.0f}); to_blocks of {len(stored)} blocks / {characters} chars in {persist_elapsed * 1000:.1f}ms"
+    )
+    return rate >= target
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="fuzz rounds")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients per fuzz round")
+    parser.add_argument("--steps", type=int, default=300, help="actions per fuzz round")
+    parser.add_argument("--ops", type=int, default=100_000, help="operations in the throughput run")
+    parser.add_argument("--target", type=float, default=10_000, help="minimum ops/s per document")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    fuzz(args.rounds, args.clients, args.steps, args.seed)
+    return 0 if throughput(args.ops, args.seed, args.target) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
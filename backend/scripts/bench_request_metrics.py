@@ -0,0 +1,84 @@
+"""
+Per-request overhead of RequestMetricsMiddleware.
+
+Calls a trivial ASGI app directly and through the middleware, in-process,
+with a route already set on the scope the way the router leaves it, and
+reports the added time per request. The middleware should stay within a
+few microseconds; --budget-us sets the limit and the exit status is 1 if
+the median overhead exceeds it.
+
+    python scripts/bench_request_metrics.py
+    python scripts/bench_request_metrics.py --requests 200000 --budget-us 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.request_metrics import RequestMetricsMiddleware  # noqa: E402
+
+
+class Route:
+    path = "/documents/{document_id}"
+
+
+START = {"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]}
+BODY = {"type": "http.response.body", "body": b'{"id": 42, "title": "Notes"}'}
+
+
+async def app(scope, receive, send):
+    scope["route"] = Route
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def time_app(target, requests: int) -> float:
+    """Seconds per request"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        await target({"type": "http", "method": "GET", "path": "/documents/42"}, receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args) -> list:
+    wrapped = RequestMetricsMiddleware(app)
+    await time_app(wrapped, 1000)
+    overheads = []
+    for _ in range(args.rounds):
+        plain = await time_app(app, args.requests)
+        measured = await time_app(wrapped, args.requests)
+        overheads.append((measured - plain) * 1e6)
+    return overheads
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget-us", type=float, default=5.0)
+    args = parser.parse_args()
+
+    overheads = asyncio.run(run(args))
+    median = statistics.median(overheads)
+    print(f"{args.rounds} rounds of {args.requests} requests")
+    print(f"  overhead per request: median {median:.2f}us, min {min(overheads):.2f}us, max {max(overheads):.2f}us")
+    if median > args.budget_us:
+        print(f"  over the {args.budget_us:g}us budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Cold-start cost of importing the app and its entry points.
+
+Imports each target module in a fresh interpreter --runs times and reports
+the median import time and the resident memory once it is imported, plus
+which of the export dependencies (BeautifulSoup, ReportLab, python-docx)
+came along. The API, the services CLI scripts and migrations use, and the
+exporters themselves are measured by default; only the exporters should
+load those dependencies. With --check, the exit status is 1 if any other
+target does.
+
+Run from the backend directory with the usual environment (.env):
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --check
+    python scripts/bench_startup.py app.main app.services.export_pdf
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DEFAULT_TARGETS = (
+    "app.main",
+    "app.services.document_service",
+    "app.models",
+    "app.services.export_pdf",
+    "app.services.export_docx",
+)
+EXPORT_DEPENDENCIES = ("bs4", "reportlab", "docx")
+EXPORT_TARGETS = ("app.services.export_pdf", "app.services.export_docx", "app.services.export_html")
+
+CHILD = """
+import json, os, sys, time
+baseline = int(open("/proc/self/statm").read().split()[1]) if os.path.exists("/proc/self/statm") else None
+started = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - started
+rss = int(open("/proc/self/statm").read().split()[1]) if baseline is not None else None
+page = os.sysconf("SC_PAGE_SIZE")
+print(json.dumps({
+    "seconds": seconds,
+    "rss_bytes": rss * page if rss is not None else None,
+    "added_bytes": (rss - baseline) * page if rss is not None else None,
+    "loaded": [name for name in sys.argv[2:] if name in sys.modules]
+}))
+"""
+
+
+def measure(target: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, target, *EXPORT_DEPENDENCIES],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def megabytes(value) -> str:
+    return f"{value / 1_048_576:7.1f}" if value is not None else "      -"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=list(DEFAULT_TARGETS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="fail if a non-export target loads export dependencies")
+    args = parser.parse_args()
+
+    print(f"{'module':<34} {'import ms':>9} {'RSS MB':>7} {'added MB':>8}  export dependencies")
+    failed = False
+    for target in args.targets:
+        runs = [measure(target) for _ in range(args.runs)]
+        loaded = runs[-1]["loaded"]
+        print(
+            f"{target:<34} {statistics.median(run['seconds'] for run in runs) * 1000:9.0f} "
+            f"{megabytes(runs[-1]['rss_bytes'])} {megabytes(runs[-1]['added_bytes']):>8}  {', '.join(loaded) or '-'}"
+        )
+        if loaded and target not in EXPORT_TARGETS:
+            failed = True
+    if args.check and failed:
+        print("Export dependencies are imported outside the exporters")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Typeahead latency benchmark over a large title corpus.
+
+Seeds N document titles (default one million) spread across bench users,
+then times typeahead_documents() for random prefixes and fuzzy queries with
+the result cache bypassed, and checks p95 against settings.typeahead_slo_ms.
+
+Run from the backend directory against a migrated database:
+
+    python scripts/bench_typeahead.py --titles 1000000
+    python scripts/bench_typeahead.py --skip-seed --queries 2000
+    python scripts/bench_typeahead.py --cleanup
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import insert, select, delete, text  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.document import Document  # noqa: E402
+from app.models.document_collaborator import DocumentCollaborator  # noqa: E402
+from app.services.document_service import typeahead_documents, _typeahead_cache  # noqa: E402
+
+EMAIL_PREFIX = "bench-typeahead-"
+WORDS = (
+    "project plan roadmap meeting notes design review budget report draft "
+    "quarterly summary proposal research analysis launch retro sprint "
+    "onboarding guide policy invoice contract spec architecture migration "
+    "postmortem interview hiring marketing sales customer feedback release"
+).split()
+
+
+def random_title(rng: random.Random, n: int) -> str:
+    words = rng.sample(WORDS, rng.randint(2, 5))
+    return f"{' '.join(words).capitalize()} {n}"
+
+
+def seed(db, titles: int, users: int, batch_size: int, rng: random.Random) -> None:
+    print(f"Seeding {titles} titles across {users} users...")
+    db.execute(insert(User), [
+        {
+            "username": f"{EMAIL_PREFIX}{i}",
+            "email": f"{EMAIL_PREFIX}{i}@example.com",
+            "hashed_password": "!",
+        }
+        for i in range(users)
+    ])
+    db.commit()
+    user_ids = db.execute(
+        select(User.id).where(User.email.like(f"{EMAIL_PREFIX}%")).order_by(User.id)
+    ).scalars().all()
+
+    created = 0
+    started = time.perf_counter()
+    while created < titles:
+        count = min(batch_size, titles - created)
+        rows = []
+        for n in range(created, created + count):
+            rows.append({
+                "title": random_title(rng, n),
+                "content": "",
+                "owner_id": user_ids[n % len(user_ids)],
+            })
+        doc_ids = db.execute(
+            insert(Document).returning(Document.id, Document.owner_id), rows
+        ).all()
+        db.execute(insert(DocumentCollaborator), [
+            {"document_id": doc_id, "user_id": owner_id, "role": "owner"}
+            for doc_id, owner_id in doc_ids
+        ])
+        db.commit()
+        created += count
+        print(f"  {created}/{titles} ({time.perf_counter() - started:.0f}s)", end="\r")
+    print()
+
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("ANALYZE documents"))
+        db.execute(text("ANALYZE document_collaborators"))
+        db.commit()
+
+
+def cleanup(db) -> None:
+    user_ids = select(User.id).where(User.email.like(f"{EMAIL_PREFIX}%"))
+    doc_ids = select(Document.id).where(Document.owner_id.in_(user_ids))
+    db.execute(delete(DocumentCollaborator).where(DocumentCollaborator.document_id.in_(doc_ids)))
+    db.execute(delete(Document).where(Document.owner_id.in_(user_ids)))
+    db.execute(delete(User).where(User.email.like(f"{EMAIL_PREFIX}%")))
+    db.commit()
+    print("Removed benchmark users and documents")
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_queries(db, queries: int, rng: random.Random):
+    user_ids = db.execute(
+        select(User.id).where(User.email.like(f"{EMAIL_PREFIX}%"))
+    ).scalars().all()
+    if not user_ids:
+        raise SystemExit("No benchmark users found - run without --skip-seed first")
+
+    cold, warm = [], []
+    for _ in range(queries):
+        word = rng.choice(WORDS)
+        # Mix of 1-6 character prefixes and slightly misspelled fuzzy input
+        if rng.random() < 0.8:
+            query = word[:rng.randint(1, min(6, len(word)))]
+        else:
+            query = word[:-1] + rng.choice("aeiou")
+        user_id = rng.choice(user_ids)
+
+        _typeahead_cache.clear()
+        started = time.perf_counter()
+        typeahead_documents(db, query, user_id, 10)
+        cold.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        typeahead_documents(db, query, user_id, 10)
+        warm.append((time.perf_counter() - started) * 1000)
+    return cold, warm
+
+
+def report(label: str, samples) -> None:
+    print(
+        f"{label:<8} p50={percentile(samples, 50):7.2f}ms "
+        f"p95={percentile(samples, 95):7.2f}ms "
+        f"p99={percentile(samples, 99):7.2f}ms "
+        f"mean={statistics.mean(samples):7.2f}ms"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse previously seeded rows")
+    parser.add_argument("--cleanup", action="store_true", help="delete benchmark rows and exit")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = SessionLocal()
+    try:
+        if args.cleanup:
+            cleanup(db)
+            return 0
+        if not args.skip_seed:
+            seed(db, args.titles, args.users, args.batch_size, rng)
+
+        cold, warm = run_queries(db, args.queries, rng)
+        report("uncached", cold)
+        report("cached", warm)
+
+        p95 = percentile(cold, 95)
+        if p95 > settings.typeahead_slo_ms:
+            print(f"FAIL: uncached p95 {p95:.2f}ms exceeds SLO {settings.typeahead_slo_ms}ms")
+            return 1
+        print(f"OK: uncached p95 within SLO {settings.typeahead_slo_ms}ms")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
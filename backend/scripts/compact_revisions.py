@@ -0,0 +1,76 @@
+"""
+Compact old document revision history.
+
+For revisions older than settings.revision_compaction_age_days, keeps the
+last revision in each settings.revision_compaction_bucket_minutes window
+(plus every snapshot) and merges the deltas in between into it. Each
+document is compacted and committed on its own, so the job can run from
+cron and be interrupted safely.
+
+Run from the backend directory:
+
+    python scripts/compact_revisions.py --dry-run
+    python scripts/compact_revisions.py --age-days 7 --bucket-minutes 1440
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import func  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app import models  # noqa: E402,F401
+from app.models.document_revision import DocumentRevision  # noqa: E402
+from app.services.revision_service import compact_revisions, RevisionChainBroken  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--age-days", type=float, default=settings.revision_compaction_age_days)
+    parser.add_argument("--bucket-minutes", type=int, default=settings.revision_compaction_bucket_minutes)
+    parser.add_argument("--document-id", type=int, action="append", help="default: every document with old revisions")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without committing")
+    args = parser.parse_args()
+
+    cutoff = datetime.utcnow() - timedelta(days=args.age_days)
+    bucket_seconds = args.bucket_minutes * 60
+    db = SessionLocal()
+    try:
+        query = db.query(DocumentRevision.document_id).filter(
+            DocumentRevision.created_at < cutoff
+        ).group_by(DocumentRevision.document_id).having(func.count(DocumentRevision.id) > 1)
+        if args.document_id:
+            query = query.filter(DocumentRevision.document_id.in_(args.document_id))
+        document_ids = [row.document_id for row in query.order_by(DocumentRevision.document_id)]
+
+        print(f"Compacting revisions older than {cutoff:%Y-%m-%d %H:%M} UTC in {len(document_ids)} documents")
+        started = time.perf_counter()
+        removed_total = failed = 0
+        for document_id in document_ids:
+            try:
+                removed = compact_revisions(db, document_id, cutoff, bucket_seconds)
+            except RevisionChainBroken as e:
+                db.rollback()
+                failed += 1
+                print(f"  document {document_id}: skipped, {e}")
+                continue
+            if args.dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            removed_total += removed
+
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"{verb} {removed_total} revisions in {time.perf_counter() - started:.1f}s ({failed} documents skipped)")
+        return 1 if failed else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+End-to-end load test for the HTTP API.
+
+Seeds --users users with --documents documents each through the API, then
+runs --concurrency virtual users for --duration seconds. Each picks an
+operation from --mix (weights) and a random seeded user and document:
+
+    login    POST /auth/login
+    list     GET  /documents/
+    get      GET  /documents/{id}
+    update   PUT  /documents/{id}
+    search   GET  /documents/search
+    share    POST /documents/{id}/share, then another user accepts the link
+    export   GET  /documents/{id}/export/pdf
+
+and reports throughput and p50/p95/p99 latency per endpoint. By default the
+app runs in-process (over ASGI, with its lifespan) against the database in
+the environment (.env), or a fresh SQLite file with --sqlite; the client
+then shares the process and CPU with the server, so compare runs made the
+same way. --url targets a running server instead (python -m app.server).
+
+--save writes the results as JSON; --baseline compares a run with saved
+results and exits 1 if any endpoint's p95 is more than --tolerance percent
+slower (endpoints with fewer than 20 requests in either run are not
+judged).
+
+Requires httpx (installed with FastAPI's test client). Run from the
+backend directory:
+
+    python scripts/loadtest.py --sqlite /tmp/loadtest.db --save baseline.json
+    python scripts/loadtest.py --sqlite /tmp/loadtest.db --baseline baseline.json
+    python scripts/loadtest.py --url http://127.0.0.1:8000 --concurrency 50 --duration 60
+    python scripts/loadtest.py --mix get=10,update=5,export=1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+PASSWORD = "Loadtest1!"
+OPERATIONS = ("login", "list", "get", "update", "search", "share", "export")
+DEFAULT_MIX = "login=2,list=20,get=30,update=15,search=10,share=3,export=1"
+WORDS = "plan review budget roadmap notes meeting release draft summary design".split()
+MIN_JUDGED = 20
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return "<p>" + " ".join(rng.choice(WORDS) for _ in range(words)) + "</p>"
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.users = []
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.shared = defaultdict(set)
+
+    async def request(self, name: str, method: str, url: str, user=None, **kwargs) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {user['token']}"} if user else {}
+        started = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        await response.aread()
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name][response.status_code] += 1
+        return response
+
+    # -- Seeding -----------------------------------------------------------------
+
+    async def seed(self, users: int, documents: int, concurrency: int) -> None:
+        run = uuid.uuid4().hex[:8]
+        limit = asyncio.Semaphore(concurrency)
+
+        async def seed_user(index: int):
+            async with limit:
+                email = f"load{run}{index}@example.com"
+                response = await self.client.post("/auth/register", json={
+                    "email": email, "username": f"load{run}{index}", "password": PASSWORD
+                })
+                response.raise_for_status()
+                user = {"email": email, "id": response.json()["id"], "documents": []}
+                await self.login(user, record=False)
+                for number in range(documents):
+                    response = await self.client.post("/documents/", headers={"Authorization": f"Bearer {user['token']}"}, json={
+                        "title": f"{self.rng.choice(WORDS).title()} {number}",
+                        "content": "".join(paragraph(self.rng, 60) for _ in range(5))
+                    })
+                    response.raise_for_status()
+                    user["documents"].append(response.json()["id"])
+                self.users.append(user)
+
+        await asyncio.gather(*(seed_user(index) for index in range(users)))
+
+    async def login(self, user: dict, record: bool = True) -> None:
+        data = {"username": user["email"], "password": PASSWORD}
+        if record:
+            response = await self.request("login", "POST", "/auth/login", data=data)
+        else:
+            response = await self.client.post("/auth/login", data=data)
+        response.raise_for_status()
+        user["token"] = response.json()["access_token"]
+
+    # -- Operations --------------------------------------------------------------
+
+    async def op_login(self, user):
+        await self.login(user)
+
+    async def op_list(self, user):
+        await self.request("list", "GET", "/documents/", user, params={"limit": 50})
+
+    async def op_get(self, user):
+        await self.request("get", "GET", f"/documents/{self.rng.choice(user['documents'])}", user)
+
+    async def op_update(self, user):
+        await self.request("update", "PUT", f"/documents/{self.rng.choice(user['documents'])}", user, json={
+            "content": "".join(paragraph(self.rng, 60) for _ in range(5))
+        })
+
+    async def op_search(self, user):
+        await self.request("search", "GET", "/documents/search", user, params={"q": self.rng.choice(WORDS)})
+
+    async def op_share(self, user):
+        document_id = self.rng.choice(user["documents"])
+        response = await self.request("share", "POST", f"/documents/{document_id}/share", user, json={"role": "reader"})
+        # Accepting a document one can already see is rejected, so pick someone new to it
+        others = [other for other in self.users if other is not user and other["id"] not in self.shared[document_id]]
+        if response.status_code < 400 and others:
+            other = self.rng.choice(others)
+            self.shared[document_id].add(other["id"])
+            await self.request("share_accept", "POST", f"/documents/share/{response.json()['token']}/accept", other)
+
+    async def op_export(self, user):
+        await self.request("export", "GET", f"/documents/{self.rng.choice(user['documents'])}/export/pdf", user)
+
+    # -- Running -----------------------------------------------------------------
+
+    async def run(self, mix: dict, concurrency: int, duration: float) -> float:
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user():
+            while time.perf_counter() < deadline:
+                name = self.rng.choices(names, weights)[0]
+                try:
+                    await getattr(self, f"op_{name}")(self.rng.choice(self.users))
+                except httpx.HTTPError as e:
+                    self.errors[name][e.__class__.__name__] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def results(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            endpoints[name] = {
+                "requests": len(ordered),
+                "errors": dict(self.errors.get(name, {})),
+                "throughput": len(ordered) / elapsed,
+                "p50_ms": percentile(ordered, 0.50) * 1000,
+                "p95_ms": percentile(ordered, 0.95) * 1000,
+                "p99_ms": percentile(ordered, 0.99) * 1000,
+                "mean_ms": statistics.fmean(ordered) * 1000
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {"elapsed_seconds": elapsed, "requests": total, "throughput": total / elapsed, "endpoints": endpoints}
+
+
+def print_results(results: dict) -> None:
+    print(f"{'endpoint':<14} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in results["endpoints"].items():
+        print(
+            f"{name:<14} {stats['requests']:>8} {sum(stats['errors'].values()):>6} {stats['throughput']:>8.1f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+    print(f"{'total':<14} {results['requests']:>8} {'':>6} {results['throughput']:>8.1f}  in {results['elapsed_seconds']:.1f}s")
+    for name, stats in results["endpoints"].items():
+        if stats["errors"]:
+            print(f"  {name} errors: {', '.join(f'{code} x{count}' for code, count in stats['errors'].items())}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change per endpoint; returns False if a p95 regressed beyond tolerance"""
+    print(f"\n{'endpoint':<14} {'p95 ms':>17} {'change':>8} {'req/s':>15} {'change':>8}")
+    ok = True
+    for name, stats in results["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            print(f"{name:<14} {'(not in baseline)':>17}")
+            continue
+        p95_change = (stats["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        rate_change = (stats["throughput"] / before["throughput"] - 1) * 100 if before["throughput"] else 0.0
+        judged = stats["requests"] >= MIN_JUDGED and before["requests"] >= MIN_JUDGED
+        regressed = judged and p95_change > tolerance
+        ok = ok and not regressed
+        print(
+            f"{name:<14} {before['p95_ms']:>7.1f} -> {stats['p95_ms']:>6.1f} {p95_change:>+7.1f}% "
+            f"{before['throughput']:>6.1f} -> {stats['throughput']:>5.1f} {rate_change:>+7.1f}%"
+            + ("  REGRESSED" if regressed else "")
+        )
+    return ok
+
+
+@contextlib.asynccontextmanager
+async def client_for(args):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            yield client
+        return
+
+    if args.sqlite:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.sqlite)}"
+    # Imported here so --sqlite takes effect before the settings are read
+    from app import models  # noqa: F401
+    from app.database import Base, engine
+    from app.main import app
+
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(engine)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            yield client
+
+
+async def main_async(args) -> int:
+    rng = random.Random(args.seed)
+    async with client_for(args) as client:
+        test = LoadTest(client, rng)
+        started = time.perf_counter()
+        await test.seed(args.users, args.documents, args.concurrency)
+        print(f"Seeded {args.users} users with {args.documents} documents each in {time.perf_counter() - started:.1f}s")
+        if args.warmup > 0:
+            await test.run(args.mix, args.concurrency, args.warmup)
+            test.latencies.clear()
+            test.errors.clear()
+        elapsed = await test.run(args.mix, args.concurrency, args.duration)
+    results = test.results(elapsed)
+    results["config"] = {
+        "users": args.users, "documents": args.documents, "concurrency": args.concurrency,
+        "duration": args.duration, "mix": args.mix, "target": args.url or ("sqlite" if args.sqlite else "in-process")
+    }
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            print(f"\np95 latency regressed more than {args.tolerance:g}% on at least one endpoint")
+            return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server; default: run the app in-process")
+    parser.add_argument("--sqlite", metavar="PATH", help="in-process against this SQLite file (tables are created)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--documents", type=int, default=5, help="per user")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed p95 regression, percent")
+    args = parser.parse_args()
+    if args.users < 1 or args.documents < 1:
+        parser.error("--users and --documents must be at least 1")
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Inspect, consume and prune the document outbox.
+
+status: outbox size and how far each durable consumer has got.
+
+tail: run a durable consumer that prints each event as a JSON line, for
+piping into external indexers. Its position is checkpointed under
+--consumer, so a restarted tail resumes where it stopped; a new name
+starts at the current end of the outbox.
+
+prune: delete events older than settings.outbox_retention_hours that every
+durable consumer has already processed.
+
+Run from the backend directory:
+
+    python scripts/outbox.py status
+    python scripts/outbox.py tail --consumer search-indexer --follow
+    python scripts/outbox.py prune --hours 24
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import func  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app import models  # noqa: E402,F401
+from app.models.outbox import OutboxCheckpoint, OutboxEvent  # noqa: E402
+from app.services.outbox import OutboxConsumer, OutboxRunner, prune_events  # noqa: E402
+
+
+class PrintingConsumer(OutboxConsumer):
+    def __init__(self, name: str, batch_size: int):
+        super().__init__()
+        self.name = name
+        self.batch_size = batch_size
+
+    def handle(self, db, events) -> None:
+        for event in events:
+            print(json.dumps({
+                "id": event.id,
+                "type": event.event_type,
+                "document_id": event.document_id,
+                "data": event.data,
+                "created_at": event.created_at.isoformat() if event.created_at else None
+            }))
+        sys.stdout.flush()
+
+
+def status() -> int:
+    db = SessionLocal()
+    try:
+        count, oldest, newest = db.query(
+            func.count(OutboxEvent.id), func.min(OutboxEvent.created_at), func.max(OutboxEvent.id)
+        ).one()
+        print(f"{count} events, oldest {oldest or '-'}, last id {newest or '-'}")
+        for checkpoint in db.query(OutboxCheckpoint).order_by(OutboxCheckpoint.consumer):
+            behind = db.query(func.count(OutboxEvent.id)).filter(
+                (OutboxEvent.txid > checkpoint.txid)
+                | ((OutboxEvent.txid == checkpoint.txid) & (OutboxEvent.id > checkpoint.event_id))
+            ).scalar()
+            print(f"  {checkpoint.consumer}: at event {checkpoint.event_id}, {behind} behind, updated {checkpoint.updated_at}")
+    finally:
+        db.close()
+    return 0
+
+
+def tail(args) -> int:
+    consumer = PrintingConsumer(args.consumer, args.batch_size)
+    runner = OutboxRunner(SessionLocal, poll_interval=args.interval)
+    runner.register(consumer)
+    try:
+        while True:
+            runner.run_once()
+            if not args.follow:
+                return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+def prune(args) -> int:
+    db = SessionLocal()
+    try:
+        removed = prune_events(db, timedelta(hours=args.hours))
+    finally:
+        db.close()
+    print(f"Removed {removed} events older than {args.hours:g}h")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    tail_parser = commands.add_parser("tail")
+    tail_parser.add_argument("--consumer", required=True, help="checkpoint name")
+    tail_parser.add_argument("--batch-size", type=int, default=500)
+    tail_parser.add_argument("--follow", action="store_true", help="keep polling for new events")
+    tail_parser.add_argument("--interval", type=float, default=settings.outbox_poll_interval_seconds)
+    prune_parser = commands.add_parser("prune")
+    prune_parser.add_argument("--hours", type=float, default=settings.outbox_retention_hours)
+    args = parser.parse_args()
+
+    if args.command == "status":
+        return status()
+    if args.command == "tail":
+        return tail(args)
+    return prune(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
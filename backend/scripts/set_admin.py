@@ -0,0 +1,41 @@
+"""
+Grant or revoke admin access (request profiling and other /admin endpoints).
+
+Run from the backend directory:
+
+    python scripts/set_admin.py alice@example.com
+    python scripts/set_admin.py alice@example.com --revoke
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.database import SessionLocal  # noqa: E402
+from app import models  # noqa: E402,F401
+from app.models.user import User  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("email")
+    parser.add_argument("--revoke", action="store_true", help="remove admin access instead")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == args.email).first()
+        if user is None:
+            print(f"No user with email {args.email}")
+            return 1
+        user.is_admin = 0 if args.revoke else 1
+        db.commit()
+    finally:
+        db.close()
+    print(f"{args.email} is {'no longer' if args.revoke else 'now'} an admin")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())